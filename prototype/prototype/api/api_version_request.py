@@ -14,6 +14,11 @@
 
 import re
 
+import six
+
+from prototype.common import exception
+from prototype.common.i18n import _
+
 
 # Define the minimum and maximum version of the API across all of the
 # REST API. The format of the version is:
@@ -49,36 +54,70 @@ _MAX_API_VERSION = "2.0"
 DEFAULT_API_VERSION = _MIN_API_VERSION
 
 
-# NOTE(cyeoh): min and max versions declared as functions so we can
-# mock them for unittests. Do not use the constants directly anywhere
-# else.
-def min_api_version():
-    return APIVersionRequest(_MIN_API_VERSION)
-
+# Version strings seen by the API are drawn from a very small set (the
+# handful of microversions clients are coded against), so parsed objects
+# are interned and reused. The cache is bounded so that arbitrary header
+# values sent by a misbehaving client can't grow it without limit.
+_VERSION_REGEX = re.compile(r"^([1-9]\d*)\.([1-9]\d*|0)$")
+_VERSION_CACHE_SIZE = 128
+_VERSION_CACHE = {}
 
-def max_api_version():
-    return APIVersionRequest(_MAX_API_VERSION)
+# Maps a raw version header value to the negotiated, range checked
+# APIVersionRequest so that negotiation is a single dictionary lookup.
+_NEGOTIATED_CACHE = {}
 
 
 class APIVersionRequest(object):
     """This class represents an API Version Request with convenience
     methods for manipulation and comparison of version
     numbers that we need to do to implement microversions.
+
+    Instances are immutable and interned: constructing an object for a
+    version string that has already been seen returns the same object.
     """
 
-    def __init__(self, version_string=None):
-        """Create an API version request object."""
-        self.ver_major = None
-        self.ver_minor = None
+    __slots__ = ('ver_major', 'ver_minor', '_key')
+
+    def __new__(cls, version_string=None):
+        """Create, or look up, an API version request object."""
+        if cls is APIVersionRequest:
+            try:
+                return _VERSION_CACHE[version_string]
+            except (KeyError, TypeError):
+                pass
 
+        ver_major = None
+        ver_minor = None
         if version_string is not None:
-            match = re.match(r"^([1-9]\d*)\.([1-9]\d*|0)$",
-                             version_string)
-            if match:
-                self.ver_major = int(match.group(1))
-                self.ver_minor = int(match.group(2))
-            else:
-                raise
+            match = None
+            if isinstance(version_string, six.string_types):
+                match = _VERSION_REGEX.match(version_string)
+            if not match:
+                raise exception.InvalidAPIVersionString(
+                    version=version_string)
+            ver_major = int(match.group(1))
+            ver_minor = int(match.group(2))
+
+        self = super(APIVersionRequest, cls).__new__(cls)
+        object.__setattr__(self, 'ver_major', ver_major)
+        object.__setattr__(self, 'ver_minor', ver_minor)
+        object.__setattr__(self, '_key', (ver_major, ver_minor))
+
+        if (cls is APIVersionRequest and
+                len(_VERSION_CACHE) < _VERSION_CACHE_SIZE):
+            _VERSION_CACHE[version_string] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError(_("APIVersionRequest objects are immutable"))
+
+    def __delattr__(self, name):
+        raise AttributeError(_("APIVersionRequest objects are immutable"))
+
+    def __reduce__(self):
+        if self.is_null():
+            return (self.__class__, ())
+        return (self.__class__, (self.get_string(),))
 
     def __str__(self):
         """Debug/Logging representation of object."""
@@ -88,11 +127,31 @@ class APIVersionRequest(object):
     def is_null(self):
         return self.ver_major is None and self.ver_minor is None
 
-    def __cmp__(self, other):
+    def _other_key(self, other):
         if not isinstance(other, APIVersionRequest):
             raise TypeError
-        return cmp((self.ver_major, self.ver_minor),
-                   (other.ver_major, other.ver_minor))
+        return other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        return self._key == self._other_key(other)
+
+    def __ne__(self, other):
+        return self._key != self._other_key(other)
+
+    def __lt__(self, other):
+        return self._key < self._other_key(other)
+
+    def __le__(self, other):
+        return self._key <= self._other_key(other)
+
+    def __gt__(self, other):
+        return self._key > self._other_key(other)
+
+    def __ge__(self, other):
+        return self._key >= self._other_key(other)
 
     def matches(self, min_version, max_version):
         """Returns whether the version object represents a version
@@ -126,3 +185,63 @@ class APIVersionRequest(object):
         if self.is_null():
             raise ValueError
         return "%s.%s" % (self.ver_major, self.ver_minor)
+
+
+_NULL_VERSION = APIVersionRequest()
+_MIN_VERSION = APIVersionRequest(_MIN_API_VERSION)
+_MAX_VERSION = APIVersionRequest(_MAX_API_VERSION)
+_DEFAULT_VERSION = APIVersionRequest(DEFAULT_API_VERSION)
+
+
+# NOTE(cyeoh): min and max versions declared as functions so we can
+# mock them for unittests. Do not use the constants directly anywhere
+# else.
+def min_api_version():
+    return _MIN_VERSION
+
+
+def max_api_version():
+    return _MAX_VERSION
+
+
+def default_api_version():
+    return _DEFAULT_VERSION
+
+
+def null_api_version():
+    return _NULL_VERSION
+
+
+def negotiate_api_version(version_string):
+    """Return the APIVersionRequest to use for a version header value.
+
+    'latest' is a special keyword which is equivalent to requesting the
+    maximum version of the API supported.  Values that were already
+    negotiated successfully are served from a bounded cache.
+
+    :raises: InvalidAPIVersionString if the value can't be parsed
+    :raises: InvalidGlobalAPIVersion if the version is out of range
+    """
+    try:
+        return _NEGOTIATED_CACHE[version_string]
+    except KeyError:
+        pass
+
+    min_version = min_api_version()
+    max_version = max_api_version()
+    if version_string == 'latest':
+        version = max_version
+    else:
+        version = APIVersionRequest(version_string)
+
+        # Check that the version requested is within the global
+        # minimum/maximum of supported API versions
+        if not version.matches(min_version, max_version):
+            raise exception.InvalidGlobalAPIVersion(
+                req_ver=version.get_string(),
+                min_ver=min_version.get_string(),
+                max_ver=max_version.get_string())
+
+    if len(_NEGOTIATED_CACHE) < _VERSION_CACHE_SIZE:
+        _NEGOTIATED_CACHE[version_string] = version
+    return version
@@ -29,6 +29,7 @@ from oslo_log import log as logging
 
 osapi_opts = [
     cfg.IntOpt('osapi_max_limit', default=1000, help='The maximum number of items returned in a single response from a collection resource'),
+    cfg.StrOpt('osapi_compute_link_prefix', help='Base URL that will be presented to users in links to the API'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(osapi_opts)
@@ -230,61 +231,76 @@ class ViewBuilder(object):
             return project_id
         return ''
 
+    def _get_link_base(self, request, collection_name, bookmark=False):
+        """Return the URL of a collection, ending with a slash.
+
+        The URL is worked out once per request and cached in its
+        environment, links to single items only append the item id.
+
+        :param bookmark: whether to drop the API version from the URL.
+        """
+        bases = request.environ.setdefault('prototype.link_bases', {})
+        key = (self.__class__, collection_name, bookmark)
+        base = bases.get(key)
+        if base is None:
+            base_url = request.application_url
+            if bookmark:
+                base_url = remove_version_from_href(base_url)
+            base = os.path.join(self._update_compute_link_prefix(base_url),
+                                self._get_project_id(request),
+                                collection_name)
+            base = bases[key] = base.rstrip('/') + '/'
+        return base
+
     def _get_links(self, request, identifier, collection_name):
+        identifier = str(identifier)
         return [{
             "rel": "self",
-            "href": self._get_href_link(request, identifier, collection_name),
+            "href": self._get_link_base(request,
+                                        collection_name) + identifier,
         },
         {
             "rel": "bookmark",
-            "href": self._get_bookmark_link(request,
-                                            identifier,
-                                            collection_name),
+            "href": self._get_link_base(request, collection_name,
+                                        bookmark=True) + identifier,
         }]
 
     def _get_next_link(self, request, identifier, collection_name):
         """Return href string with proper limit and marker params."""
         params = request.params.copy()
         params["marker"] = identifier
-        prefix = self._update_compute_link_prefix(request.application_url)
-        url = os.path.join(prefix,
-                           self._get_project_id(request),
-                           collection_name)
+        url = self._get_link_base(request, collection_name).rstrip('/')
         return "%s?%s" % (url, dict_to_query_str(params))
 
     def _get_href_link(self, request, identifier, collection_name):
         """Return an href string pointing to this object."""
-        prefix = self._update_compute_link_prefix(request.application_url)
-        return os.path.join(prefix,
-                            self._get_project_id(request),
-                            collection_name,
-                            str(identifier))
+        return self._get_link_base(request, collection_name) + str(identifier)
 
     def _get_bookmark_link(self, request, identifier, collection_name):
         """Create a URL that refers to a specific resource."""
-        base_url = remove_version_from_href(request.application_url)
-        base_url = self._update_compute_link_prefix(base_url)
-        return os.path.join(base_url,
-                            self._get_project_id(request),
-                            collection_name,
-                            str(identifier))
+        return (self._get_link_base(request, collection_name, bookmark=True) +
+                str(identifier))
 
     def _get_collection_links(self,
                               request,
                               items,
                               collection_name,
-                              id_key="uuid"):
+                              id_key="uuid",
+                              limit=None):
         """Retrieve 'next' link, if applicable. This is included if:
         1) 'limit' param is specified and equals the number of items.
         2) 'limit' param is specified but it exceeds CONF.osapi_max_limit,
         in this case the number of items is CONF.osapi_max_limit.
         3) 'limit' param is NOT specified but the number of items is
         CONF.osapi_max_limit.
+
+        A controller that changed the limit of the request passes the
+        ``limit`` it paged with instead.
         """
         links = []
-        max_items = min(
-            int(request.params.get("limit", CONF.osapi_max_limit)),
-            CONF.osapi_max_limit)
+        if limit is None:
+            limit = int(request.params.get("limit", CONF.osapi_max_limit))
+        max_items = min(limit, CONF.osapi_max_limit)
         if max_items and max_items == len(items):
             last_item = items[-1]
             if id_key in last_item:
@@ -0,0 +1,53 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The runtime metrics of an API worker, as Prometheus text.
+
+The metrics are not authenticated and tell about the traffic of every
+route, so /metrics answers 404 unless api_metrics is set.  Set it only
+where the API is not public, or where the proxy in front of it keeps
+/metrics to the scrapers.
+"""
+
+from oslo_config import cfg
+
+from prototype.common import metrics
+from prototype.common import wsgi
+
+
+metrics_opts = [
+    cfg.BoolOpt('api_metrics',
+                default=False,
+                help='Serve the runtime metrics of the API workers at '
+                     '/metrics. They are not authenticated, only enable '
+                     'them where /metrics is not reachable by API users.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(metrics_opts)
+
+
+class Metrics(wsgi.Application):
+    """Answers any GET with the metrics of the process."""
+
+    def __call__(self, environ, start_response):
+        if not CONF.api_metrics:
+            start_response('404 Not Found', [('Content-Length', '0')])
+            return []
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed',
+                           [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            return []
+        return metrics.app(environ, start_response)
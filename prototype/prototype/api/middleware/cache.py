@@ -0,0 +1,238 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Response cache middleware for idempotent GET requests.
+
+Only routes listed in api_response_cache_routes are cached.  Entries are
+keyed by host URL, path, query string, Accept, the API version header
+and tenant, and live in the cache returned by prototype.common.memorycache, so they
+are shared between API workers when memcached_servers is set.
+
+Purging bumps a per-route generation number that is part of every key;
+old entries are never read again and simply age out of the cache.
+"""
+
+import fnmatch
+import hashlib
+import threading
+
+from oslo_config import cfg
+import webob
+
+from prototype.api import wsgi as api_wsgi
+from prototype.common import memorycache
+from prototype.common import metrics
+from prototype.common import utils
+from oslo_log import log as logging
+from prototype.common import wsgi
+
+
+cache_opts = [
+    cfg.BoolOpt('api_response_cache',
+                default=True,
+                help='Cache responses of the routes listed in '
+                     'api_response_cache_routes.'),
+    cfg.DictOpt('api_response_cache_routes',
+                default={'/': '300'},
+                help='Request paths whose GET responses may be cached, '
+                     'mapped to a TTL in seconds. A trailing * matches any '
+                     'path with that prefix; the longest match wins and a '
+                     'TTL of 0 disables caching for that path.'),
+    cfg.IntOpt('api_response_cache_max_size',
+               default=65536,
+               help='Responses larger than this many bytes are not cached.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'prototype-api-response:'
+_GENERATION_PREFIX = 'prototype-api-generation:'
+
+# Requests carrying these depend on more than the cache key
+_UNCACHEABLE_HEADERS = ('Authorization', 'Cookie', 'Range')
+
+_CACHE_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client():
+    global _CACHE_CLIENT
+    if _CACHE_CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CACHE_CLIENT is None:
+                _CACHE_CLIENT = memorycache.get_client()
+    return _CACHE_CLIENT
+
+
+def _parse_routes(routes):
+    parsed = []
+    for pattern, ttl in (routes or {}).items():
+        parsed.append((pattern, int(ttl)))
+    # Most specific patterns first
+    parsed.sort(key=lambda route: len(route[0].rstrip('*')), reverse=True)
+    return parsed
+
+
+def _match_route(routes, path):
+    for pattern, ttl in routes:
+        if pattern.endswith('*'):
+            if path.startswith(pattern[:-1]):
+                return pattern, ttl
+        elif path == pattern:
+            return pattern, ttl
+    return None, 0
+
+
+_EVENTS = metrics.REGISTRY.register(metrics.Counter(
+    'prototype_api_response_cache_total',
+    'Response cache lookups (hit, miss), stores and route purges.',
+    ('event',)))
+
+_SAVED_BYTES = metrics.REGISTRY.register(metrics.Counter(
+    'prototype_api_response_cache_saved_bytes_total',
+    'Bytes of response bodies served from the response cache.'))
+
+
+def _generation_key(pattern):
+    return _GENERATION_PREFIX + hashlib.md5(utils.utf8(pattern)).hexdigest()
+
+
+def _get_generation(client, pattern):
+    key = _generation_key(pattern)
+    generation = client.get(key)
+    if generation is None:
+        client.add(key, '1')
+        generation = client.get(key) or '1'
+    return generation
+
+
+def purge(path=None):
+    """Invalidate cached responses.
+
+    :param path: request path whose route should be purged, or a route
+                 pattern from api_response_cache_routes. Purges every
+                 route when omitted.
+    """
+    routes = _parse_routes(CONF.api_response_cache_routes)
+    if path is None:
+        patterns = [pattern for pattern, _ttl in routes]
+    elif any(path == pattern for pattern, _ttl in routes):
+        patterns = [path]
+    else:
+        patterns = [pattern for pattern, _ttl in routes
+                    if fnmatch.fnmatchcase(path, pattern)]
+
+    client = _get_client()
+    for pattern in patterns:
+        key = _generation_key(pattern)
+        if client.incr(key) is None:
+            client.set(key, '2')
+        _EVENTS.inc(('purge',))
+        LOG.debug("Purged response cache for route %s", pattern)
+
+
+class ResponseCache(wsgi.Middleware):
+    """Serve repeated GET requests from a shared response cache.
+
+    Place it after the auth middleware so the tenant is known.  Non GET
+    requests that succeed on a cached route purge it.
+    """
+
+    def __init__(self, application):
+        super(ResponseCache, self).__init__(application)
+        self.routes = _parse_routes(CONF.api_response_cache_routes)
+
+    @staticmethod
+    def _cache_key(req, generation):
+        ctx = req.environ.get('prototype.context')
+        tenant = getattr(ctx, 'tenant', None) or ''
+        # Documents link to the URL they were requested on, so entries
+        # can't be shared between endpoints or schemes
+        parts = (generation,
+                 req.host_url,
+                 req.script_name + req.path_info,
+                 req.query_string,
+                 req.headers.get('Accept', ''),
+                 req.headers.get(api_wsgi.API_VERSION_REQUEST_HEADER, ''),
+                 tenant)
+        digest = hashlib.sha1(b'\0'.join(utils.utf8(part) for part in parts))
+        return _KEY_PREFIX + digest.hexdigest()
+
+    @staticmethod
+    def _cacheable_request(req):
+        for header in _UNCACHEABLE_HEADERS:
+            if header in req.headers:
+                return False
+        return True
+
+    @staticmethod
+    def _cacheable_response(response):
+        if response.status_int != 200 or 'Set-Cookie' in response.headers:
+            return False
+        length = response.content_length
+        return (length is not None and
+                length <= CONF.api_response_cache_max_size)
+
+    @staticmethod
+    def _build_response(req, entry):
+        status, headerlist, body = entry
+        etag = dict(headerlist).get('ETag')
+        if etag and etag.strip('"') in req.if_none_match:
+            response = webob.Response(status=304)
+            response.headers['ETag'] = etag
+        else:
+            response = webob.Response(status=status, headerlist=headerlist,
+                                      body=body)
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    @wsgi.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        if not CONF.api_response_cache:
+            return self.application
+
+        pattern, ttl = _match_route(self.routes,
+                                    req.script_name + req.path_info)
+        if not ttl:
+            return self.application
+
+        if req.method != 'GET':
+            response = req.get_response(self.application)
+            if 200 <= response.status_int < 300 and req.method != 'HEAD':
+                purge(pattern)
+            return response
+
+        if not self._cacheable_request(req):
+            return self.application
+
+        client = _get_client()
+        key = self._cache_key(req, _get_generation(client, pattern))
+        entry = client.get(key)
+        if entry is not None:
+            _EVENTS.inc(('hit',))
+            _SAVED_BYTES.inc(amount=len(entry[2]))
+            return self._build_response(req, entry)
+
+        _EVENTS.inc(('miss',))
+        response = req.get_response(self.application)
+        if self._cacheable_response(response):
+            entry = (response.status, response.headerlist, response.body)
+            client.set(key, entry, time=ttl)
+            _EVENTS.inc(('store',))
+        response.headers['X-Cache'] = 'MISS'
+        return response
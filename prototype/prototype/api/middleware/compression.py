@@ -0,0 +1,232 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Response compression and request decompression middleware.
+
+"""
+
+import zlib
+
+from oslo_config import cfg
+import webob.exc
+
+from prototype.api import wsgi as api_wsgi
+from prototype.common.i18n import _
+from oslo_log import log as logging
+from prototype.common import wsgi
+
+
+compression_opts = [
+    cfg.BoolOpt('api_compression',
+                default=True,
+                help='Gzip API responses for clients that accept it.'),
+    cfg.IntOpt('api_compression_level',
+               default=6,
+               help='zlib compression level (1-9) for API responses.'),
+    cfg.IntOpt('api_compression_min_size',
+               default=1024,
+               help='Responses smaller than this many bytes are sent '
+                    'uncompressed. Streamed responses of unknown length '
+                    'are always compressed.'),
+    cfg.ListOpt('api_compression_types',
+                default=['application/json',
+                         'application/vnd.openstack.compute+json',
+                         'application/x-ndjson',
+                         'text/plain'],
+                help='Content types of API responses that may be '
+                     'compressed.'),
+    cfg.IntOpt('api_max_decompressed_body_size',
+               default=114688,
+               help='Maximum size in bytes of a gzip encoded request body '
+                    'once decompressed. Should not be lower than the '
+                    'sizelimit max_request_body_size.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(compression_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Bodies up to this size are compressed in one go, larger ones and
+# streamed ones are compressed chunk by chunk as they are sent.
+_ONE_SHOT_SIZE = 65536
+_READ_CHUNK_SIZE = 65536
+
+# wbits selecting the gzip container rather than raw zlib
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_GZIP_ENCODINGS = ('gzip', 'x-gzip')
+
+# Bytes a gzip body may exceed what it inflates to by, zlib's deflateBound
+# rounded up to leave room for optional gzip header fields
+_GZIP_HEADROOM = 1024
+
+# Responses that have no body to compress
+_NO_BODY_STATUS = (204, 304)
+
+# Appended to the ETag of compressed responses, the gzip representation
+# is a different entity and must not share a strong validator with the
+# identity one.
+_ETAG_SUFFIX = '-gzip'
+
+
+class CompressionMiddleware(wsgi.Middleware):
+    """Gzip responses and decode gzip request bodies.
+
+    Must be placed before sizelimit in the pipeline so the size limit is
+    applied to the decompressed request body.
+    """
+
+    def __init__(self, application):
+        super(CompressionMiddleware, self).__init__(application)
+        self.compressible_types = frozenset(CONF.api_compression_types)
+
+    def _decompress_request(self, req):
+        limit = CONF.api_max_decompressed_body_size
+        # This runs before sizelimit, so cap the compressed bytes too
+        compressed_limit = (limit + (limit >> 12) + (limit >> 14) +
+                            _GZIP_HEADROOM)
+        decompressor = zlib.decompressobj(_GZIP_WBITS)
+        body_file = req.body_file
+        parts = []
+        size = 0
+        read = 0
+        try:
+            while True:
+                data = body_file.read(
+                    min(_READ_CHUNK_SIZE, compressed_limit + 1 - read))
+                if not data:
+                    break
+                read += len(data)
+                if read > compressed_limit:
+                    msg = _("Compressed request is too large. "
+                            "Larger than %s.") % compressed_limit
+                    raise webob.exc.HTTPRequestEntityTooLarge(
+                        explanation=msg)
+                # Never inflate more than the limit, so a small request
+                # can't expand into something huge in memory.
+                while data:
+                    part = decompressor.decompress(data, limit + 1 - size)
+                    size += len(part)
+                    if size > limit:
+                        msg = _("Request is too large once decompressed. "
+                                "Larger than %s.") % limit
+                        raise webob.exc.HTTPRequestEntityTooLarge(
+                            explanation=msg)
+                    parts.append(part)
+                    data = decompressor.unconsumed_tail
+                if decompressor.unused_data:
+                    msg = _("Request body has data after the gzip stream")
+                    raise webob.exc.HTTPBadRequest(explanation=msg)
+            parts.append(decompressor.flush())
+        except zlib.error:
+            msg = _("Request body is not valid gzip data")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        del req.headers['Content-Encoding']
+        req.body = ''.join(parts)
+
+    def _accepts_gzip(self, req):
+        accept_encoding = req.headers.get('Accept-Encoding')
+        if not accept_encoding:
+            return False
+        return 'gzip' in req.accept_encoding
+
+    def _should_compress(self, req, response):
+        if req.method == 'HEAD' or response.status_int in _NO_BODY_STATUS:
+            return False
+        if response.headers.get('Content-Encoding'):
+            return False
+        length = response.content_length
+        if length is not None and length < CONF.api_compression_min_size:
+            return False
+        return True
+
+    @staticmethod
+    def _compress_iter(app_iter, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+        try:
+            for chunk in app_iter:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    @staticmethod
+    def _strip_etag_suffix(req):
+        """Map gzip ETags in If-None-Match back to the identity ones.
+
+        Returns True if any tag was rewritten.
+        """
+        if_none_match = req.headers.get('If-None-Match')
+        if not if_none_match or _ETAG_SUFFIX not in if_none_match:
+            return False
+        req.headers['If-None-Match'] = if_none_match.replace(
+            _ETAG_SUFFIX + '"', '"')
+        return True
+
+    def _compress_response(self, response):
+        level = CONF.api_compression_level
+        length = response.content_length
+        if length is not None and length <= _ONE_SHOT_SIZE:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+            response.body = (compressor.compress(response.body) +
+                             compressor.flush())
+        else:
+            # Keep large and streamed bodies streaming, the server sends
+            # the compressed chunks with chunked transfer encoding.
+            app_iter = response.app_iter
+            response.app_iter = self._compress_iter(app_iter, level)
+            response.content_length = None
+        response.headers['Content-Encoding'] = 'gzip'
+        if response.etag:
+            response.etag = response.etag + _ETAG_SUFFIX
+
+    @wsgi.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        encoding = req.headers.get('Content-Encoding', '').lower()
+        if encoding in _GZIP_ENCODINGS:
+            try:
+                self._decompress_request(req)
+            except webob.exc.HTTPException as ex:
+                return api_wsgi.Fault(ex)
+
+        gzip_etag = CONF.api_compression and self._strip_etag_suffix(req)
+
+        response = req.get_response(self.application)
+
+        if response.status_int == 304:
+            # Hand back the validator the client asked with
+            if gzip_etag and response.etag and self._accepts_gzip(req):
+                response.etag = response.etag + _ETAG_SUFFIX
+            return response
+
+        if (not CONF.api_compression or
+                response.content_type not in self.compressible_types):
+            return response
+
+        # The representation depends on Accept-Encoding for these types
+        # whether or not this particular response ends up compressed.
+        vary = list(response.vary or ())
+        if 'Accept-Encoding' not in vary:
+            vary.append('Accept-Encoding')
+            response.vary = vary
+
+        if self._accepts_gzip(req) and self._should_compress(req, response):
+            self._compress_response(response)
+        return response
@@ -19,7 +19,6 @@ Common Auth Middleware.
 from oslo_config import cfg
 from oslo_middleware import request_id
 from oslo_serialization import jsonutils
-import webob.dec
 import webob.exc
 
 from oslo_context import context
@@ -35,7 +34,7 @@ LOG = logging.getLogger(__name__)
 class PrototypeKeystoneContext(wsgi.Middleware):
     """Make a request context from keystone headers."""
 
-    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    @wsgi.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         # X_USER_ID
         user_id = req.headers.get('X_USER')
@@ -64,7 +63,7 @@ class PrototypeKeystoneContext(wsgi.Middleware):
 
 class NoAuthMiddleware(wsgi.Middleware):
     """Return a fake token if one isn't specified."""
-    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    @wsgi.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         ctx = context.RequestContext(is_admin=True)
         req.environ['prototype.context'] = ctx
@@ -1,19 +1,27 @@
 from oslo_config import cfg
 import routes
 import stevedore
-import webob.dec
 import webob.exc
 
 from prototype.common.i18n import _,_LC,_LE,_LI,_LW,translate
 from oslo_log import log as logging
+from prototype.common import metrics
+from prototype.common import timing
+from prototype.common import tracing
 from prototype.common import utils
 from prototype.common import wsgi as base_wsgi
 from prototype.api import wsgi
 
 
+CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
 
+_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    'prototype_api_requests_total', 'API requests answered.',
+    ('route', 'status')))
+
+
 class FaultWrapper(base_wsgi.Middleware):
     """Calls down the middleware stack, making exceptions into faults."""
 
@@ -56,9 +64,69 @@ class FaultWrapper(base_wsgi.Middleware):
 
         return wsgi.Fault(outer)
 
-    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    @base_wsgi.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
+        timer = timing.start(req.environ)
+        span = None
         try:
-            return req.get_response(self.application)
+            span = tracing.start_span(
+                'api', tracing.trace_id_from_header(
+                    req.headers.get(tracing.TRACE_HEADER)),
+                root=True, method=req.method, path=req.path)
+            try:
+                response = req.get_response(self.application)
+            except Exception as ex:
+                response = req.get_response(self._error(ex, req))
+            total = timer.elapsed()
+            route = req.environ.get(timing.ROUTE_ENV, 'unmatched')
+            timing.HISTOGRAMS.observe(route, timer, total)
+            _REQUESTS.inc((route, response.status_int))
+            if CONF.api_server_timing:
+                response.headers['Server-Timing'] = ', '.join(
+                    filter(None, [timer.server_timing(),
+                                  'total;dur=%.2f' % (total * 1000)]))
+            if span is not None:
+                span.name = 'api %s' % route
+                span.tags['status'] = response.status_int
+                response.headers[tracing.TRACE_HEADER] = span.trace_id
+                if not isinstance(response.app_iter, (list, tuple)):
+                    # A streamed body is serialized while it is sent,
+                    # the span ends once the server closes it
+                    tracing.detach_span(span)
+                    length = response.content_length
+                    response.app_iter = _FinishSpan(response.app_iter,
+                                                    span)
+                    response.content_length = length
+                    span = None
+            return response
         except Exception as ex:
-            return self._error(ex, req)
\ No newline at end of file
+            if span is not None:
+                tracing.finish_span(span, error=ex.__class__.__name__)
+                span = None
+            raise
+        finally:
+            if span is not None:
+                tracing.finish_span(span)
+            timing.finish()
+
+
+class _FinishSpan(object):
+    """A response body finishing the request span when it is closed.
+
+    The stage timings and the Server-Timing header are sent before the
+    body, so only the span covers the serialization of a streamed body.
+    """
+
+    def __init__(self, app_iter, span):
+        self.app_iter = app_iter
+        self.span = span
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            tracing.finish_span(self.span)
@@ -0,0 +1,335 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Token bucket rate limiting middleware.
+
+Every request takes a token from the bucket of its tenant, of its user and,
+for the routes listed in api_rate_limit_routes, from the bucket of that
+tenant on that route.  A request finding any bucket empty is answered with
+a RateLimitFault (HTTP 429 with Retry-After).
+
+Buckets live in process memory, so a decision is a few dict lookups.  With
+api_rate_limit_shared and memcached_servers set, workers additionally lease
+tokens in blocks from per-window counters in memcached, which keeps the
+limits holding across api_workers processes while only going to memcached
+once per lease.
+"""
+
+import collections
+import threading
+import time
+
+from oslo_config import cfg
+
+from prototype.api import wsgi as api_wsgi
+from prototype.common import exception
+from prototype.common.i18n import _, _LI, _LW
+from prototype.common import memorycache
+from oslo_log import log as logging
+from prototype.common import wsgi
+
+
+ratelimit_opts = [
+    cfg.BoolOpt('api_rate_limit',
+                default=False,
+                help='Apply the API rate limits.'),
+    cfg.StrOpt('api_rate_limit_tenant',
+               default='1200/minute',
+               help='Requests allowed per tenant, as COUNT/UNIT where UNIT '
+                    'is second, minute, hour or day. Empty disables it.'),
+    cfg.StrOpt('api_rate_limit_user',
+               default='600/minute',
+               help='Requests allowed per user, as COUNT/UNIT. Empty '
+                    'disables it.'),
+    cfg.DictOpt('api_rate_limit_routes',
+                default={},
+                help='Requests allowed per tenant on a route, mapping a '
+                     'request path to COUNT/UNIT. A trailing * in the path '
+                     'matches any path with that prefix; the longest match '
+                     'wins.'),
+    cfg.BoolOpt('api_rate_limit_shared',
+                default=False,
+                help='Share the limits between API processes through the '
+                     'memcached_servers.'),
+    cfg.IntOpt('api_rate_limit_lease_size',
+               default=10,
+               help='Tokens a process takes from the shared store at once. '
+                    'Larger leases mean fewer memcached round trips but '
+                    'let workers overshoot a limit by up to this many '
+                    'requests each.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(ratelimit_opts)
+
+LOG = logging.getLogger(__name__)
+
+_UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 60 * 60,
+    'day': 60 * 60 * 24,
+}
+
+_KEY_PREFIX = 'prototype-api-ratelimit:'
+
+
+class Limit(object):
+    """A request rate, COUNT requests per UNIT."""
+
+    def __init__(self, value):
+        try:
+            count, unit = value.split('/')
+            self.count = int(count)
+            self.unit = unit.strip().lower()
+            self.period = _UNITS[self.unit]
+        except (ValueError, KeyError):
+            raise exception.InvalidInput(
+                reason=_('Invalid rate limit %s, must be COUNT/UNIT') % value)
+        if self.count <= 0:
+            raise exception.InvalidInput(
+                reason=_('Invalid rate limit %s, COUNT must be positive')
+                % value)
+        self.value = '%d/%s' % (self.count, self.unit)
+        self.rate = float(self.count) / self.period
+
+    @classmethod
+    def parse(cls, value):
+        if not value:
+            return None
+        return cls(value)
+
+
+class TokenBucket(object):
+    """Bucket of ``limit.count`` tokens refilled at ``limit.rate``."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, limit, now):
+        self.tokens = float(limit.count)
+        self.updated = now
+
+    def consume(self, limit, now):
+        """Take a token.
+
+        Returns 0 on success, otherwise the seconds until one is available.
+        """
+        tokens = min(limit.count,
+                     self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return 0
+        self.tokens = tokens
+        return (1 - tokens) / limit.rate
+
+    def refund(self, limit):
+        """Give back a token taken by consume."""
+        self.tokens = min(limit.count, self.tokens + 1)
+
+
+class LocalStore(object):
+    """Token buckets held in this process, least recently used dropped.
+
+    A dropped bucket comes back full, the bound only needs to be larger
+    than the number of clients active within a refill period.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, limit, now):
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = TokenBucket(limit, now)
+                if len(self._buckets) >= self.max_entries:
+                    self._buckets.popitem(last=False)
+            self._buckets[key] = bucket
+            return bucket.consume(limit, now)
+
+    def refund(self, key, limit, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund(limit)
+
+
+class SharedStore(object):
+    """Per-window request counters shared through memcached.
+
+    Tokens are taken from the shared counter in leases of ``lease_size``
+    and handed out locally, so most decisions never leave the process.
+    While memcached can't be reached, requests are allowed.
+    """
+
+    # Seconds between sweeps of the leases of past windows
+    prune_interval = 60
+
+    def __init__(self, client, lease_size=10):
+        self.client = client
+        self.lease_size = max(1, lease_size)
+        # key -> (window, tokens left, end of the window)
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0
+        self._unavailable = False
+
+    def _lease(self, key, limit, window):
+        counter = '%s%s:%d' % (_KEY_PREFIX, key, window)
+        size = min(self.lease_size, limit.count)
+        used = self.client.incr(counter, size)
+        if used is None:
+            # First lease of this window anywhere
+            self.client.add(counter, '0', time=limit.period * 2)
+            used = self.client.incr(counter, size)
+            if used is None:
+                if not self._unavailable:
+                    self._unavailable = True
+                    LOG.warning(_LW("Shared rate limit store unavailable, "
+                                    "requests are not limited until it is "
+                                    "back"))
+                return size
+        if self._unavailable:
+            self._unavailable = False
+            LOG.info(_LI("Shared rate limit store available again"))
+        return max(0, min(size, limit.count - (used - size)))
+
+    def _prune(self, now):
+        for key, (_window, _tokens, end) in list(self._leases.items()):
+            if end <= now:
+                del self._leases[key]
+        self._next_prune = now + self.prune_interval
+
+    def _take(self, key, window):
+        """Take a leased token, returning whether there was one."""
+        lease = self._leases.get(key)
+        if lease is not None and lease[0] == window and lease[1]:
+            self._leases[key] = (window, lease[1] - 1, lease[2])
+            return True
+        return False
+
+    def consume(self, key, limit, now):
+        window = int(now // limit.period)
+        end = (window + 1) * limit.period
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            if self._take(key, window):
+                return 0
+
+        # The round trips to memcached are made without the lock, so they
+        # only hold up the requests that need a lease themselves
+        tokens = self._lease(key, limit, window)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == window:
+                # Another request leased meanwhile, keep both
+                tokens += lease[1]
+            self._leases[key] = (window, tokens, end)
+            if self._take(key, window):
+                return 0
+        return end - now
+
+    def refund(self, key, limit, now):
+        """Give back a token, to the lease it was taken from."""
+        window = int(now // limit.period)
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == window:
+                self._leases[key] = (window, lease[1] + 1, lease[2])
+
+
+def _parse_routes(routes):
+    parsed = [(path, Limit(value)) for path, value in (routes or {}).items()]
+    parsed.sort(key=lambda route: len(route[0].rstrip('*')), reverse=True)
+    return parsed
+
+
+def _match_route(routes, path):
+    for pattern, limit in routes:
+        if pattern.endswith('*'):
+            if path.startswith(pattern[:-1]):
+                return pattern, limit
+        elif path == pattern:
+            return pattern, limit
+    return None, None
+
+
+class RateLimitingMiddleware(wsgi.Middleware):
+    """Apply per-tenant, per-user and per-route request limits.
+
+    Must be placed after the auth middleware, requests without a request
+    context are not limited.
+    """
+
+    def __init__(self, application):
+        super(RateLimitingMiddleware, self).__init__(application)
+        self.tenant_limit = Limit.parse(CONF.api_rate_limit_tenant)
+        self.user_limit = Limit.parse(CONF.api_rate_limit_user)
+        self.routes = _parse_routes(CONF.api_rate_limit_routes)
+        if CONF.api_rate_limit_shared and CONF.memcached_servers:
+            self.store = SharedStore(memorycache.get_client(),
+                                     CONF.api_rate_limit_lease_size)
+        else:
+            self.store = LocalStore(CONF.memory_cache_size)
+
+    def _check(self, req, ctx):
+        """Return the first exceeded limit and its delay, or None."""
+        now = time.time()
+        checks = []
+        if self.tenant_limit:
+            checks.append(('tenant:%s' % ctx.tenant, self.tenant_limit))
+        if self.user_limit:
+            checks.append(('user:%s' % ctx.user, self.user_limit))
+        if self.routes:
+            pattern, limit = _match_route(self.routes,
+                                          req.script_name + req.path_info)
+            if limit:
+                checks.append(('route:%s:%s' % (pattern, ctx.tenant),
+                               limit))
+
+        consumed = []
+        for key, limit in checks:
+            delay = self.store.consume(key, limit, now)
+            if delay:
+                # A rejected request doesn't count against the others
+                for taken_key, taken_limit in consumed:
+                    self.store.refund(taken_key, taken_limit, now)
+                return limit, now + delay
+            consumed.append((key, limit))
+        return None
+
+    @wsgi.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        ctx = req.environ.get('prototype.context')
+        if not CONF.api_rate_limit or ctx is None:
+            return self.application
+
+        exceeded = self._check(req, ctx)
+        if exceeded:
+            limit, retry_time = exceeded
+            msg = _("This request was rate-limited.")
+            details = _("Only %s requests are allowed.") % limit.value
+            LOG.debug("Rate limit %(limit)s exceeded by tenant %(tenant)s "
+                      "user %(user)s",
+                      {'limit': limit.value, 'tenant': ctx.tenant,
+                       'user': ctx.user})
+            return api_wsgi.RateLimitFault(msg, details, retry_time)
+
+        return self.application
@@ -0,0 +1,375 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Validated token cache in front of keystonemiddleware's auth_token.
+
+filter_factory builds the auth_token filter and wraps it.  The first
+request with a token goes through auth_token, and the identity headers it
+sets are cached under a hash of the token until token_cache_time passes or
+the token expires.  Later requests with the token get those headers back
+without auth_token being called.  Rejected tokens are cached for
+token_cache_negative_time, so they are answered the way auth_token
+answered them.
+
+Every token_cache_revocation_interval the keystone revocation events are
+fetched in the background, and cached tokens they revoke go back through
+auth_token.  While the events are stale, because keystone could not be
+reached for two intervals or they were never fetched yet, every request
+goes through auth_token: a revoked token is never served from the cache.
+
+With token_cache_shared and memcached_servers set, the validations are
+shared by the workers through memcached, each keeping a local copy of
+what it uses.
+"""
+
+import hashlib
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_utils import importutils
+from oslo_utils import timeutils
+import six
+import webob
+
+from prototype.common.i18n import _LI, _LW
+from prototype.common import memorycache
+from oslo_log import log as logging
+from prototype.common import wsgi
+
+ks_session = importutils.try_import('keystoneclient.session')
+ks_v2_auth = importutils.try_import('keystoneclient.auth.identity.v2')
+
+
+token_cache_opts = [
+    cfg.IntOpt('token_cache_time',
+               default=300,
+               help='Seconds a validated token is served from the cache, '
+                    'never past its expiry. 0 disables the cache.'),
+    cfg.IntOpt('token_cache_negative_time',
+               default=10,
+               help='Seconds a rejected token is answered from the cache.'),
+    cfg.IntOpt('token_cache_revocation_interval',
+               default=60,
+               help='Seconds between two fetches of the keystone revocation '
+                    'events. 0 disables the revocation checks. The fetch '
+                    'uses the keystone_authtoken admin_user, '
+                    'admin_password, admin_tenant_name and identity_uri '
+                    'or auth_host options; until it succeeds, and when it '
+                    'has failed for two intervals, the cache is bypassed.'),
+    cfg.BoolOpt('token_cache_shared',
+                default=False,
+                help='Share the validated tokens between processes through '
+                     'memcached_servers.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(token_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'tokencache:'
+
+# Set by the app below auth_token to what auth_token put in the environ
+_VALIDATED_ENV = 'prototype.token_cache.validated'
+
+# Environ keys auth_token sets, or removes when a client sends them
+_IDENTITY_PREFIXES = ('HTTP_X_IDENTITY_', 'HTTP_X_SERVICE_', 'HTTP_X_USER',
+                      'HTTP_X_PROJECT_', 'HTTP_X_TENANT', 'HTTP_X_DOMAIN_',
+                      'HTTP_X_ROLE', 'HTTP_X_IS_ADMIN_PROJECT')
+_TOKEN_HEADERS = ('HTTP_X_AUTH_TOKEN', 'HTTP_X_SERVICE_TOKEN',
+                  'HTTP_X_STORAGE_TOKEN')
+_TOKEN_INFO_ENV = 'keystone.token_info'
+
+# Revocation events older than this many intervals are stale
+_STALE_INTERVALS = 2
+
+
+def _identity_keys(environ):
+    return [key for key in environ
+            if key.startswith(_IDENTITY_PREFIXES) and
+            key not in _TOKEN_HEADERS]
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return timeutils.normalize_time(timeutils.parse_isotime(value))
+    except ValueError:
+        return None
+
+
+def _token_data(token_info):
+    """Return the fields of a v2 or v3 token revocation events look at."""
+    token_info = token_info or {}
+    if 'token' in token_info:
+        token = token_info['token']
+        return {'user_id': (token.get('user') or {}).get('id'),
+                'project_id': (token.get('project') or {}).get('id'),
+                'audit_ids': token.get('audit_ids') or [],
+                'issued_at': token.get('issued_at'),
+                'expires_at': token.get('expires_at')}
+    access = token_info.get('access') or {}
+    token = access.get('token') or {}
+    return {'user_id': (access.get('user') or {}).get('id'),
+            'project_id': (token.get('tenant') or {}).get('id'),
+            'audit_ids': token.get('audit_ids') or [],
+            'issued_at': token.get('issued_at'),
+            'expires_at': token.get('expires')}
+
+
+class TokenCache(object):
+    """Validated tokens in process memory, optionally behind memcached.
+
+    Entries are dicts carrying their absolute ``expires`` time, so a copy
+    taken from the shared cache expires locally at the same time.
+    """
+
+    def __init__(self, shared=None, max_entries=10000):
+        self.local = memorycache.LRUClient(max_entries)
+        self.shared = shared
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                ttl = int(entry['expires'] - time.time())
+                if ttl > 0:
+                    self.local.set(key, entry, time=ttl)
+        if entry is not None and entry['expires'] <= time.time():
+            return None
+        return entry
+
+    def set(self, key, entry, ttl):
+        entry['expires'] = time.time() + ttl
+        self.local.set(key, entry, time=ttl)
+        if self.shared is not None:
+            self.shared.set(key, entry, time=ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+
+class RevocationEvents(object):
+    """The keystone revocation events, fetched again every ``interval``.
+
+    An event revokes the tokens issued before its issued_before which
+    match all of its fields.  Fields not known here match any token, so
+    such events only send more tokens back through auth_token.
+    """
+
+    def __init__(self, interval, fetch=None):
+        self.interval = interval
+        self.fetch = fetch or self._fetch
+        self._events = []
+        self._fetched_at = None
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+        self._session = None
+        self._thread = None
+        self._stale_warned = False
+
+    def _fetch(self):
+        if ks_session is None or ks_v2_auth is None:
+            raise RuntimeError('python-keystoneclient is not installed')
+        conf = CONF.keystone_authtoken
+        identity_uri = (getattr(conf, 'identity_uri', None) or
+                        '%s://%s:%s' % (conf.auth_protocol, conf.auth_host,
+                                        conf.auth_port)).rstrip('/')
+        if self._session is None:
+            auth = ks_v2_auth.Password(auth_url=identity_uri + '/v2.0',
+                                       username=conf.admin_user,
+                                       password=conf.admin_password,
+                                       tenant_name=conf.admin_tenant_name)
+            self._session = ks_session.Session(auth=auth)
+        resp = self._session.get(identity_uri + '/v3/OS-REVOKE/events')
+        return resp.json().get('events') or []
+
+    def refresh(self):
+        """Start fetching the events in the background if due.
+
+        The fetch runs on its own thread, a greenthread once eventlet
+        has patched threading, so no request waits for keystone.
+        """
+        if not self.interval or time.time() < self._next_refresh:
+            return
+        if not self._lock.acquire(False):
+            return
+        self._next_refresh = time.time() + self.interval
+        try:
+            self._thread = threading.Thread(target=self._refresh,
+                                            name='token-revocation-events')
+            self._thread.daemon = True
+            self._thread.start()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def _refresh(self):
+        try:
+            try:
+                events = self.fetch()
+            except Exception as e:
+                if self.is_fresh() or self._stale_warned:
+                    LOG.debug("Could not fetch the token revocation "
+                              "events: %s", e)
+                else:
+                    self._stale_warned = True
+                    LOG.warning(_LW("Could not fetch the token revocation "
+                                    "events, tokens are not served from the "
+                                    "cache until they are. Check the "
+                                    "keystone_authtoken admin credentials: "
+                                    "%s"), e)
+                return
+            parsed = []
+            for event in events:
+                event = dict(event)
+                issued_before = _parse_time(event.pop('issued_before', None))
+                for field in ('revoked_at', 'expires_at'):
+                    event.pop(field, None)
+                parsed.append((issued_before, event))
+            self._events = parsed
+            self._fetched_at = time.time()
+            if self._stale_warned:
+                self._stale_warned = False
+                LOG.info(_LI("Fetched the token revocation events, tokens "
+                             "are served from the cache again"))
+        finally:
+            self._lock.release()
+
+    def is_fresh(self):
+        """Whether the events can be trusted to be current."""
+        if not self.interval:
+            return True
+        return (self._fetched_at is not None and
+                time.time() - self._fetched_at <=
+                _STALE_INTERVALS * self.interval)
+
+    def is_revoked(self, token):
+        if not self._events:
+            return False
+        issued_at = _parse_time(token.get('issued_at'))
+        audit_ids = token.get('audit_ids') or [None]
+        values = {'user_id': token.get('user_id'),
+                  'project_id': token.get('project_id'),
+                  'audit_id': audit_ids[0],
+                  'audit_chain_id': audit_ids[-1]}
+        for issued_before, event in self._events:
+            if (issued_at and issued_before and
+                    issued_at > issued_before):
+                continue
+            if all(field not in values or values[field] == value
+                   for field, value in event.items()):
+                return True
+        return False
+
+
+class TokenCacheMiddleware(wsgi.Middleware):
+    """Serve the token validations of ``auth_filter`` from a cache."""
+
+    def __init__(self, application, auth_filter):
+        super(TokenCacheMiddleware, self).__init__(application)
+        self.auth = auth_filter(self._validated)
+        shared = None
+        if CONF.token_cache_shared and CONF.memcached_servers:
+            shared = memorycache.get_client()
+        self.cache = TokenCache(shared, CONF.memory_cache_size)
+        self.revocations = RevocationEvents(
+            CONF.token_cache_revocation_interval)
+
+    def _validated(self, environ, start_response):
+        """The app below auth_token, records what auth_token set."""
+        environ[_VALIDATED_ENV] = dict(
+            (key, environ[key]) for key in _identity_keys(environ))
+        return self.application(environ, start_response)
+
+    def _store(self, key, environ, resp):
+        identity = environ.pop(_VALIDATED_ENV, None)
+        negative_ttl = CONF.token_cache_negative_time
+        if identity is None:
+            # auth_token answered without calling the app
+            if resp.status_int == 401 and negative_ttl > 0:
+                self.cache.set(key, {'response': (resp.status,
+                                                  resp.headerlist,
+                                                  resp.body)},
+                               negative_ttl)
+            return
+        if identity.get('HTTP_X_IDENTITY_STATUS') != 'Confirmed':
+            if negative_ttl > 0:
+                self.cache.set(key, {'identity': identity}, negative_ttl)
+            return
+
+        token_info = environ.get(_TOKEN_INFO_ENV)
+        token = _token_data(token_info)
+        ttl = CONF.token_cache_time
+        expires_at = _parse_time(token['expires_at'])
+        if expires_at:
+            ttl = min(ttl, int(timeutils.delta_seconds(timeutils.utcnow(),
+                                                       expires_at)))
+        if ttl > 0:
+            self.cache.set(key, {'identity': identity, 'token': token,
+                                 'token_info': token_info}, ttl)
+
+    @wsgi.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        token = (req.environ.get('HTTP_X_AUTH_TOKEN') or
+                 req.environ.get('HTTP_X_STORAGE_TOKEN'))
+        if (not token or not CONF.token_cache_time or
+                'HTTP_X_SERVICE_TOKEN' in req.environ):
+            return self.auth
+
+        self.revocations.refresh()
+        if not self.revocations.is_fresh():
+            # Cached tokens may have been revoked since
+            return self.auth
+        if isinstance(token, six.text_type):
+            token = token.encode('utf-8')
+        key = _KEY_PREFIX + hashlib.sha256(token).hexdigest()
+        entry = self.cache.get(key)
+        if (entry is not None and 'token' in entry and
+                self.revocations.is_revoked(entry['token'])):
+            self.cache.delete(key)
+            entry = None
+        if entry is None:
+            resp = req.get_response(self.auth)
+            self._store(key, req.environ, resp)
+            return resp
+
+        if 'response' in entry:
+            status, headerlist, body = entry['response']
+            return webob.Response(status=status, headerlist=headerlist,
+                                  body=body)
+        for name in _identity_keys(req.environ):
+            del req.environ[name]
+        req.environ.update(entry['identity'])
+        if 'token_info' in entry:
+            req.environ[_TOKEN_INFO_ENV] = entry['token_info']
+        return self.application
+
+
+def filter_factory(global_conf, **local_conf):
+    """Paste factory of auth_token wrapped in the token cache."""
+    # Only deployments using keystone need keystonemiddleware
+    from keystonemiddleware import auth_token
+
+    auth_filter = auth_token.filter_factory(global_conf, **local_conf)
+
+    def _factory(app):
+        return TokenCacheMiddleware(app, auth_filter)
+    return _factory
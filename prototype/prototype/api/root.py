@@ -22,6 +22,7 @@ from oslo_serialization import jsonutils
 import webob.dec
 import webob.exc
 
+from prototype.api import wsgi as api_wsgi
 from prototype.common.i18n import _,_LW
 from oslo_log import log as logging
 from prototype.common import wsgi
@@ -31,6 +32,10 @@ auth_opts = [
     cfg.StrOpt('auth_strategy',
                default='keystone',
                help='The strategy to use for auth: noauth or keystone.'),
+    cfg.BoolOpt('api_collapse_pipeline',
+                default=True,
+                help='Share one request object between the layers of the '
+                     'API pipelines instead of building one per layer.'),
 ]
 
 CONF = cfg.CONF
@@ -39,12 +44,31 @@ CONF.register_opts(auth_opts)
 LOG = logging.getLogger(__name__)
 
 
+# Filters establishing the request context
+_AUTH_FILTERS = ('noauth', 'authtoken', 'keystonecontext')
+
+
 def _load_pipeline(loader, pipeline):
-    filters = [loader.get_filter(n) for n in pipeline[:-1]]
-    app = loader.get_app(pipeline[-1])
-    filters.reverse()
-    for filter in filters:
+    names = pipeline[:-1]
+    filters = [loader.get_filter(n) for n in names]
+    router = app = loader.get_app(pipeline[-1])
+    auth = [index for index, name in enumerate(names)
+            if name in _AUTH_FILTERS]
+    split = auth[-1] + 1 if auth else 0
+    for filter in reversed(filters[split:]):
+        app = filter(app)
+    subrequest_app = app
+    for filter in reversed(filters[:split]):
         app = filter(app)
+    if CONF.api_collapse_pipeline:
+        # Every layer takes an API request, its RequestClass being either
+        # it or the common wsgi.Request it derives from
+        app = wsgi.SharedRequest(app, api_wsgi.Request)
+        subrequest_app = wsgi.SharedRequest(subrequest_app,
+                                            api_wsgi.Request)
+    # Batch sub-requests carry the context of their batch, they go
+    # through the filters after auth (rate limits, response cache)
+    router.subrequest_app = subrequest_app
     return app
 
 
@@ -0,0 +1,219 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Batch requests.
+
+POST /batch takes a list of sub-requests and runs each through the API
+router with the caller's context, so the auth and the rest of the
+middleware run once for the whole batch::
+
+    {"requests": [{"method": "GET", "path": "/debug"},
+                  {"method": "POST", "path": "/debug", "body": {...}}]}
+
+and answers with the responses in the same order::
+
+    {"responses": [{"status": 200, "headers": {...}, "body": {...}},
+                   ...]}
+
+Sub-requests go through the filters the API pipeline runs after auth,
+so each one takes its own rate limit token and uses the response cache.
+
+Consecutive GET and HEAD sub-requests run concurrently on a green pool.
+Any other sub-request waits for those before it and runs on its own, so
+writes happen in the order given.
+
+Once the bodies returned reach api_batch_max_response_size, sub-requests
+are no longer run and get a 413.  A sub-request that already ran when its
+body went over the limit is answered without the body and with
+"truncated": true.
+"""
+
+import eventlet
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+import six
+import webob
+import webob.exc
+
+from prototype.api import wsgi
+from prototype.common.i18n import _, _LE
+from oslo_log import log as logging
+
+
+batch_opts = [
+    cfg.IntOpt('api_batch_max_requests',
+               default=25,
+               help='Maximum number of sub-requests in a batch request.'),
+    cfg.IntOpt('api_batch_concurrency',
+               default=10,
+               help='Number of sub-requests of a batch run at once.'),
+    cfg.IntOpt('api_batch_max_response_size',
+               default=1048576,
+               help='Total size in bytes of the sub-response bodies of a '
+                    'batch. Bodies that would exceed it are left out, and '
+                    'sub-requests not started yet are answered with 413 '
+                    'instead of being run.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(batch_opts)
+
+LOG = logging.getLogger(__name__)
+
+_CONCURRENT_METHODS = ('GET', 'HEAD')
+
+# Request environment carried over to every sub-request.  The context
+# comes from the batch request, sub-requests never see the auth
+# middleware.
+_INHERITED_ENVIRON = ('prototype.context', 'openstack.request_id',
+                      'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT',
+                      'SCRIPT_NAME', 'wsgi.url_scheme', 'HTTP_HOST',
+                      'HTTP_ACCEPT_LANGUAGE',
+                      'HTTP_' + wsgi.API_VERSION_REQUEST_HEADER.upper()
+                      .replace('-', '_'))
+
+
+class Controller(object):
+    """Runs batches of sub-requests through the API router."""
+
+    def __init__(self, router):
+        self.router = router
+
+    @property
+    def application(self):
+        """The router behind the filters that follow auth."""
+        return getattr(self.router, 'subrequest_app', None) or self.router
+
+    def _validate(self, body):
+        if not isinstance(body, dict) or not isinstance(
+                body.get('requests'), list):
+            msg = _("Batch body must be an object with a 'requests' list")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        requests = body['requests']
+        if not requests:
+            msg = _("Batch has no requests")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        if len(requests) > CONF.api_batch_max_requests:
+            msg = (_("Batch has %(count)d requests, more than the "
+                     "%(max)d allowed") %
+                   {'count': len(requests),
+                    'max': CONF.api_batch_max_requests})
+            raise webob.exc.HTTPRequestEntityTooLarge(explanation=msg)
+
+        for index, sub in enumerate(requests):
+            if (not isinstance(sub, dict) or
+                    not isinstance(sub.get('method'), six.string_types) or
+                    not isinstance(sub.get('path'), six.string_types) or
+                    not sub['path'].startswith('/')):
+                msg = (_("Batch request %d needs a method and an absolute "
+                         "path") % index)
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+            if sub['path'].split('?', 1)[0].rstrip('/') == '/batch':
+                msg = _("Batch requests can't be nested")
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+            if not isinstance(sub.get('headers') or {}, dict):
+                msg = (_("Headers of batch request %d must be an object") %
+                       index)
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        return requests
+
+    @staticmethod
+    def _build_request(req, sub):
+        path, _sep, query = sub['path'].partition('?')
+        environ = dict((key, req.environ[key]) for key in _INHERITED_ENVIRON
+                       if key in req.environ)
+        environ['QUERY_STRING'] = query
+        sub_req = webob.Request.blank(path, environ=environ,
+                                      method=sub['method'].upper())
+        sub_req.accept = req.headers.get('Accept', 'application/json')
+        for name, value in (sub.get('headers') or {}).items():
+            sub_req.headers[str(name)] = str(value)
+        if 'body' in sub:
+            body = sub['body']
+            if isinstance(body, six.string_types):
+                sub_req.body = body.encode('utf-8')
+            else:
+                sub_req.body = jsonutils.dumps(body)
+                sub_req.content_type = 'application/json'
+        return sub_req
+
+    @staticmethod
+    def _render(response):
+        result = {'status': response.status_int,
+                  'headers': dict(response.headers)}
+        body = response.body
+        if body:
+            if response.content_type and 'json' in response.content_type:
+                try:
+                    result['body'] = jsonutils.loads(body)
+                except ValueError:
+                    result['body'] = body.decode('utf-8', 'replace')
+            else:
+                result['body'] = body.decode('utf-8', 'replace')
+        return result, len(body)
+
+    def _run(self, req, sub, budget):
+        if budget['exhausted']:
+            return {'status': 413,
+                    'body': _("Batch response size limit reached")}
+        try:
+            sub_req = self._build_request(req, sub)
+        except ValueError:
+            return {'status': 400, 'body': _("Invalid batch request")}
+        try:
+            response = sub_req.get_response(self.application)
+        except Exception:
+            LOG.exception(_LE("Batch request %(method)s %(path)s failed"),
+                          {'method': sub_req.method, 'path': sub['path']})
+            return {'status': 500}
+        result, size = self._render(response)
+        # Checked once the size is known, sub-requests running at the
+        # same time all passed the check above
+        if budget['used'] + size > CONF.api_batch_max_response_size:
+            budget['exhausted'] = True
+            if 'body' in result:
+                del result['body']
+                result['truncated'] = True
+        else:
+            budget['used'] += size
+        return result
+
+    def create(self, req, body):
+        """Run a batch of sub-requests."""
+        requests = self._validate(body)
+        pool = eventlet.GreenPool(CONF.api_batch_concurrency)
+        # Bytes of sub-response bodies so far
+        budget = {'used': 0, 'exhausted': False}
+        responses = [None] * len(requests)
+        pending = []
+
+        def collect():
+            for index, thread in pending:
+                responses[index] = thread.wait()
+            del pending[:]
+
+        for index, sub in enumerate(requests):
+            if sub['method'].upper() in _CONCURRENT_METHODS:
+                pending.append((index, pool.spawn(self._run, req, sub,
+                                                  budget)))
+            else:
+                collect()
+                responses[index] = self._run(req, sub, budget)
+        collect()
+        return {'responses': responses}
+
+
+def create_resource(router):
+    return wsgi.Resource(Controller(router))
@@ -13,7 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from prototype.api.v1 import batch
 from prototype.api.v1 import manager
+from prototype.api.v1 import services
 from prototype.common import wsgi
 import routes
 
@@ -57,4 +59,20 @@ class APIRouter(wsgi.Router):
         mapper.connect("/debug",
                        controller=controller,
                        action='debug2',
-                       conditions={'method': ['POST']})
\ No newline at end of file
+                       conditions={'method': ['POST']})
+
+        mapper.connect("/batch",
+                       controller=batch.create_resource(self),
+                       action='create',
+                       conditions={'method': ['POST']})
+
+        services_resource = services.create_resource()
+        mapper.connect("/services",
+                       controller=services_resource,
+                       action='index',
+                       conditions={'method': ['GET']})
+
+        mapper.connect("/services/{id}",
+                       controller=services_resource,
+                       action='show',
+                       conditions={'method': ['GET']})
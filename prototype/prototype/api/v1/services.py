@@ -0,0 +1,154 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The services API.
+
+GET /services lists the services one page at a time.  The topic, type,
+host and disabled query parameters filter the list in the database,
+sort_key and sort_dir order it, and limit and marker page through it.
+fields takes a comma separated list of the columns to return::
+
+    GET /services?topic=worker&fields=host,disabled&limit=50
+
+Only those columns are read from the database.  The id and the links
+of a service are always returned; an empty fields returns every column.
+"""
+
+from oslo_config import cfg
+from oslo_utils import strutils
+import webob.exc
+
+from prototype.api import common
+from prototype.api import wsgi
+from prototype.common import exception
+from prototype.common.i18n import _
+from prototype import db
+
+
+CONF = cfg.CONF
+
+# Columns clients may ask for, sort on and filter by
+_COLUMNS = ('id', 'host', 'type', 'topic', 'disabled',
+            'created_at', 'updated_at')
+_FILTERS = ('host', 'type', 'topic', 'disabled')
+
+
+class ViewBuilder(common.ViewBuilder):
+    """Model service API responses as dictionaries."""
+
+    _collection_name = "services"
+
+    def basic(self, request, service, fields=None):
+        if fields is None:
+            fields = _COLUMNS
+        view = dict((field, service[field]) for field in fields)
+        view['id'] = service['id']
+        view['links'] = self._get_links(request, service['id'],
+                                        self._collection_name)
+        return view
+
+    def show(self, request, service, fields=None):
+        return {'service': self.basic(request, service, fields)}
+
+    def index(self, request, services, fields=None, limit=None):
+        """Stream a page of services, with a 'next' link if more follow."""
+        items = (self.basic(request, service, fields)
+                 for service in services)
+
+        def extra():
+            links = self._get_collection_links(request, services,
+                                               self._collection_name,
+                                               id_key='id', limit=limit)
+            if links:
+                return {'services_links': links}
+
+        return wsgi.StreamedCollection('services', items, extra=extra)
+
+
+class Controller(wsgi.Controller):
+    """The services API controller."""
+
+    _view_builder_class = ViewBuilder
+
+    @staticmethod
+    def _get_fields(req):
+        """The columns asked for, None for all of them."""
+        fields = []
+        for value in req.GET.getall('fields'):
+            fields.extend(field.strip() for field in value.split(',')
+                          if field.strip())
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            msg = (_("Invalid fields: %s") %
+                   ', '.join(sorted(unknown)))
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        return fields or None
+
+    @staticmethod
+    def _get_filters(req):
+        filters = {}
+        for key in _FILTERS:
+            if key in req.GET:
+                filters[key] = req.GET[key]
+        if 'disabled' in filters:
+            try:
+                filters['disabled'] = strutils.bool_from_string(
+                    filters['disabled'], strict=True)
+            except ValueError:
+                msg = _("disabled param must be a boolean")
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        return filters
+
+    def index(self, req):
+        """Return a page of services."""
+        context = req.environ['prototype.context']
+        fields = self._get_fields(req)
+        filters = self._get_filters(req)
+        sort_keys, sort_dirs = common.get_sort_params(
+            req.GET, default_key='id', default_dir='asc')
+        for key in sort_keys:
+            if key not in _COLUMNS:
+                msg = _("Invalid sort key: %s") % key
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        for sort_dir in sort_dirs:
+            if sort_dir not in ('asc', 'desc'):
+                msg = _("Invalid sort direction: %s") % sort_dir
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        limit, marker = common.get_limit_and_marker(req)
+        # A limit of 0 asks for the default page size
+        limit = limit or CONF.osapi_max_limit
+
+        try:
+            services = db.service_list(context, limit=limit, marker=marker,
+                                       sort_keys=sort_keys,
+                                       sort_dirs=sort_dirs,
+                                       columns=fields, **filters)
+        except exception.MarkerNotFound as e:
+            raise webob.exc.HTTPBadRequest(explanation=e.format_message())
+        return self._view_builder.index(req, services, fields, limit)
+
+    def show(self, req, id):
+        """Return a single service."""
+        context = req.environ['prototype.context']
+        fields = self._get_fields(req)
+        service = db.service_get(context, id)
+        if service is None:
+            msg = exception.ServiceNotFound(service_id=id).format_message()
+            raise webob.exc.HTTPNotFound(explanation=msg)
+        return self._view_builder.show(req, service, fields)
+
+
+def create_resource():
+    return wsgi.Resource(Controller())
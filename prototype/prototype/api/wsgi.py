@@ -15,17 +15,22 @@
 #    under the License.
 
 import functools
+import hashlib
 import inspect
+import logging as std_logging
 import math
 import time
 
 from oslo_serialization import jsonutils
+from oslo_utils import importutils
 from oslo_utils import strutils
 import six
 import webob
 
 from prototype.common import exception
 from prototype.common import i18n
+from prototype.common import jsoncodec
+from prototype.common import timing
 from prototype.common.i18n import _,_LE,_LI
 from prototype.api import api_version_request as api_version
 from oslo_log import log as logging
@@ -35,14 +40,26 @@ from prototype.common import wsgi
 
 LOG = logging.getLogger(__name__)
 
+# msgpack is optional, the content type is only offered when it's installed
+msgpack = importutils.try_import('msgpack')
+
 _SUPPORTED_CONTENT_TYPES = (
     'application/json',
     'application/vnd.openstack.compute+json',
+    'application/x-ndjson',
 )
+if msgpack:
+    _SUPPORTED_CONTENT_TYPES += (
+        'application/msgpack',
+        'application/x-msgpack',
+    )
 
 _MEDIA_TYPE_MAP = {
     'application/vnd.openstack.compute+json': 'json',
     'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
 }
 
 # These are typically automatically created by routes as either defaults
@@ -59,6 +76,21 @@ _METHODS_WITH_BODY = [
     'PUT',
 ]
 
+# Bodies of unknown length are read in chunks of this size
+_READ_CHUNK_SIZE = 65536
+
+# WSGI environ key of an action body decoded to find the action, as the
+# (deserializer, body, contents) the deserialize stage can reuse
+_ACTION_BODY_ENV = 'prototype.action_body'
+
+# Clients send a handful of distinct Accept and Accept-Language values, so
+# the negotiated content type and language are kept by header value.  The
+# caches stop growing at _NEGOTIATION_CACHE_SIZE entries so that arbitrary
+# header values can't grow them without limit.
+_NEGOTIATION_CACHE_SIZE = 256
+_CONTENT_TYPE_CACHE = {}
+_LANGUAGE_CACHE = {}
+
 # The default api version request if none is requested in the headers
 # Note(cyeoh): This only applies for the v2.1 API once microversions
 # support is fully merged. It does not affect the V2 API.
@@ -80,14 +112,14 @@ def get_media_map():
     return dict(_MEDIA_TYPE_MAP.items())
 
 
-class Request(webob.Request):
+class Request(wsgi.Request):
     """Add some OpenStack API-specific logic to the base webob.Request."""
 
     def __init__(self, *args, **kwargs):
         super(Request, self).__init__(*args, **kwargs)
         self._extension_data = {'db_items': {}}
         if not hasattr(self, 'api_version_request'):
-            self.api_version_request = api_version.APIVersionRequest()
+            self.api_version_request = api_version.null_api_version()
 
     def cache_db_items(self, key, items, item_key='id'):
         """Allow API methods to store objects from a DB query to be
@@ -124,18 +156,23 @@ class Request(webob.Request):
             content_type = None
 
             # Check URL path suffix
-            parts = self.path.rsplit('.', 1)
-            if len(parts) > 1:
-                possible_type = 'application/' + parts[1]
+            path = self.environ.get('PATH_INFO', '')
+            if '.' in path:
+                possible_type = 'application/' + path.rsplit('.', 1)[1]
                 if possible_type in get_supported_content_types():
                     content_type = possible_type
 
             if not content_type:
-                content_type = self.accept.best_match(
-                    get_supported_content_types())
+                accept = self.environ.get('HTTP_ACCEPT')
+                try:
+                    content_type = _CONTENT_TYPE_CACHE[accept]
+                except KeyError:
+                    content_type = (self.accept.best_match(
+                        get_supported_content_types()) or 'application/json')
+                    if len(_CONTENT_TYPE_CACHE) < _NEGOTIATION_CACHE_SIZE:
+                        _CONTENT_TYPE_CACHE[accept] = content_type
 
-            self.environ['prototype.best_content_type'] = (content_type or
-                                                      'application/json')
+            self.environ['prototype.best_content_type'] = content_type
 
         return self.environ['prototype.best_content_type']
 
@@ -167,36 +204,26 @@ class Request(webob.Request):
         :returns: the best language match or None if the 'Accept-Language'
                   header was not available in the request.
         """
-        if not self.accept_language:
+        accept_language = self.environ.get('HTTP_ACCEPT_LANGUAGE')
+        if not accept_language:
             return None
-        return self.accept_language.best_match(
+        try:
+            return _LANGUAGE_CACHE[accept_language]
+        except KeyError:
+            language = self.accept_language.best_match(
                 i18n.get_available_languages())
+            if len(_LANGUAGE_CACHE) < _NEGOTIATION_CACHE_SIZE:
+                _LANGUAGE_CACHE[accept_language] = language
+            return language
 
     def set_api_version_request(self):
         """Set API version request based on the request header information."""
-        if API_VERSION_REQUEST_HEADER in self.headers:
-            hdr_string = self.headers[API_VERSION_REQUEST_HEADER]
-            # 'latest' is a special keyword which is equivalent to requesting
-            # the maximum version of the API supported
-            if hdr_string == 'latest':
-                self.api_version_request = api_version.max_api_version()
-            else:
-                self.api_version_request = api_version.APIVersionRequest(
-                    hdr_string)
-
-                # Check that the version requested is within the global
-                # minimum/maximum of supported API versions
-                if not self.api_version_request.matches(
-                        api_version.min_api_version(),
-                        api_version.max_api_version()):
-                    raise exception.InvalidGlobalAPIVersion(
-                        req_ver=self.api_version_request.get_string(),
-                        min_ver=api_version.min_api_version().get_string(),
-                        max_ver=api_version.max_api_version().get_string())
-
+        hdr_string = self.headers.get(API_VERSION_REQUEST_HEADER)
+        if hdr_string is None:
+            self.api_version_request = api_version.default_api_version()
         else:
-            self.api_version_request = api_version.APIVersionRequest(
-                api_version.DEFAULT_API_VERSION)
+            self.api_version_request = api_version.negotiate_api_version(
+                hdr_string)
 
 
 class ActionDispatcher(object):
@@ -226,7 +253,7 @@ class JSONDeserializer(TextDeserializer):
 
     def _from_json(self, datastring):
         try:
-            return jsonutils.loads(datastring)
+            return jsoncodec.loads(datastring)
         except ValueError:
             msg = _("cannot understand JSON")
             raise exception.MalformedRequestBody(reason=msg)
@@ -235,21 +262,207 @@ class JSONDeserializer(TextDeserializer):
         return {'body': self._from_json(datastring)}
 
 
+class NDJSONDeserializer(TextDeserializer):
+    """Newline delimited JSON, the body is the list of decoded lines."""
+
+    def _from_ndjson(self, datastring):
+        try:
+            return [jsoncodec.loads(line)
+                    for line in datastring.splitlines() if line.strip()]
+        except ValueError:
+            msg = _("cannot understand NDJSON")
+            raise exception.MalformedRequestBody(reason=msg)
+
+    def default(self, datastring):
+        return {'body': self._from_ndjson(datastring)}
+
+
+class MsgpackDeserializer(TextDeserializer):
+
+    def _from_msgpack(self, datastring):
+        try:
+            return msgpack.unpackb(datastring, raw=False)
+        except Exception:
+            msg = _("cannot understand msgpack")
+            raise exception.MalformedRequestBody(reason=msg)
+
+    def default(self, datastring):
+        return {'body': self._from_msgpack(datastring)}
+
+
+class StreamedCollection(object):
+    """A collection whose items are serialized as they are produced.
+
+    Controllers may return this, on its own or wrapped in a
+    ResponseObject, instead of a dict holding a fully built list.
+    Serializers that support streaming write the items out in chunks as
+    the iterator yields them; the others get the materialized dict.
+
+    :param name: key of the item list in the response document
+    :param items: iterable of items, consumed once
+    :param extra: dict of additional top level keys, or a callable
+                  returning one.  A callable is invoked only after all
+                  the items have been consumed, so it can depend on them
+                  (e.g. to build a 'next' link from the last item).
+    """
+
+    def __init__(self, name, items, extra=None):
+        self.name = name
+        self.items = items
+        self.extra = extra
+
+    def get_extra(self):
+        if callable(self.extra):
+            return self.extra() or {}
+        return self.extra or {}
+
+    def to_dict(self):
+        """Materialize the collection as a plain response dict."""
+        data = {self.name: list(self.items)}
+        data.update(self.get_extra())
+        return data
+
+
 class DictSerializer(ActionDispatcher):
     """Default request body serialization."""
 
     def serialize(self, data, action='default'):
+        if isinstance(data, StreamedCollection):
+            data = data.to_dict()
         return self.dispatch(data, action=action)
 
     def default(self, data):
         return ""
 
 
+def _chunked(pieces, chunk_size):
+    """Group serialized pieces into chunks of about chunk_size bytes.
+
+    The first piece is yielded on its own to get the first bytes out
+    quickly.  Only one chunk is held in memory at a time.
+    """
+    buf = []
+    size = 0
+    first = True
+    for piece in pieces:
+        if first:
+            first = False
+            yield utils.utf8(piece)
+            continue
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield utils.utf8(''.join(buf))
+            buf = []
+            size = 0
+    if buf:
+        yield utils.utf8(''.join(buf))
+
+
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization."""
 
+    # Serialized items are buffered up to this many bytes per chunk
+    stream_chunk_size = 65536
+
     def default(self, data):
-        return jsonutils.dumps(data)
+        return jsoncodec.dumps(data)
+
+    def serialize_stream(self, collection):
+        """Yield the JSON document for a StreamedCollection in chunks."""
+        return _chunked(self._stream_pieces(collection),
+                        self.stream_chunk_size)
+
+    def _stream_pieces(self, collection):
+        codec = jsoncodec.get_codec()
+        item_sep = codec.item_separator
+        key_sep = codec.key_separator
+
+        first = True
+        for item in collection.items:
+            if first:
+                first = False
+                yield ''.join(['{', codec.dumps(collection.name), key_sep,
+                               '[', codec.dumps(item)])
+            else:
+                yield item_sep + codec.dumps(item)
+        if first:
+            yield ''.join(['{', codec.dumps(collection.name), key_sep, '['])
+
+        parts = [']']
+        for key, value in collection.get_extra().items():
+            parts.extend([item_sep, codec.dumps(key), key_sep,
+                          codec.dumps(value)])
+        parts.append('}')
+        yield ''.join(parts)
+
+
+class NDJSONDictSerializer(DictSerializer):
+    """Newline delimited JSON serialization.
+
+    A StreamedCollection is written one item per line.  If it has any
+    additional top level keys (e.g. links) they are written as one final
+    line.  Any other response is written as a single line.
+    """
+
+    stream_chunk_size = 65536
+
+    def serialize(self, data, action='default'):
+        if isinstance(data, StreamedCollection):
+            return ''.join(self.serialize_stream(data))
+        return self.dispatch(data, action=action)
+
+    def default(self, data):
+        return jsoncodec.dumps(data) + '\n'
+
+    def serialize_stream(self, collection):
+        """Yield the NDJSON lines for a StreamedCollection in chunks."""
+        return _chunked(self._stream_pieces(collection),
+                        self.stream_chunk_size)
+
+    def _stream_pieces(self, collection):
+        codec = jsoncodec.get_codec()
+        for item in collection.items:
+            yield codec.dumps(item) + '\n'
+        extra = collection.get_extra()
+        if extra:
+            yield codec.dumps(extra) + '\n'
+
+
+class MsgpackDictSerializer(DictSerializer):
+    """msgpack serialization.
+
+    msgpack needs array lengths up front, so streamed collections are
+    materialized before they are packed.
+    """
+
+    def default(self, data):
+        return msgpack.packb(data, default=jsonutils.to_primitive,
+                             use_bin_type=False)
+
+
+def get_default_serializers():
+    """Serializers for every supported media type, keyed by media type."""
+    serializers = dict(json=JSONDictSerializer,
+                       ndjson=NDJSONDictSerializer)
+    if msgpack:
+        serializers['msgpack'] = MsgpackDictSerializer
+    return serializers
+
+
+def get_default_deserializers():
+    """Deserializers for every supported media type, keyed by media type."""
+    deserializers = dict(json=JSONDeserializer,
+                         ndjson=NDJSONDeserializer)
+    if msgpack:
+        deserializers['msgpack'] = MsgpackDeserializer
+    return deserializers
+
+
+def get_fault_serializer(content_type):
+    """Return a serializer instance for a fault body."""
+    mtype = get_media_map().get(content_type, 'json')
+    return get_default_serializers().get(mtype, JSONDictSerializer)()
 
 
 def serializers(**serializers):
@@ -306,16 +519,24 @@ class ResponseObject(object):
     optional.
     """
 
-    def __init__(self, obj, code=None, headers=None, **serializers):
+    def __init__(self, obj, code=None, headers=None, version_stamp=None,
+                 **serializers):
         """Binds serializers with an object.
 
         Takes keyword arguments akin to the @serializer() decorator
         for specifying serializers.  Serializers specified will be
         given preference over default serializers or method-specific
         serializers on return.
+
+        :param version_stamp: optional value that changes whenever the
+                              wrapped object changes (e.g. an updated_at
+                              timestamp).  When given, the ETag is derived
+                              from it and a matching If-None-Match is
+                              answered without serializing the object.
         """
 
         self.obj = obj
+        self.version_stamp = version_stamp
         self.serializers = serializers
         self._default_code = 200
         self._code = code
@@ -395,13 +616,41 @@ class ResponseObject(object):
         if self.media_type in kwargs:
             self.serializer.attach(kwargs[self.media_type])
 
+    def _stamp_etag(self, request, content_type):
+        # The same stamp is served in several representations, each of
+        # which needs its own strong validator.
+        parts = [utils.utf8(six.text_type(self.version_stamp)),
+                 utils.utf8(content_type)]
+        ver = request.api_version_request
+        if not ver.is_null():
+            parts.append(utils.utf8(ver.get_string()))
+        return hashlib.md5(b'\0'.join(parts)).hexdigest()
+
+    def _not_modified(self, etag):
+        response = webob.Response(status=304)
+        for hdr, value in self._headers.items():
+            response.headers[hdr] = utils.utf8(str(value))
+        response.etag = etag
+        return response
+
     def serialize(self, request, content_type, default_serializers=None):
         """Serializes the wrapped object.
 
         Utility method for serializing the wrapped object.  Returns a
         webob.Response object.
+
+        Successful GET and HEAD responses carry a strong ETag, and a
+        304 Not Modified is returned when it matches If-None-Match.
         """
 
+        conditional = (request.method in ('GET', 'HEAD') and
+                       self.code == 200)
+        etag = None
+        if conditional and self.version_stamp is not None:
+            etag = self._stamp_etag(request, content_type)
+            if etag in request.if_none_match:
+                return self._not_modified(etag)
+
         if self.serializer:
             serializer = self.serializer
         else:
@@ -414,9 +663,21 @@ class ResponseObject(object):
         for hdr, value in self._headers.items():
             response.headers[hdr] = utils.utf8(str(value))
         response.headers['Content-Type'] = utils.utf8(content_type)
-        if self.obj is not None:
+        if (isinstance(self.obj, StreamedCollection) and
+                hasattr(serializer, 'serialize_stream')):
+            # No Content-Length, the server will use chunked encoding.
+            # Without a version stamp there is nothing to derive an ETag
+            # from short of buffering the whole body.
+            response.app_iter = serializer.serialize_stream(self.obj)
+        elif self.obj is not None:
             response.body = serializer.serialize(self.obj)
+            if conditional and etag is None:
+                etag = hashlib.md5(response.body).hexdigest()
+                if etag in request.if_none_match:
+                    return self._not_modified(etag)
 
+        if etag is not None:
+            response.etag = etag
         return response
 
     @property
@@ -432,22 +693,36 @@ class ResponseObject(object):
         return self._headers.copy()
 
 
-def action_peek_json(body):
-    """Determine action to invoke."""
-
-    try:
-        decoded = jsonutils.loads(body)
-    except ValueError:
-        msg = _("cannot understand JSON")
-        raise exception.MalformedRequestBody(reason=msg)
+def _action_key(decoded):
+    """Return the action of a decoded action body."""
 
     # Make sure there's exactly one key...
-    if len(decoded) != 1:
+    if not isinstance(decoded, dict) or len(decoded) != 1:
         msg = _("too many body keys")
         raise exception.MalformedRequestBody(reason=msg)
 
-    # Return the action and the decoded body...
-    return decoded.keys()[0]
+    return list(decoded.keys())[0]
+
+
+def action_peek_json(body):
+    """Determine action to invoke."""
+
+    return _action_key(JSONDeserializer()._from_json(body))
+
+
+def action_peek_msgpack(body):
+    """Determine action to invoke."""
+
+    return _action_key(MsgpackDeserializer()._from_msgpack(body))
+
+
+# The deserializers decoding the bodies the stock peeks look into.  Resource
+# decodes such a body once, finding the action in the decoded document and
+# handing that document to the method.
+_ACTION_PEEK_DESERIALIZERS = {
+    action_peek_json: JSONDeserializer,
+    action_peek_msgpack: MsgpackDeserializer,
+}
 
 
 class ResourceExceptionHandler(object):
@@ -520,13 +795,15 @@ class Resource(wsgi.Application):
 
         self.controller = controller
 
-        default_deserializers = dict(json=JSONDeserializer)
+        default_deserializers = get_default_deserializers()
         default_deserializers.update(deserializers)
 
         self.default_deserializers = default_deserializers
-        self.default_serializers = dict(json=JSONDictSerializer)
+        self.default_serializers = get_default_serializers()
 
         self.action_peek = dict(json=action_peek_json)
+        if msgpack:
+            self.action_peek['msgpack'] = action_peek_msgpack
         self.action_peek.update(action_peek or {})
 
         # Copy over the actions dictionary
@@ -591,15 +868,27 @@ class Resource(wsgi.Application):
         return args
 
     def get_body(self, request):
+        """Return the content type and the body of the request.
+
+        The body is read once, straight from the input the sizelimit
+        filter caps, rather than through webob's seekable copy; it can't
+        be read again from the request afterwards.
+        """
         try:
             content_type = request.get_content_type()
         except exception.InvalidContentType:
             LOG.debug("Unrecognized Content-Type provided in request")
             return None, ''
 
-        return content_type, request.body
+        if not request.is_body_readable:
+            return content_type, ''
+        body_file = request.body_file_raw
+        if request.content_length is not None:
+            return content_type, body_file.read(request.content_length)
+        return content_type, b''.join(
+            iter(functools.partial(body_file.read, _READ_CHUNK_SIZE), b''))
 
-    def deserialize(self, meth, content_type, body):
+    def deserialize(self, meth, content_type, body, request=None):
         meth_deserializers = getattr(meth, 'wsgi_deserializers', {})
         try:
             mtype = get_media_map().get(content_type, content_type)
@@ -610,6 +899,13 @@ class Resource(wsgi.Application):
         except (KeyError, TypeError):
             raise exception.InvalidContentType(content_type=content_type)
 
+        if request is not None:
+            # Reuse the contents decoded by _peek_action
+            decoded = request.environ.get(_ACTION_BODY_ENV)
+            if (decoded is not None and decoded[0] is deserializer and
+                    decoded[1] is body):
+                return decoded[2]
+
         if (hasattr(deserializer, 'want_controller')
                 and deserializer.want_controller):
             return deserializer(self.controller).deserialize(body)
@@ -679,7 +975,7 @@ class Resource(wsgi.Application):
     def _should_have_body(self, request):
         return request.method in _METHODS_WITH_BODY
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgi.wsgify(RequestClass=Request)
     def __call__(self, request):
         """WSGI method that controls (de)serialization and method dispatch."""
 
@@ -698,7 +994,8 @@ class Resource(wsgi.Application):
         # content type
         action_args = self.get_action_args(request.environ)
         action = action_args.pop('action', None)
-        content_type, body = self.get_body(request)
+        with timing.stage('deserialize', request.environ):
+            content_type, body = self.get_body(request)
         accept = request.best_match_content_type()
 
         # NOTE(Vek): Splitting the function up this way allows for
@@ -725,16 +1022,23 @@ class Resource(wsgi.Application):
         except exception.MalformedRequestBody:
             msg = _("Malformed request body")
             return Fault(webob.exc.HTTPBadRequest(explanation=msg))
-
-        if body:
-            msg = _("Action: '%(action)s', calling method: %(meth)s, body: "
-                    "%(body)s") % {'action': action,
-                                   'body': unicode(body, 'utf-8'),
-                                   'meth': str(meth)}
-            LOG.debug(strutils.mask_password(msg))
-        else:
-            LOG.debug("Calling method '%(meth)s'",
-                      {'meth': str(meth)})
+        except exception.InvalidContentType:
+            msg = _("Unsupported Content-Type")
+            return Fault(webob.exc.HTTPUnsupportedMediaType(explanation=msg))
+
+        # Decoding and masking a large body can cost more than serving
+        # the request, only do it when the line is logged.
+        if LOG.isEnabledFor(std_logging.DEBUG):
+            if body:
+                msg = _("Action: '%(action)s', calling method: %(meth)s, "
+                        "body: %(body)s") % {'action': action,
+                                             'body': unicode(body, 'utf-8',
+                                                             'replace'),
+                                             'meth': str(meth)}
+                LOG.debug(strutils.mask_password(msg))
+            else:
+                LOG.debug("Calling method '%(meth)s'",
+                          {'meth': str(meth)})
 
         # Now, deserialize the request body...
         try:
@@ -744,7 +1048,9 @@ class Resource(wsgi.Application):
                 if request.content_length == 0:
                     contents = {'body': None}
                 else:
-                    contents = self.deserialize(meth, content_type, body)
+                    with timing.stage('deserialize', request.environ):
+                        contents = self.deserialize(meth, content_type, body,
+                                                    request)
         except exception.InvalidContentType:
             msg = _("Unsupported Content-Type")
             return Fault(webob.exc.HTTPBadRequest(explanation=msg))
@@ -780,7 +1086,8 @@ class Resource(wsgi.Application):
             # No exceptions; convert action_result into a
             # ResponseObject
             resp_obj = None
-            if type(action_result) is dict or action_result is None:
+            if (type(action_result) is dict or action_result is None or
+                    isinstance(action_result, StreamedCollection)):
                 resp_obj = ResponseObject(action_result)
             elif isinstance(action_result, ResponseObject):
                 resp_obj = action_result
@@ -801,8 +1108,9 @@ class Resource(wsgi.Application):
                                                         request, action_args)
 
             if resp_obj and not response:
-                response = resp_obj.serialize(request, accept,
-                                              self.default_serializers)
+                with timing.stage('serialize', request.environ):
+                    response = resp_obj.serialize(request, accept,
+                                                  self.default_serializers)
 
         if hasattr(response, 'headers'):
 
@@ -850,7 +1158,7 @@ class Resource(wsgi.Application):
         if action == 'action':
             # OK, it's an action; figure out which action...
             mtype = get_media_map().get(content_type)
-            action_name = self.action_peek[mtype](body)
+            action_name = self._peek_action(request, mtype, body)
         else:
             action_name = action
 
@@ -858,11 +1166,33 @@ class Resource(wsgi.Application):
         return (self.wsgi_actions[action_name],
                 self.wsgi_action_extensions.get(action_name, []))
 
+    def _peek_action(self, request, mtype, body):
+        """Determine the action of an action request body.
+
+        :raises: InvalidContentType for a media type without a peek, like
+                 application/x-ndjson, whose bodies hold no single document
+        """
+
+        peek = self.action_peek.get(mtype)
+        if peek is None:
+            raise exception.InvalidContentType(content_type=mtype)
+        deserializer = _ACTION_PEEK_DESERIALIZERS.get(peek)
+        if deserializer is None:
+            return peek(body)
+
+        decoded = request.environ.get(_ACTION_BODY_ENV)
+        if (decoded is None or decoded[0] is not deserializer or
+                decoded[1] is not body):
+            decoded = (deserializer, body, deserializer().deserialize(body))
+            request.environ[_ACTION_BODY_ENV] = decoded
+        return _action_key(decoded[2]['body'])
+
     def dispatch(self, method, request, action_args):
         """Dispatch a call to the action-specific method."""
 
         try:
-            return method(req=request, **action_args)
+            with timing.stage('controller', request.environ):
+                return method(req=request, **action_args)
         except exception.VersionNotFoundForAPIMethod:
             # We deliberately don't return any message information
             # about the exception to the user so it looks as if
@@ -1107,7 +1437,7 @@ class Fault(webob.exc.HTTPException):
             self.wrapped_exc.headers[key] = str(value)
         self.status_int = exception.status_int
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgi.wsgify(RequestClass=Request)
     def __call__(self, req):
         """Generate a WSGI response based on the exception passed to ctor."""
 
@@ -1136,9 +1466,7 @@ class Fault(webob.exc.HTTPException):
               API_VERSION_REQUEST_HEADER
 
         content_type = req.best_match_content_type()
-        serializer = {
-            'application/json': JSONDictSerializer(),
-        }[content_type]
+        serializer = get_fault_serializer(content_type)
 
         self.wrapped_exc.body = serializer.serialize(fault_data)
         self.wrapped_exc.content_type = content_type
@@ -1172,7 +1500,7 @@ class RateLimitFault(webob.exc.HTTPException):
         headers = {'Retry-After': '%d' % retry_after}
         return headers
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgi.wsgify(RequestClass=Request)
     def __call__(self, request):
         """Return the wrapped exception with a serialized body conforming
         to our error format.
@@ -1185,9 +1513,7 @@ class RateLimitFault(webob.exc.HTTPException):
         self.content['overLimit']['details'] = \
             i18n.translate(self.content['overLimit']['details'], user_locale)
 
-        serializer = {
-            'application/json': JSONDictSerializer(),
-        }[content_type]
+        serializer = get_fault_serializer(content_type)
 
         content = serializer.serialize(self.content)
         self.wrapped_exc.body = content
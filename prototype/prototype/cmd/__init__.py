@@ -13,6 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
 import eventlet
 
-eventlet.monkey_patch(os=False)
+# The asyncio server engine runs the API on native threads and needs the
+# process left unpatched, see the wsgi_server_engine option.
+if os.environ.get('PROTOTYPE_EVENTLET_MONKEY_PATCH', '1').lower() not in (
+        '0', 'false', 'no'):
+    eventlet.monkey_patch(os=False)
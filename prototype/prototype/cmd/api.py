@@ -44,8 +44,16 @@ def main():
 
 
     launcher = service.process_launcher()
+    if CONF.api_preload:
+        service.preload()
+    # Load every API before the first fork, workers are forked as soon
+    # as a service is launched.
+    servers = []
     for api in CONF.enabled_apis:
         should_use_ssl = api in CONF.enabled_ssl_apis
-        server = service.WSGIService(api, use_ssl=should_use_ssl)
+        servers.append(service.WSGIService(api, use_ssl=should_use_ssl))
+    if CONF.api_preload:
+        service.freeze()
+    for server in servers:
         launcher.launch_service(server, workers=server.workers or 1)
     launcher.wait()
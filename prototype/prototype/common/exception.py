@@ -13,6 +13,12 @@ LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
 
+class ConvertedException(webob.exc.WSGIHTTPException):
+    def __init__(self, code=0, title="", explanation=""):
+        self.code = code
+        self.title = title
+        self.explanation = explanation
+        super(ConvertedException, self).__init__()
 
 
 class PrototypeException(Exception):
@@ -60,4 +66,53 @@ class PrototypeException(Exception):
     def format_message(self):
         # NOTE(mrodden): use the first argument to the python Exception object
         # which should be our full PrototypeException message, (see __init__)
-        return self.args[0]
\ No newline at end of file
+        return self.args[0]
+
+
+class Forbidden(PrototypeException):
+    msg_fmt = _("Forbidden")
+    code = 403
+
+
+class NotFound(PrototypeException):
+    msg_fmt = _("Resource could not be found.")
+    code = 404
+
+
+class Invalid(PrototypeException):
+    msg_fmt = _("Unacceptable parameters.")
+    code = 400
+
+
+class InvalidAPIVersionString(Invalid):
+    msg_fmt = _("API Version String %(version)s is of invalid format. Must "
+                "be of format MajorNum.MinorNum.")
+
+
+class InvalidGlobalAPIVersion(Invalid):
+    msg_fmt = _("Version %(req_ver)s is not supported by the API. Minimum "
+                "is %(min_ver)s and maximum is %(max_ver)s.")
+
+
+class InvalidInput(Invalid):
+    msg_fmt = _("Invalid input received: %(reason)s")
+
+
+class InvalidContentType(Invalid):
+    msg_fmt = _("Invalid content type %(content_type)s.")
+
+
+class VersionNotFoundForAPIMethod(Invalid):
+    msg_fmt = _("API version %(version)s is not supported on this method.")
+
+
+class ServiceNotFound(NotFound):
+    msg_fmt = _("Service %(service_id)s could not be found.")
+
+
+class MarkerNotFound(NotFound):
+    msg_fmt = _("Marker %(marker)s could not be found.")
+
+
+class MalformedRequestBody(PrototypeException):
+    msg_fmt = _("Malformed message body: %(reason)s")
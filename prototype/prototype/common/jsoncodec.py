@@ -0,0 +1,180 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pluggable JSON encoding and decoding.
+
+The API serializers and deserializers go through this module rather
+than calling ``jsonutils`` directly, so the JSON implementation can be
+chosen by configuration.  With the default options the output is
+byte-for-byte identical to ``jsonutils.dumps``; only the encoder doing
+the work changes.
+
+ujson is the exception: it encodes the types it knows natively with its
+own rules (datetimes become timestamps, objects with a ``toDict`` or
+``__json__`` method are encoded through it) where jsonutils would use
+``to_primitive``.  It is therefore never picked by "auto" and has to be
+asked for with json_codec=ujson.
+"""
+
+import six
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+
+from prototype.common import exception
+from prototype.common.i18n import _
+from oslo_log import log as logging
+
+
+json_codec_opts = [
+    cfg.StrOpt('json_codec',
+               default='auto',
+               help='JSON implementation used to encode and decode API and '
+                    'RPC payloads. One of auto, json, simplejson or ujson. '
+                    '"auto" picks simplejson when installed and json '
+                    'otherwise. ujson needs json_compact and encodes '
+                    'datetimes and objects differently from jsonutils.'),
+    cfg.BoolOpt('json_compact',
+                default=False,
+                help='Emit JSON without whitespace after separators. The '
+                     'default keeps output byte-for-byte identical to '
+                     'oslo.serialization jsonutils. ujson can only be used '
+                     'when this is enabled.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(json_codec_opts)
+
+LOG = logging.getLogger(__name__)
+
+_BACKENDS = ('ujson', 'simplejson', 'json')
+
+# Implementations able to reproduce jsonutils.dumps output exactly, in
+# order of preference for 'auto'.
+_COMPATIBLE_BACKENDS = ('simplejson', 'json')
+
+_STANDARD_SEPARATORS = (', ', ': ')
+_COMPACT_SEPARATORS = (',', ':')
+
+_CODEC = None
+
+
+class JSONCodec(object):
+    """Encode and decode JSON with a single backend implementation.
+
+    Objects the backend can't encode natively are converted with
+    ``jsonutils.to_primitive``, exactly as ``jsonutils.dumps`` does.  For
+    ujson that only holds for objects it rejects, see the module
+    docstring.
+    """
+
+    def __init__(self, backend='json', compact=False):
+        if backend not in _BACKENDS:
+            raise exception.InvalidInput(
+                reason=_('Unknown JSON codec: %s') % backend)
+        if not compact and backend not in _COMPATIBLE_BACKENDS:
+            raise exception.InvalidInput(
+                reason=_('JSON codec %s requires json_compact') % backend)
+
+        self.name = backend
+        self.compact = compact
+        self._module = importutils.import_module(backend)
+
+        separators = (_COMPACT_SEPARATORS if compact
+                      else _STANDARD_SEPARATORS)
+        # Exposed so documents can be assembled incrementally with the
+        # same layout dumps() would produce.
+        self.item_separator, self.key_separator = separators
+        # NOTE: the stdlib builds a new JSONEncoder on every dumps() call
+        # that passes options; building it once saves that per call.
+        stdlib = importutils.import_module('json')
+        self._fallback_encode = stdlib.JSONEncoder(
+            separators=separators,
+            default=jsonutils.to_primitive).encode
+
+        if backend == 'ujson':
+            self._encode = self._ujson_encode
+            self._decode = self._ujson_decode
+        elif backend == 'simplejson':
+            self._encode = self._module.JSONEncoder(
+                separators=separators,
+                default=jsonutils.to_primitive,
+                use_decimal=False,
+                namedtuple_as_object=False).encode
+            self._decode = self._module.JSONDecoder().decode
+        else:
+            self._encode = self._fallback_encode
+            self._decode = self._module.JSONDecoder().decode
+
+    def _ujson_encode(self, obj):
+        try:
+            return self._module.dumps(obj, ensure_ascii=True,
+                                      escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            # Not natively encodable, let to_primitive handle it
+            return self._fallback_encode(obj)
+
+    def _ujson_decode(self, datastring):
+        return self._module.loads(datastring, precise_float=True)
+
+    def dumps(self, obj):
+        """Serialize ``obj`` to a JSON formatted ``str``."""
+        return self._encode(obj)
+
+    def loads(self, datastring):
+        """Deserialize a JSON document.
+
+        :raises: ValueError if ``datastring`` isn't valid JSON
+        """
+        # py2 decoders take utf-8 str as is, decoding it first would
+        # only copy it
+        if six.PY3 and isinstance(datastring, bytes):
+            datastring = datastring.decode('utf-8')
+        return self._decode(datastring)
+
+
+def _pick_backend():
+    for backend in _COMPATIBLE_BACKENDS:
+        if importutils.try_import(backend) is not None:
+            return backend
+    return 'json'
+
+
+def get_codec():
+    """Return the configured codec, building it on first use."""
+    global _CODEC
+    if _CODEC is None:
+        backend = CONF.json_codec
+        compact = CONF.json_compact
+        if backend == 'auto':
+            backend = _pick_backend()
+        _CODEC = JSONCodec(backend, compact=compact)
+        LOG.debug("Using %s JSON codec", backend)
+    return _CODEC
+
+
+def reset():
+    """Drop the cached codec so configuration changes take effect."""
+    global _CODEC
+    _CODEC = None
+
+
+def dumps(obj):
+    return get_codec().dumps(obj)
+
+
+def loads(datastring):
+    return get_codec().loads(datastring)
@@ -0,0 +1,149 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache clients speaking the python-memcached interface.
+
+With ``memcached_servers`` set, a ``memcache.Client`` is returned and the
+cache is shared by every process talking to those servers.  Otherwise a
+bounded in-process LRU with the same interface is used.
+"""
+
+import collections
+import threading
+
+from oslo_config import cfg
+from oslo_utils import importutils
+from oslo_utils import timeutils
+
+from oslo_log import log as logging
+
+
+memcache_opts = [
+    cfg.ListOpt('memcached_servers',
+                help='Memcached servers (host:port) used for shared caches. '
+                     'When unset an in-process cache is used.'),
+    cfg.IntOpt('memory_cache_size',
+               default=10000,
+               help='Maximum number of entries held by each in-process '
+                    'cache.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(memcache_opts)
+
+LOG = logging.getLogger(__name__)
+
+memcache = importutils.try_import('memcache')
+
+
+def get_client(memcached_servers=None, max_entries=None):
+    """Return a memcache client or an in-process replacement.
+
+    :param memcached_servers: list of host:port, defaults to the
+                              memcached_servers option
+    :param max_entries: bound of the in-process cache, defaults to the
+                        memory_cache_size option
+    """
+    servers = memcached_servers or CONF.memcached_servers
+    if servers:
+        if memcache is None:
+            LOG.warning("memcached_servers is set but python-memcached is "
+                        "not installed, using an in-process cache")
+        else:
+            return memcache.Client(servers, debug=0)
+    return LRUClient(max_entries or CONF.memory_cache_size)
+
+
+class LRUClient(object):
+    """In-process cache with the python-memcached client interface.
+
+    Entries expire after their ``time`` and the least recently used entry
+    is evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        try:
+            timeout, value = self._cache.pop(key)
+        except KeyError:
+            return None
+        if timeout and now >= timeout:
+            return None
+        # Re-inserting moves the entry to the most recently used end
+        self._cache[key] = (timeout, value)
+        return value
+
+    def _set(self, key, value, time, now):
+        self._cache.pop(key, None)
+        timeout = now + time if time else 0
+        self._cache[key] = (timeout, value)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        with self._lock:
+            return self._get(key, timeutils.utcnow_ts())
+
+    def get_multi(self, keys):
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            found = {}
+            for key in keys:
+                value = self._get(key, now)
+                if value is not None:
+                    found[key] = value
+            return found
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        with self._lock:
+            self._set(key, value, time, timeutils.utcnow_ts())
+        return True
+
+    def add(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it doesn't exist."""
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            if self._get(key, now) is not None:
+                return False
+            self._set(key, value, time, now)
+        return True
+
+    def incr(self, key, delta=1):
+        """Increments the value for a key."""
+        with self._lock:
+            now = timeutils.utcnow_ts()
+            value = self._get(key, now)
+            if value is None:
+                return None
+            new_value = int(value) + delta
+            timeout = self._cache[key][0]
+            self._cache[key] = (timeout, str(new_value))
+            return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value associated with a key."""
+        with self._lock:
+            self._cache.pop(key, None)
+        return 1
+
+    def flush_all(self):
+        with self._lock:
+            self._cache.clear()
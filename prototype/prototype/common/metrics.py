@@ -0,0 +1,269 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Runtime metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are registered in REGISTRY, and
+REGISTRY.render() returns all of them as text.  The API serves it at
+/metrics (prototype.api.metrics), and workers serve it on
+worker_metrics_port.
+
+Updating a metric takes a lock and a dict lookup.  Values that are kept
+elsewhere anyway, like pool sizes, are read by gauge callbacks only when
+the metrics are rendered.  Metrics are per process, so with several
+api_workers each worker answers for itself.
+"""
+
+import collections
+import threading
+
+import eventlet
+import eventlet.wsgi
+from oslo_config import cfg
+import six
+
+from prototype.common.i18n import _LI, _LW
+from oslo_log import log as logging
+from prototype.common import timing
+
+
+metrics_opts = [
+    cfg.StrOpt('worker_metrics_listen',
+               default='127.0.0.1',
+               help='Address the worker serves its metrics on.'),
+    cfg.IntOpt('worker_metrics_port',
+               default=0,
+               help='Port the worker serves its metrics on, at /metrics. '
+                    '0 disables it.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(metrics_opts)
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return (six.text_type(value).replace('\\', '\\\\')
+            .replace('\n', '\\n').replace('"', '\\"'))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in pairs)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, six.integer_types):
+        return str(value)
+    return repr(float(value))
+
+
+def histogram_samples(name, labelnames, buckets, values):
+    """Samples of histograms given as (labels, counts, sum, count).
+
+    ``counts`` are per bucket, with one more for the values above the
+    last bound, as kept by timing.Histogram.
+    """
+    samples = []
+    for labels, counts, total, count in values:
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + [float('inf')],
+                                       counts):
+            cumulative += bucket_count
+            samples.append((name + '_bucket', labels,
+                            ('le', _format_value(bound)), cumulative))
+        samples.append((name + '_sum', labels, None, total))
+        samples.append((name + '_count', labels, None, count))
+    return samples
+
+
+class Metric(object):
+    """A metric family, its samples labelled by ``labelnames``.
+
+    With a ``callback``, the values are read when rendering instead: the
+    callback returns a dict mapping label values to values.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if self.callback is None:
+            with self._lock:
+                return list(self._values.items())
+        try:
+            return list(self.callback().items())
+        except Exception:
+            LOG.warning(_LW("Could not read the %s metric"), self.name,
+                        exc_info=True)
+            return []
+
+    def samples(self):
+        """Return (name, label values, extra label, value) tuples."""
+        return [(self.name, labels, None, value)
+                for labels, value in self._read()]
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        for name, labels, extra, value in self.samples():
+            lines.append('%s%s %s' % (
+                name, _format_labels(self.labelnames, labels, extra),
+                _format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=timing.BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, labels=()):
+        with self._lock:
+            histogram = self._values.get(labels)
+            if histogram is None:
+                histogram = self._values[labels] = timing.Histogram(
+                    self.buckets)
+            histogram.observe(value)
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(h.counts), h.sum, h.count)
+                      for labels, h in self._values.items()]
+        return histogram_samples(self.name, self.labelnames, self.buckets,
+                                 values)
+
+
+class StageHistograms(Metric):
+    """The per-route stage timings of timing.RouteHistograms."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, histograms):
+        super(StageHistograms, self).__init__(name, documentation,
+                                              ('route', 'stage'))
+        self.histograms = histograms
+
+    def samples(self):
+        values = [(key, counts, total, count) for key, (counts, total, count)
+                  in sorted(self.histograms.snapshot().items())]
+        return histogram_samples(self.name, self.labelnames,
+                                 self.histograms.buckets, values)
+
+
+class Registry(object):
+    """The metrics of a process, by name."""
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add ``metric`` and return it, or the one of that name."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+REGISTRY = Registry()
+
+REGISTRY.register(StageHistograms(
+    'prototype_api_request_stage_seconds',
+    'Time API requests spent in each stage, total included.',
+    timing.HISTOGRAMS))
+
+
+def app(environ, start_response):
+    """WSGI app answering with the metrics of REGISTRY."""
+    body = REGISTRY.render()
+    start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def _listener_app(environ, start_response):
+    if environ['PATH_INFO'] != '/metrics':
+        start_response('404 Not Found', [('Content-Length', '0')])
+        return []
+    return app(environ, start_response)
+
+
+def serve(host, port):
+    """Serve the metrics at /metrics on host:port from a greenthread.
+
+    Returns the greenthread, killing it stops serving.
+    """
+    sock = eventlet.listen((host, port))
+    LOG.info(_LI("Serving metrics on %(host)s:%(port)s"),
+             {'host': host, 'port': sock.getsockname()[1]})
+    return eventlet.spawn(eventlet.wsgi.server, sock, _listener_app,
+                          log_output=False)
@@ -1,7 +1,11 @@
 import oslo_messaging as messaging
-from oslo_serialization import jsonutils
 from oslo_config import cfg
 from oslo_context import context as ctx
+from oslo_serialization import jsonutils
+
+from prototype.common import metrics
+from prototype.common import timing
+from prototype.common import tracing
 
 
 TRANSPORT = None
@@ -29,22 +33,107 @@ class RequestContextSerializer(messaging.Serializer):
         return self._base.deserialize_entity(context, entity)
 
     def serialize_context(self, context):
-        return context.to_dict()
+        return tracing.inject(context.to_dict())
 
     def deserialize_context(self, context):
-        return ctx.RequestContext.from_dict(context)
+        context = dict(context)
+        trace_id, parent_id = tracing.extract(context)
+        request_context = ctx.RequestContext.from_dict(context)
+        if trace_id:
+            # Picked up by TracedEndpoint
+            request_context.trace = (trace_id, parent_id)
+        return request_context
+
+
+class JsonPayloadSerializer(messaging.NoOpSerializer):
+    """Convert payloads to JSON primitives.
+
+    Used by default for RPC clients and servers, so arguments and
+    results the driver can't encode (datetimes, model objects) are
+    converted before they are sent.
+    """
+
+    @staticmethod
+    def serialize_entity(context, entity):
+        return jsonutils.to_primitive(entity, convert_instances=True)
+
+
+_CLIENT_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'prototype_rpc_client_seconds',
+    'Time RPC calls and casts took to return, failed ones included.',
+    ('method', 'kind')))
+
+
+class TimedClient(object):
+    """RPC client timing its calls and casts.
+
+    The time goes to the rpc stage of the request being served and to
+    the prototype_rpc_client_seconds histogram.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def prepare(self, *args, **kwargs):
+        return TimedClient(self._client.prepare(*args, **kwargs))
+
+    def _timed(self, kind, ctxt, method, **kwargs):
+        begin = timing.now()
+        try:
+            with timing.stage('rpc'):
+                with tracing.span('rpc.%s %s' % (kind, method)):
+                    return getattr(self._client, kind)(ctxt, method,
+                                                       **kwargs)
+        finally:
+            _CLIENT_SECONDS.observe(timing.now() - begin, (method, kind))
+
+    def call(self, ctxt, method, **kwargs):
+        return self._timed('call', ctxt, method, **kwargs)
+
+    def cast(self, ctxt, method, **kwargs):
+        return self._timed('cast', ctxt, method, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
 
 def get_client(target, version_cap=None, serializer=None):
     assert TRANSPORT is not None
+    if serializer is None:
+        serializer = JsonPayloadSerializer()
     serializer = RequestContextSerializer(serializer)
-    return messaging.RPCClient(TRANSPORT,
-                               target,
-                               version_cap=version_cap,
-                               serializer=serializer)
+    return TimedClient(messaging.RPCClient(TRANSPORT,
+                                           target,
+                                           version_cap=version_cap,
+                                           serializer=serializer))
                                
+
+class TracedEndpoint(object):
+    """RPC endpoint running its methods in spans of the caller's trace."""
+
+    def __init__(self, endpoint):
+        self._endpoint = endpoint
+
+    def __getattr__(self, name):
+        attr = getattr(self._endpoint, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def traced(ctxt, *args, **kwargs):
+            trace = getattr(ctxt, 'trace', None)
+            if trace is None:
+                return attr(ctxt, *args, **kwargs)
+            with tracing.span('rpc.server %s' % name, trace[0], trace[1]):
+                return attr(ctxt, *args, **kwargs)
+        return traced
+
+
 def get_server(target, endpoints, serializer=None):
     assert TRANSPORT is not None
+    if serializer is None:
+        serializer = JsonPayloadSerializer()
     serializer = RequestContextSerializer(serializer)
+    endpoints = [TracedEndpoint(endpoint) for endpoint in endpoints]
     return messaging.get_rpc_server(TRANSPORT,
                                     target,
                                     endpoints,
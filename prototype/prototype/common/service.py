@@ -17,9 +17,16 @@
 
 """Generic Node base class for all workers that run on hosts."""
 
+import errno
+import fcntl
+import gc
 import os
 import random
+import signal
 import sys
+import time
+
+import eventlet
 
 from oslo_config import cfg
 import oslo_messaging as messaging
@@ -29,8 +36,9 @@ from oslo_concurrency import processutils
 from prototype import db
 from oslo_context import context
 from prototype.common import exception
-from prototype.common.i18n import _, _LE, _LW
+from prototype.common.i18n import _, _LE, _LI, _LW
 from oslo_log import log as logging
+from prototype.common import metrics
 from prototype.openstack.common import service
 from prototype.common import rpc
 from prototype.common import utils
@@ -74,6 +82,17 @@ service_opts = [
     cfg.IntOpt('api_workers',
                help='Number of workers for OpenStack API service. The default '
                     'will be the number of CPUs available.'),
+    cfg.BoolOpt('api_preload',
+                default=False,
+                help='Import, load and warm every enabled API in the parent '
+                     'process and freeze the heap before forking the API '
+                     'workers, so the workers share those pages '
+                     'copy-on-write. Load times and per worker memory use '
+                     'are logged.'),
+    cfg.ListOpt('api_preload_modules',
+                default=['prototype.worker.rpcapi'],
+                help='Modules imported lazily by the API that api_preload '
+                     'imports up front.'),
     cfg.IntOpt('service_down_time',
                default=60,
                help='Maximum time since last check-in for up service'),
@@ -187,6 +206,7 @@ class RPCService(service.Service):
         self.periodic_interval_max = periodic_interval_max
         self.saved_args, self.saved_kwargs = args, kwargs
         self.backdoor_port = None
+        self.metrics_server = None
 
     def start(self):
         verstr = version.version_string_with_package()
@@ -217,6 +237,10 @@ class RPCService(service.Service):
         self.rpcserver = rpc.get_server(target, endpoints)
         self.rpcserver.start()
 
+        if CONF.worker_metrics_port and self.metrics_server is None:
+            self.metrics_server = metrics.serve(CONF.worker_metrics_listen,
+                                                CONF.worker_metrics_port)
+
         self.manager.post_start_hook()
 
 
@@ -292,6 +316,10 @@ class RPCService(service.Service):
         except Exception:
             pass
 
+        if self.metrics_server is not None:
+            self.metrics_server.kill()
+            self.metrics_server = None
+
         try:
             self.manager.cleanup_host()
         except Exception:
@@ -331,7 +359,12 @@ class WSGIService(object):
         self.name = name
         self.manager = self._get_manager()
         self.loader = loader or wsgi.Loader()
+        start = time.time()
         self.app = self.loader.load_app(name)
+        if CONF.api_preload:
+            wsgi.warm_app(self.app)
+            LOG.info(_LI("Loaded %(name)s in %(seconds).3f seconds"),
+                     {'name': name, 'seconds': time.time() - start})
         # inherit all compute_api worker counts from osapi_compute
         if name.startswith('openstack_compute_api'):
             wname = 'osapi_compute'
@@ -360,7 +393,7 @@ class WSGIService(object):
         self.backdoor_port = None
 
     def reset(self):
-        """Reset server greenpool size to default.
+        """Apply reloaded configuration to the WSGI server.
 
         :returns: None
 
@@ -405,6 +438,8 @@ class WSGIService(object):
         self.server.start()
         if self.manager:
             self.manager.post_start_hook()
+        if CONF.api_preload:
+            _log_memory_usage(_LI("%s worker started") % self.name)
 
     def stop(self):
         """Stop serving this API.
@@ -412,6 +447,8 @@ class WSGIService(object):
         :returns: None
 
         """
+        if CONF.api_preload:
+            _log_memory_usage(_LI("%s worker stopping") % self.name)
         self.server.stop()
 
     def wait(self):
@@ -423,8 +460,169 @@ class WSGIService(object):
         self.server.wait()
 
 
+# Set for a master started by a reload
+_OLD_WORKERS_ENV = 'PROTOTYPE_OLD_WORKERS'
+_OLD_PIPE_ENV = 'PROTOTYPE_OLD_PIPE'
+
+# Extra seconds given to old workers past wsgi_drain_timeout
+_DRAIN_GRACE = 5
+
+
+def _set_inheritable(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+
+
+class ProcessLauncher(service.ProcessLauncher):
+    """Process launcher able to reload without refusing connections.
+
+    On SIGUSR2 the master re-executes itself, handing its listening
+    sockets to the new master through the environment.  The new master,
+    running new code and configuration, forks a new generation of workers
+    and then asks the old generation to finish the requests they are
+    serving and exit; old workers stop accepting but keep serving until
+    wsgi_drain_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ProcessLauncher, self).__init__(*args, **kwargs)
+        self.reloading = False
+        self.launched = []
+        self.old_workers = set(
+            int(pid) for pid in
+            os.environ.pop(_OLD_WORKERS_ENV, '').split(',') if pid)
+        old_pipe = os.environ.pop(_OLD_PIPE_ENV, None)
+        self.old_pipe = int(old_pipe) if old_pipe else None
+        signal.signal(signal.SIGUSR2, self._handle_reload)
+
+    def _handle_reload(self, signo, frame):
+        self.reloading = True
+        self.running = False
+
+    def _child_process_handle_signal(self):
+        super(ProcessLauncher, self)._child_process_handle_signal()
+        # Only the master reloads
+        signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+
+    def launch_service(self, service, workers=1):
+        self.launched.append(service)
+        super(ProcessLauncher, self).launch_service(service, workers)
+
+    def _retire_old_workers(self):
+        LOG.info(_LI("Draining %d workers of the previous generation"),
+                 len(self.old_workers))
+        for pid in self.old_workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    raise
+        eventlet.spawn_after(CONF.wsgi_drain_timeout + _DRAIN_GRACE,
+                             self._kill_old_workers)
+
+    def _kill_old_workers(self):
+        for pid in self.old_workers:
+            LOG.warning(_LW("Old worker %d did not drain in time, "
+                            "killing it"), pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    raise
+
+    def _wait_child(self):
+        if self.old_workers:
+            for pid in list(self.old_workers):
+                try:
+                    done, _status = os.waitpid(pid, os.WNOHANG)
+                except OSError as exc:
+                    if exc.errno != errno.ECHILD:
+                        raise
+                    done = pid
+                if done:
+                    LOG.info(_LI("Old worker %d exited"), pid)
+                    self.old_workers.discard(pid)
+            if not self.old_workers and self.old_pipe is not None:
+                # Nothing left watching the previous master's pipe
+                os.close(self.old_pipe)
+                self.old_pipe = None
+        return super(ProcessLauncher, self)._wait_child()
+
+    def stop(self):
+        for pid in self.old_workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    raise
+        super(ProcessLauncher, self).stop()
+
+    def _reexec(self):
+        listen_fds = []
+        for service in self.launched:
+            server = getattr(service, 'server', None)
+            if server is not None:
+                listen_fds.append('%s=%d' % server.handoff())
+        # Old workers exit if this pipe closes, keep it open through the
+        # exec until they have drained.
+        _set_inheritable(self.writepipe)
+        workers = list(self.children) + list(self.old_workers)
+        os.environ[wsgi.LISTEN_FDS_ENV] = ','.join(listen_fds)
+        os.environ[_OLD_WORKERS_ENV] = ','.join(str(pid) for pid in workers)
+        os.environ[_OLD_PIPE_ENV] = str(self.writepipe)
+        LOG.info(_LI("Reloading, handing over %s"), ', '.join(listen_fds))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def wait(self):
+        """Wait on the workers, reloading on SIGUSR2."""
+        wsgi.close_inherited_sockets()
+        if self.old_workers:
+            self._retire_old_workers()
+        while True:
+            super(ProcessLauncher, self).wait()
+            if not self.reloading:
+                return
+            self.reloading = False
+            try:
+                self._reexec()
+            except OSError:
+                LOG.exception(_LE("Reload failed, carrying on"))
+                for key in (wsgi.LISTEN_FDS_ENV, _OLD_WORKERS_ENV,
+                            _OLD_PIPE_ENV):
+                    os.environ.pop(key, None)
+                self.running = True
+
+
 def process_launcher():
-    return service.ProcessLauncher()
+    return ProcessLauncher()
+
+
+def _log_memory_usage(what):
+    usage = utils.memory_usage()
+    if usage:
+        LOG.info(_LI("%(what)s, pid %(pid)d memory KiB: %(usage)s"),
+                 {'what': what, 'pid': os.getpid(),
+                  'usage': ', '.join('%s %d' % item
+                                     for item in sorted(usage.items()))})
+
+
+def preload():
+    """Import the modules the API would import lazily."""
+    for module in CONF.api_preload_modules:
+        importutils.import_module(module)
+
+
+def freeze():
+    """Prepare the loaded process to be forked.
+
+    Collects garbage now, so the workers don't each run a collection that
+    writes to every object inherited from the parent, and on Pythons that
+    support it moves the survivors out of the collector's reach.
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    _log_memory_usage(_LI("Preloaded parent"))
 
 
 # NOTE(vish): the global launcher is to maintain the existing
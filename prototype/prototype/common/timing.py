@@ -0,0 +1,193 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-request stage timers.
+
+The fault wrapper starts a RequestTimer for every API request.  The timer
+is kept in the environ, and in a thread local for code that doesn't have
+the request at hand, like RPC clients and DB queries.  Stages accumulate,
+so a stage entered several times reports its total, and stages may nest:
+the controller stage includes the rpc and db time it caused.
+
+The timings of a finished request go to the Server-Timing header when
+api_server_timing is set, to the access log through %(timings)s in
+wsgi_log_format, and to the per-route histograms in HISTOGRAMS.
+"""
+
+import bisect
+import collections
+import contextlib
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_utils import importutils
+
+monotonic = importutils.try_import('monotonic')
+
+
+timing_opts = [
+    cfg.BoolOpt('api_server_timing',
+                default=False,
+                help='Send the stage timings of each API request in a '
+                     'Server-Timing response header.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(timing_opts)
+
+if hasattr(time, 'monotonic'):
+    now = time.monotonic
+elif monotonic is not None:
+    now = monotonic.monotonic
+else:
+    now = time.time
+
+# WSGI environ keys of the request timer and of the matched route
+TIMER_ENV = 'prototype.timer'
+ROUTE_ENV = 'prototype.route'
+
+# Upper bounds in seconds of the histogram buckets, the last one being
+# everything slower
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """Monotonic stage timings of one request."""
+
+    def __init__(self):
+        self.started = now()
+        self.stages = collections.OrderedDict()
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        begin = now()
+        try:
+            yield
+        finally:
+            self.add(name, now() - begin)
+
+    def elapsed(self):
+        return now() - self.started
+
+    def server_timing(self):
+        """The stages as a Server-Timing header value."""
+        return ', '.join('%s;dur=%.2f' % (name, seconds * 1000)
+                         for name, seconds in self.stages.items())
+
+    def __str__(self):
+        return ' '.join('%s=%.1fms' % (name, seconds * 1000)
+                        for name, seconds in self.stages.items())
+
+
+def start(environ):
+    """Return the timer of a request, starting it if needed."""
+    timer = environ.get(TIMER_ENV)
+    if timer is None:
+        timer = environ[TIMER_ENV] = RequestTimer()
+    _local.timer = timer
+    return timer
+
+
+def current():
+    """The timer of the request being served by this thread, or None."""
+    return getattr(_local, 'timer', None)
+
+
+def finish():
+    """Forget the current timer once its request is answered.
+
+    Server threads are reused, so a finished timer must not collect the
+    stages of whatever the thread runs next.  It is kept aside for the
+    access log, see pop_finished.
+    """
+    _local.finished = getattr(_local, 'timer', None)
+    _local.timer = None
+
+
+def pop_finished():
+    """Return the timer of the last request this thread answered."""
+    timer = getattr(_local, 'finished', None)
+    _local.finished = None
+    return timer
+
+
+@contextlib.contextmanager
+def stage(name, environ=None):
+    """Time a stage of the request of ``environ``, or the current one.
+
+    Does nothing outside a timed request.
+    """
+    if environ is not None:
+        timer = environ.get(TIMER_ENV)
+    else:
+        timer = current()
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
+
+
+class Histogram(object):
+    """Counts of observed durations per bucket, with their sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class RouteHistograms(object):
+    """Histograms of the stage timings of each route."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, timer, total):
+        with self._lock:
+            for name, seconds in list(timer.stages.items()) + [('total',
+                                                                total)]:
+                histogram = self._histograms.get((route, name))
+                if histogram is None:
+                    histogram = Histogram(self.buckets)
+                    self._histograms[(route, name)] = histogram
+                histogram.observe(seconds)
+
+    def snapshot(self):
+        """Return {(route, stage): (bucket counts, sum, count)}."""
+        with self._lock:
+            return dict((key, (list(h.counts), h.sum, h.count))
+                        for key, h in self._histograms.items())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+HISTOGRAMS = RouteHistograms()
@@ -0,0 +1,235 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Lightweight trace spans.
+
+The fault wrapper opens the root span of each API request, joining the
+trace of an X-Trace-Id header when there is one.  Spans opened while it
+runs are its children: RPC calls and casts, and DB queries.  The trace
+and span ids travel to the RPC server in the serialized request context,
+where the endpoint call gets a span in the same trace.
+
+Finished spans go to the exporter picked by tracing_exporter: "ring"
+keeps the last tracing_ring_size spans in memory, "file" appends them as
+JSON lines to tracing_file.  With no exporter, spans cost a function
+call.
+"""
+
+import collections
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_utils import importutils
+
+from prototype.common import timing
+
+
+tracing_opts = [
+    cfg.StrOpt('tracing_exporter',
+               default='none',
+               choices=('none', 'ring', 'file'),
+               help='Where finished trace spans go: nowhere, a ring buffer '
+                    'of tracing_ring_size spans in memory, or tracing_file '
+                    'as JSON lines.'),
+    cfg.IntOpt('tracing_ring_size',
+               default=10000,
+               help='Number of spans kept by the ring buffer exporter.'),
+    cfg.StrOpt('tracing_file',
+               help='File the file exporter appends spans to.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(tracing_opts)
+
+TRACE_HEADER = 'X-Trace-Id'
+_TRACE_ID_RE = re.compile('^[0-9a-f]{1,32}$')
+
+# Keys of the trace ids in a serialized request context
+TRACE_ID_KEY = 'trace_id'
+PARENT_ID_KEY = 'trace_parent_id'
+
+_EXPORTERS = {
+    'ring': 'prototype.common.tracing.RingBufferExporter',
+    'file': 'prototype.common.tracing.FileExporter',
+}
+
+_local = threading.local()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+_random = random.SystemRandom()
+
+
+def _new_id(bits):
+    return '%0*x' % (bits // 4, _random.getrandbits(bits))
+
+
+class Span(object):
+    """A timed operation of a trace."""
+
+    def __init__(self, name, trace_id, parent_id=None, tags=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.tags = tags or {}
+        self.start = time.time()
+        self.duration = None
+        self._begin = timing.now()
+
+    def to_dict(self):
+        return {'name': self.name,
+                'trace_id': self.trace_id,
+                'span_id': self.span_id,
+                'parent_id': self.parent_id,
+                'start': self.start,
+                'duration': self.duration,
+                'tags': self.tags}
+
+
+class RingBufferExporter(object):
+    """Keeps the last finished spans in memory."""
+
+    def __init__(self):
+        self._spans = collections.deque(maxlen=CONF.tracing_ring_size)
+
+    def export(self, span):
+        self._spans.append(span.to_dict())
+
+    def spans(self, trace_id=None):
+        return [span for span in list(self._spans)
+                if trace_id is None or span['trace_id'] == trace_id]
+
+
+class FileExporter(object):
+    """Appends finished spans to a file as JSON lines."""
+
+    def __init__(self):
+        if not CONF.tracing_file:
+            raise ValueError('tracing_file is needed by the file exporter')
+        self._file = open(CONF.tracing_file, 'a')
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+def get_exporter():
+    """The configured exporter, or None."""
+    global _exporter
+    if _exporter is None and CONF.tracing_exporter != 'none':
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = importutils.import_class(
+                    _EXPORTERS[CONF.tracing_exporter])()
+    return _exporter
+
+
+def trace_id_from_header(value):
+    """The trace id an X-Trace-Id header asks to join, or None."""
+    value = (value or '').lower()
+    return value if _TRACE_ID_RE.match(value) else None
+
+
+def current():
+    """The innermost open span of this thread, or None."""
+    spans = getattr(_local, 'spans', None)
+    return spans[-1] if spans else None
+
+
+def start_span(name, trace_id=None, parent_id=None, root=False, **tags):
+    """Open a span and return it, or None when not tracing.
+
+    The span is a child of the given trace and parent, or else of the
+    current span.  Without either, a new trace is only started for a
+    ``root`` span.
+    """
+    if get_exporter() is None:
+        return None
+    if trace_id is None:
+        parent = current()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        elif root:
+            trace_id = _new_id(128)
+        else:
+            return None
+    span = Span(name, trace_id, parent_id, tags)
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        spans = _local.spans = []
+    spans.append(span)
+    return span
+
+
+def detach_span(span):
+    """Take ``span`` off this thread, leaving it open.
+
+    For a span finished elsewhere, e.g. once a streamed response body is
+    sent: later spans of this thread are no longer its children.
+    """
+    spans = getattr(_local, 'spans', None)
+    if spans and span in spans:
+        # Also drops children left open, e.g. by a failed query
+        del spans[spans.index(span):]
+
+
+def finish_span(span, error=None):
+    """Close ``span`` and hand it to the exporter."""
+    span.duration = timing.now() - span._begin
+    if error is not None:
+        span.tags['error'] = error
+    detach_span(span)
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.export(span)
+
+
+@contextlib.contextmanager
+def span(name, trace_id=None, parent_id=None, root=False, **tags):
+    """Run the block in a span, see start_span."""
+    opened = start_span(name, trace_id, parent_id, root, **tags)
+    if opened is None:
+        yield None
+        return
+    try:
+        yield opened
+    except Exception as e:
+        finish_span(opened, error=e.__class__.__name__)
+        raise
+    finish_span(opened)
+
+
+def inject(context_dict):
+    """Add the current trace and span ids to a serialized context."""
+    current_span = current()
+    if current_span is not None:
+        context_dict[TRACE_ID_KEY] = current_span.trace_id
+        context_dict[PARENT_ID_KEY] = current_span.span_id
+    return context_dict
+
+
+def extract(context_dict):
+    """Remove the trace ids from a serialized context and return them."""
+    return (context_dict.pop(TRACE_ID_KEY, None),
+            context_dict.pop(PARENT_ID_KEY, None))
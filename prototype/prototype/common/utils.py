@@ -153,6 +153,55 @@ def utf8(value):
         return value.encode('utf-8')
     assert isinstance(value, str)
     return value
+
+
+def memory_usage():
+    """Return the memory usage of this process in KiB.
+
+    rss is always present on Linux.  pss (proportional set size) and
+    private, which counts pages no longer shared with the parent after a
+    fork, need /proc/self/smaps_rollup (Linux 4.14). Returns an empty dict
+    when /proc is not available.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                field, _sep, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    usage[field] = int(value.split()[0])
+    except (IOError, OSError):
+        pass
+    if usage:
+        return {'rss': usage.get('Rss', 0),
+                'pss': usage.get('Pss', 0),
+                'shared': (usage.get('Shared_Clean', 0) +
+                           usage.get('Shared_Dirty', 0)),
+                'private': (usage.get('Private_Clean', 0) +
+                            usage.get('Private_Dirty', 0))}
+
+    try:
+        with open('/proc/self/statm') as f:
+            pages = [int(v) for v in f.read().split()]
+    except (IOError, OSError):
+        return {}
+    page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+    return {'rss': pages[1] * page_kb,
+            'shared': pages[2] * page_kb,
+            'private': (pages[1] - pages[2]) * page_kb}
+
+
+def walk_class_hierarchy(clazz, encountered=None):
+    """Walk class hierarchy, yielding most derived classes first."""
+    if not encountered:
+        encountered = []
+    for subclass in clazz.__subclasses__():
+        if subclass not in encountered:
+            encountered.append(subclass)
+            # drill down to leaves first
+            for subsubclass in walk_class_hierarchy(subclass, encountered):
+                yield subsubclass
+            yield subclass
     
 
 def _get_root_helper():
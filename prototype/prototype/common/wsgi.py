@@ -19,25 +19,37 @@
 
 from __future__ import print_function
 
+import fcntl
+import os
 import os.path
 import socket
 import ssl
 import sys
+import threading
+import time
+import weakref
 
 import eventlet
 import eventlet.wsgi
+from eventlet.green import socket as green_socket
 import greenlet
 from oslo_config import cfg
 from oslo_utils import excutils
+from oslo_utils import importutils
 from paste import deploy
 import routes.middleware
+import six
 import webob.dec
 import webob.exc
 
 from prototype.common import exception
-from prototype.common.i18n import _, _LE, _LI
+from prototype.common.i18n import _, _LE, _LI, _LW
+from prototype.common import jsoncodec
+from prototype.common import metrics
+from prototype.common import timing
 from oslo_log import log as logging
 from oslo_log import loggers
+from prototype.openstack.common import loopingcall
 
 
 wsgi_opts = [
@@ -46,11 +58,12 @@ wsgi_opts = [
                help='File name for the paste.deploy config for prototype-api'),
     cfg.StrOpt('wsgi_log_format',
             default='%(client_ip)s "%(request_line)s" status: %(status_code)s'
-                    ' len: %(body_length)s time: %(wall_seconds).7f',
+                    ' len: %(body_length)s time: %(wall_seconds).7f'
+                    ' stages: %(timings)s',
             help='A python format string that is used as the template to '
                  'generate log lines. The following values can be formatted '
                  'into it: client_ip, date_time, request_line, status_code, '
-                 'body_length, wall_seconds.'),
+                 'body_length, wall_seconds, timings.'),
     cfg.StrOpt('ssl_ca_file',
                help="CA certificate file to use to verify "
                     "connecting clients"),
@@ -62,9 +75,23 @@ wsgi_opts = [
                default=600,
                help="Sets the value of TCP_KEEPIDLE in seconds for each "
                     "server socket. Not supported on OS X."),
+    cfg.StrOpt('wsgi_server_engine',
+               default='eventlet',
+               choices=('eventlet', 'asyncio'),
+               help="Server engine of the API. eventlet serves each "
+                    "connection on a greenthread. asyncio parses HTTP on "
+                    "an asyncio event loop and runs the application on "
+                    "wsgi_thread_pool_size native threads; it needs "
+                    "eventlet monkey patching disabled by starting the "
+                    "API with PROTOTYPE_EVENTLET_MONKEY_PATCH=0, and "
+                    "trollius on Python 2."),
     cfg.IntOpt('wsgi_default_pool_size',
                default=1000,
                help="Size of the pool of greenthreads used by wsgi"),
+    cfg.IntOpt('wsgi_thread_pool_size',
+               default=64,
+               help="Number of threads running the application with the "
+                    "asyncio server engine."),
     cfg.IntOpt('max_header_line',
                default=16384,
                help="Maximum line size of message headers to be accepted. "
@@ -80,20 +107,461 @@ wsgi_opts = [
                     "If an incoming connection is idle for this number of "
                     "seconds it will be closed. A value of '0' means "
                     "wait forever."),
+    cfg.IntOpt('wsgi_max_concurrent_requests',
+               default=900,
+               help="Maximum number of requests each WSGI server processes "
+                    "at once, further requests are rejected with 503. Must "
+                    "be lower than wsgi_default_pool_size so there are "
+                    "greenthreads left to reject them. 0 means no limit."),
+    cfg.FloatOpt('wsgi_max_queue_latency',
+                 default=1.0,
+                 help="Reject requests with 503 while the average time "
+                      "between accepting a connection and starting its "
+                      "request exceeds this many seconds. 0 disables it."),
+    cfg.IntOpt('wsgi_shed_retry_after',
+               default=1,
+               help="Retry-After in seconds sent with load shedding 503s."),
+    cfg.StrOpt('wsgi_health_check_path',
+               default='/healthcheck',
+               help="Path answered by the WSGI server itself and never "
+                    "rejected by admission control."),
+    cfg.BoolOpt('wsgi_reuse_port',
+                default=False,
+                help="Give every API worker its own listening socket bound "
+                     "with SO_REUSEPORT, so the kernel balances new "
+                     "connections between workers instead of all of them "
+                     "waking up to accept from one shared socket. Needs "
+                     "Linux 3.9 or later."),
+    cfg.IntOpt('wsgi_drain_timeout',
+               default=60,
+               help="Seconds a stopping server waits for requests in "
+                    "progress to complete. 0 means wait forever."),
+    cfg.BoolOpt('wsgi_pool_autotune',
+                default=False,
+                help="Adjust the greenthread pool size at runtime to keep "
+                     "the queue latency near wsgi_target_queue_latency."),
+    cfg.FloatOpt('wsgi_target_queue_latency',
+                 default=0.05,
+                 help="Queue latency in seconds the pool size auto-tuning "
+                      "aims for."),
+    cfg.IntOpt('wsgi_pool_autotune_interval',
+               default=10,
+               help="Seconds between pool size auto-tuning adjustments."),
+    cfg.IntOpt('wsgi_pool_min_size',
+               default=100,
+               help="Smallest pool size auto-tuning may pick."),
+    cfg.IntOpt('wsgi_pool_max_size',
+               default=4000,
+               help="Largest pool size auto-tuning may pick."),
     ]
 CONF = cfg.CONF
 CONF.register_opts(wsgi_opts)
 
 LOG = logging.getLogger(__name__)
 
+# Weight of the newest sample in the queue latency moving average
+_LATENCY_DECAY = 0.1
+
+# Seconds for the queue latency average to halve without new samples.
+# Only new connections are sampled, requests on keepalive connections
+# are not, so without this the average would stay up after a burst.
+_LATENCY_HALF_LIFE = 2.0
+
+# Not defined by every python build, the Linux value is stable
+_SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT',
+                        15 if sys.platform.startswith('linux') else None)
+
+# Listening sockets handed over by a previous master on reload, as
+# host:port=fd pairs
+LISTEN_FDS_ENV = 'PROTOTYPE_LISTEN_FDS'
+
+# WSGI environ key of the time a request was queued to run, set by
+# engines that do not run each connection on its own greenthread
+QUEUED_AT_ENV = 'prototype.queued_at'
+
+# WSGI environ key of a weak reference to the request shared by the layers
+# of a collapsed pipeline, see SharedRequest
+SHARED_REQUEST_ENV = 'prototype.request'
+
+# WSGI environ key of the time a Router started matching the request
+_ROUTE_STARTED_ENV = 'prototype.route_started'
+
+# Servers of this process by name, for the metrics
+_SERVERS = weakref.WeakValueDictionary()
+
+# Pool size auto-tuning steps
+_AUTOTUNE_GROW = 1.25
+_AUTOTUNE_SHRINK = 0.9
+
+
+class AcceptTimingPool(eventlet.GreenPool):
+    """GreenPool recording when each connection was accepted.
+
+    eventlet.wsgi.server spawns a greenthread right after accepting a
+    connection, the time it takes that greenthread to reach the
+    application is how long the request was queued in this process.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AcceptTimingPool, self).__init__(*args, **kwargs)
+        self.accepted = 0
+
+    def spawn(self, function, *args, **kwargs):
+        accepted_at = time.time()
+        self.accepted += 1
+
+        def _run(*args, **kwargs):
+            eventlet.getcurrent().accepted_at = accepted_at
+            return function(*args, **kwargs)
+        return super(AcceptTimingPool, self).spawn(_run, *args, **kwargs)
+
+
+class AccessLogFormat(str):
+    """wsgi_log_format filling in the stage timings of the logged request.
+
+    eventlet logs a request from the greenthread that served it, once the
+    response is sent, so the timer is the one this thread last finished.
+    """
+
+    def __mod__(self, values):
+        values = dict(values, timings=timing.pop_finished() or '-')
+        return str.__mod__(self, values)
+
+
+class DrainingHttpProtocol(eventlet.wsgi.HttpProtocol):
+    """HttpProtocol telling eventlet which connections are mid-request.
+
+    eventlet closes connections it believes idle when the server stops,
+    but not every release marks a connection busy while it handles a
+    request, which closes requests in progress too.  A new connection
+    counts as busy until its first response is sent, its request may
+    already be waiting to be read.
+    """
+
+    def _set_state(self, old, new):
+        conn_state = getattr(self, 'conn_state', None)
+        if conn_state is not None and conn_state[2] == old:
+            conn_state[2] = new
+
+    def setup(self):
+        self._set_state('idle', 'request')
+        eventlet.wsgi.HttpProtocol.setup(self)
+
+    def handle_one_response(self):
+        self._set_state('idle', 'request')
+        try:
+            return eventlet.wsgi.HttpProtocol.handle_one_response(self)
+        finally:
+            self._set_state('request', 'idle')
+
+
+_INHERITED_FDS = None
+
+
+def _take_inherited_fd(key):
+    """Return the handed over fd listening on ``key`` (host:port)."""
+    global _INHERITED_FDS
+    if _INHERITED_FDS is None:
+        _INHERITED_FDS = {}
+        for item in os.environ.pop(LISTEN_FDS_ENV, '').split(','):
+            if item:
+                fd_key, _sep, fd = item.rpartition('=')
+                _INHERITED_FDS[fd_key] = int(fd)
+    return _INHERITED_FDS.pop(key, None)
+
+
+def close_inherited_sockets():
+    """Close handed over sockets no server took, e.g. after a port change.
+
+    Connections the kernel queued on them are refused.
+    """
+    for key, fd in (_INHERITED_FDS or {}).items():
+        LOG.warning(_LW("Closing unused inherited socket for %s"), key)
+        os.close(fd)
+    if _INHERITED_FDS:
+        _INHERITED_FDS.clear()
+
+
+class _RequestIterator(object):
+    """Hold an admission slot until the response has been sent.
+
+    Has no __len__: eventlet.wsgi measures a body that has one, without a
+    Content-Length, by consuming it, which would empty a generator.
+    """
+
+    def __init__(self, app_iter, release):
+        self._app_iter = app_iter
+        self._release = release
+
+    def __iter__(self):
+        return iter(self._app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self._app_iter, 'close'):
+                self._app_iter.close()
+        finally:
+            self._release()
+
+
+class _SizedRequestIterator(_RequestIterator):
+    """_RequestIterator of a body with a length, like a list of chunks."""
+
+    def __len__(self):
+        return len(self._app_iter)
+
+
+class AdmissionController(object):
+    """WSGI wrapper rejecting load early instead of queueing it.
+
+    Requests get a 503 with Retry-After when max_requests are already in
+    progress or while the moving average of their queue latency is above
+    max_queue_latency.  The health check path is always answered.
+    """
+
+    def __init__(self, app, max_requests=0, max_queue_latency=0,
+                 retry_after=1, health_check_path=None, pool=None):
+        self.app = app
+        self.pool = pool
+        self.max_requests = max_requests
+        self.max_queue_latency = max_queue_latency
+        self.retry_after = retry_after
+        self.health_check_path = health_check_path
+        self.in_flight = 0
+        self._latency = 0.0
+        self._latency_at = time.time()
+        self.admitted = 0
+        self.rejected = 0
+        # Engines may run the application on native threads
+        self._lock = threading.Lock()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def queue_latency(self):
+        """Moving average of the queue latency, decayed to now."""
+        elapsed = max(0.0, time.time() - self._latency_at)
+        return self._latency * 0.5 ** (elapsed / _LATENCY_HALF_LIFE)
+
+    def _observe_queue_latency(self, environ):
+        accepted_at = environ.get(QUEUED_AT_ENV)
+        if accepted_at is None:
+            current = eventlet.getcurrent()
+            accepted_at = getattr(current, 'accepted_at', None)
+            if accepted_at is None:
+                return
+            # Only the first request of a connection was queued, later
+            # ones on the same keepalive connection were not.
+            current.accepted_at = None
+        now = time.time()
+        average = self.queue_latency
+        self._latency = average + _LATENCY_DECAY * (now - accepted_at -
+                                                    average)
+        self._latency_at = now
+
+    def _overloaded(self):
+        if self.max_requests and self.in_flight >= self.max_requests:
+            return True
+        return bool(self.max_queue_latency and
+                    self.queue_latency > self.max_queue_latency)
+
+    def _health_check(self, start_response):
+        # The per-process counters show how connections are spread over
+        # the API workers.
+        accepted = getattr(self.pool, 'accepted', 0)
+        body = ('{"status": "OK", "pid": %d, "accepted": %d, '
+                '"requests": %d, "rejected": %d, "in_flight": %d, '
+                '"queue_latency": %.6f}' % (os.getpid(), accepted,
+                                             self.admitted, self.rejected,
+                                             self.in_flight,
+                                             self.queue_latency))
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _reject(self, environ, start_response):
+        self.rejected += 1
+        LOG.debug("Shedding request, %(in_flight)d in flight, queue "
+                  "latency %(latency).3fs",
+                  {'in_flight': self.in_flight,
+                   'latency': self.queue_latency})
+        exc = webob.exc.HTTPServiceUnavailable(
+            explanation=_('The server is overloaded, retry later.'),
+            headers={'Retry-After': str(self.retry_after)})
+        return exc(environ, start_response)
+
+    def __call__(self, environ, start_response):
+        self._observe_queue_latency(environ)
+        if (self.health_check_path and
+                environ.get('PATH_INFO') == self.health_check_path):
+            return self._health_check(start_response)
+        if self._overloaded():
+            return self._reject(environ, start_response)
+
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        try:
+            app_iter = self.app(environ, start_response)
+        except Exception:
+            self._release()
+            raise
+        if hasattr(app_iter, '__len__'):
+            return _SizedRequestIterator(app_iter, self._release)
+        return _RequestIterator(app_iter, self._release)
+
+
+class ServerEngine(object):
+    """Accepts connections for a Server and runs its application.
+
+    :param server: the Server being served, engines read its logger,
+                   keepalive and timeout settings from it.
+    :param pool_size: the number of requests the engine may run at once.
+    """
+
+    # Option giving the pool size when the Server is not given one
+    pool_size_opt = 'wsgi_default_pool_size'
+
+    def __init__(self, server, pool_size):
+        self.server = server
+        self.pool_size = pool_size
+
+    @property
+    def accepted(self):
+        """Connections accepted so far."""
+        return 0
+
+    def start(self, sock, ssl_kwargs=None):
+        """Serve connections accepted on the listening socket ``sock``."""
+        raise NotImplementedError()
+
+    def resize(self, pool_size):
+        """Change the number of requests run at once."""
+        self.pool_size = pool_size
+
+    def free(self):
+        """Return how many more requests could run right now."""
+        raise NotImplementedError()
+
+    def running(self):
+        """Return how many requests are in progress or waiting to run."""
+        raise NotImplementedError()
+
+    def stop(self):
+        """Stop accepting connections, let requests in progress finish."""
+        raise NotImplementedError()
+
+    def wait(self, timeout=None):
+        """Wait for the engine to stop, at most ``timeout`` seconds."""
+        raise NotImplementedError()
+
+
+class EventletEngine(ServerEngine):
+    """Serve with eventlet.wsgi, one greenthread per connection."""
+
+    def __init__(self, server, pool_size):
+        super(EventletEngine, self).__init__(server, pool_size)
+        self.pool = AcceptTimingPool(pool_size)
+        self._thread = None
+
+    @property
+    def accepted(self):
+        return self.pool.accepted
+
+    def start(self, sock, ssl_kwargs=None):
+        if ssl_kwargs:
+            sock = eventlet.wrap_ssl(sock, **ssl_kwargs)
+
+        server = self.server
+        wsgi_kwargs = {
+            'func': eventlet.wsgi.server,
+            'sock': sock,
+            'site': server.admission,
+            'protocol': server._protocol,
+            'custom_pool': self.pool,
+            'log': server._wsgi_logger,
+            'log_format': AccessLogFormat(CONF.wsgi_log_format),
+            'debug': False,
+            'keepalive': server.keepalive,
+            'socket_timeout': server.client_socket_timeout
+            }
+
+        if server._max_url_len:
+            wsgi_kwargs['url_length_limit'] = server._max_url_len
+
+        self._thread = eventlet.spawn(**wsgi_kwargs)
+
+    def resize(self, pool_size):
+        super(EventletEngine, self).resize(pool_size)
+        self.pool.resize(pool_size)
+
+    def free(self):
+        return self.pool.free()
+
+    def running(self):
+        return self.pool.running()
+
+    def stop(self):
+        if self._thread is not None:
+            # Resize pool to stop new requests from being processed
+            self.pool.resize(0)
+            self._thread.kill()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            with eventlet.Timeout(timeout, False):
+                self.pool.waitall()
+                self._thread.wait()
+
+
+# Engines selectable with wsgi_server_engine
+_ENGINES = {
+    'eventlet': 'prototype.common.wsgi.EventletEngine',
+    'asyncio': 'prototype.common.wsgi_asyncio.AsyncioEngine',
+}
+
+
+def _pool_stats():
+    stats = {}
+    for name, server in list(_SERVERS.items()):
+        stats[(name, 'size')] = server.pool_size
+        stats[(name, 'running')] = server._engine.running()
+        stats[(name, 'free')] = server._engine.free()
+        stats[(name, 'in_flight')] = server.admission.in_flight
+    return stats
+
+
+def _admission_stats():
+    stats = {}
+    for name, server in list(_SERVERS.items()):
+        stats[(name, 'admitted')] = server.admission.admitted
+        stats[(name, 'rejected')] = server.admission.rejected
+    return stats
+
+
+metrics.REGISTRY.register(metrics.Gauge(
+    'prototype_wsgi_pool_requests',
+    'Requests of the WSGI server pools: pool size, running or waiting to '
+    'run, free slots, and admitted requests in progress.',
+    ('server', 'state'), callback=_pool_stats))
+metrics.REGISTRY.register(metrics.Counter(
+    'prototype_wsgi_admission_total',
+    'Requests admitted and rejected by the WSGI server admission control.',
+    ('server', 'decision'), callback=_admission_stats))
+metrics.REGISTRY.register(metrics.Gauge(
+    'prototype_wsgi_queue_latency_seconds',
+    'Moving average of the time requests waited to start.', ('server',),
+    callback=lambda: dict(((name,), server.admission.queue_latency)
+                          for name, server in list(_SERVERS.items()))))
+
 
 class Server(object):
     """Server class to manage a WSGI server, serving a WSGI application."""
 
-    default_pool_size = CONF.wsgi_default_pool_size
-
     def __init__(self, name, app, host='0.0.0.0', port=0, pool_size=None,
-                       protocol=eventlet.wsgi.HttpProtocol, backlog=128,
+                       protocol=DrainingHttpProtocol, backlog=128,
                        use_ssl=False, max_url_len=None):
         """Initialize, but do not start, a WSGI server.
 
@@ -101,7 +569,9 @@ class Server(object):
         :param app: The WSGI application to serve.
         :param host: IP address to serve the application.
         :param port: Port number to server the application.
-        :param pool_size: Maximum number of eventlets to spawn concurrently.
+        :param pool_size: Maximum number of requests to serve concurrently.
+        :param protocol: eventlet.wsgi protocol class of the eventlet
+                         engine.
         :param backlog: Maximum number of queued connections.
         :param max_url_len: Maximum length of permitted URLs.
         :returns: None
@@ -111,21 +581,27 @@ class Server(object):
         eventlet.wsgi.MAX_HEADER_LINE = CONF.max_header_line
         self.name = name
         self.app = app
-        self._server = None
         self._protocol = protocol
-        self.pool_size = pool_size or self.default_pool_size
-        self._pool = eventlet.GreenPool(self.pool_size)
+        self._requested_pool_size = pool_size
+        engine_cls = importutils.import_class(
+            _ENGINES[CONF.wsgi_server_engine])
+        self.pool_size = pool_size or getattr(CONF, engine_cls.pool_size_opt)
+        self._engine = engine_cls(self, self.pool_size)
+        self._started = False
+        self._autotuner = None
+        self.admission = AdmissionController(app, pool=self._engine)
+        self._load_config()
         self._logger = logging.getLogger("prototype.%s.wsgi.server" % self.name)
         self._wsgi_logger = loggers.WritableLogger(self._logger)
         self._use_ssl = use_ssl
         self._max_url_len = max_url_len
-        self.client_socket_timeout = CONF.client_socket_timeout or None
 
         if backlog < 1:
             raise exception.InvalidInput(
                     reason='The backlog must be more than 1')
 
         bind_addr = (host, port)
+        self._listen_key = '%s:%s' % (host, port)
         # TODO(dims): eventlet's green dns/socket module does not actually
         # support IPv6 in getaddrinfo(). We need to get around this in the
         # future or monitor upstream for a fix
@@ -139,8 +615,33 @@ class Server(object):
         except Exception:
             family = socket.AF_INET
 
+        self._family = family
+        self._backlog = backlog
+        self._reuse_port = CONF.wsgi_reuse_port
+        if self._reuse_port and _SO_REUSEPORT is None:
+            LOG.warning(_LW("SO_REUSEPORT is not supported on this "
+                            "platform, workers will share one socket"))
+            self._reuse_port = False
+
+        inherited_fd = _take_inherited_fd(self._listen_key)
         try:
-            self._socket = eventlet.listen(bind_addr, family, backlog=backlog)
+            if inherited_fd is not None:
+                # Handed over by the previous master, it never stopped
+                # listening so no connection was refused meanwhile.
+                self._socket = green_socket.fromfd(inherited_fd, family,
+                                                   socket.SOCK_STREAM)
+                os.close(inherited_fd)
+                LOG.info(_LI("%(name)s inherited its socket for %(key)s"),
+                         {'name': self.name, 'key': self._listen_key})
+            elif self._reuse_port:
+                # Only reserve the address here, each worker listens on
+                # its own socket from start().  A listening socket in the
+                # parent would get its share of connections and never
+                # accept them.
+                self._socket = self._reuse_port_socket(bind_addr)
+            else:
+                self._socket = eventlet.listen(bind_addr, family,
+                                               backlog=backlog)
         except EnvironmentError:
             LOG.error(_LE("Could not bind to %(host)s:%(port)s"),
                       {'host': host, 'port': port})
@@ -150,17 +651,62 @@ class Server(object):
         LOG.info(_LI("%(name)s listening on %(host)s:%(port)s"),
                  {'name': self.name, 'host': self.host, 'port': self.port})
 
+    def _reuse_port_socket(self, bind_addr):
+        sock = green_socket.socket(self._family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
+        sock.bind(bind_addr)
+        return sock
+
+    def _ssl_kwargs(self):
+        """Return the SSL settings as ssl.wrap_socket keyword arguments."""
+        ca_file = CONF.ssl_ca_file
+        cert_file = CONF.ssl_cert_file
+        key_file = CONF.ssl_key_file
+
+        if cert_file and not os.path.exists(cert_file):
+            raise RuntimeError(
+                  _("Unable to find cert_file : %s") % cert_file)
+
+        if ca_file and not os.path.exists(ca_file):
+            raise RuntimeError(
+                  _("Unable to find ca_file : %s") % ca_file)
+
+        if key_file and not os.path.exists(key_file):
+            raise RuntimeError(
+                  _("Unable to find key_file : %s") % key_file)
+
+        if self._use_ssl and (not cert_file or not key_file):
+            raise RuntimeError(
+                  _("When running server in SSL mode, you must "
+                    "specify both a cert_file and key_file "
+                    "option value in your configuration file"))
+        ssl_kwargs = {
+            'server_side': True,
+            'certfile': cert_file,
+            'keyfile': key_file,
+            'cert_reqs': ssl.CERT_NONE,
+        }
+
+        if CONF.ssl_ca_file:
+            ssl_kwargs['ca_certs'] = ca_file
+            ssl_kwargs['cert_reqs'] = ssl.CERT_REQUIRED
+        return ssl_kwargs
+
     def start(self):
         """Start serving a WSGI application.
 
         :returns: None
         """
-        # The server socket object will be closed after server exits,
-        # but the underlying file descriptor will remain open, and will
-        # give bad file descriptor error. So duplicating the socket object,
-        # to keep file descriptor usable.
-
-        dup_socket = self._socket.dup()
+        if self._reuse_port:
+            dup_socket = self._reuse_port_socket((self.host, self.port))
+            dup_socket.listen(self._backlog)
+        else:
+            # The server socket object will be closed after server exits,
+            # but the underlying file descriptor will remain open, and
+            # will give bad file descriptor error. So duplicating the
+            # socket object, to keep file descriptor usable.
+            dup_socket = self._socket.dup()
         dup_socket.setsockopt(socket.SOL_SOCKET,
                               socket.SO_REUSEADDR, 1)
         # sockets can hang around forever without keepalive
@@ -173,42 +719,10 @@ class Server(object):
                                   socket.TCP_KEEPIDLE,
                                   CONF.tcp_keepidle)
 
+        ssl_kwargs = None
         if self._use_ssl:
             try:
-                ca_file = CONF.ssl_ca_file
-                cert_file = CONF.ssl_cert_file
-                key_file = CONF.ssl_key_file
-
-                if cert_file and not os.path.exists(cert_file):
-                    raise RuntimeError(
-                          _("Unable to find cert_file : %s") % cert_file)
-
-                if ca_file and not os.path.exists(ca_file):
-                    raise RuntimeError(
-                          _("Unable to find ca_file : %s") % ca_file)
-
-                if key_file and not os.path.exists(key_file):
-                    raise RuntimeError(
-                          _("Unable to find key_file : %s") % key_file)
-
-                if self._use_ssl and (not cert_file or not key_file):
-                    raise RuntimeError(
-                          _("When running server in SSL mode, you must "
-                            "specify both a cert_file and key_file "
-                            "option value in your configuration file"))
-                ssl_kwargs = {
-                    'server_side': True,
-                    'certfile': cert_file,
-                    'keyfile': key_file,
-                    'cert_reqs': ssl.CERT_NONE,
-                }
-
-                if CONF.ssl_ca_file:
-                    ssl_kwargs['ca_certs'] = ca_file
-                    ssl_kwargs['cert_reqs'] = ssl.CERT_REQUIRED
-
-                dup_socket = eventlet.wrap_ssl(dup_socket,
-                                               **ssl_kwargs)
+                ssl_kwargs = self._ssl_kwargs()
             except Exception:
                 with excutils.save_and_reraise_exception():
                     LOG.error(_LE("Failed to start %(name)s on %(host)s"
@@ -216,68 +730,190 @@ class Server(object):
                               {'name': self.name, 'host': self.host,
                                'port': self.port})
 
-        wsgi_kwargs = {
-            'func': eventlet.wsgi.server,
-            'sock': dup_socket,
-            'site': self.app,
-            'protocol': self._protocol,
-            'custom_pool': self._pool,
-            'log': self._wsgi_logger,
-            'log_format': CONF.wsgi_log_format,
-            'debug': False,
-            'keepalive': CONF.wsgi_keep_alive,
-            'socket_timeout': self.client_socket_timeout
-            }
+        self._engine.start(dup_socket, ssl_kwargs)
+        self._started = True
+        _SERVERS[self.name] = self
 
-        if self._max_url_len:
-            wsgi_kwargs['url_length_limit'] = self._max_url_len
+        if CONF.wsgi_pool_autotune and self._autotuner is None:
+            interval = CONF.wsgi_pool_autotune_interval
+            self._autotuner = loopingcall.FixedIntervalLoopingCall(
+                self._autotune)
+            self._autotuner.start(interval, initial_delay=interval)
 
-        self._server = eventlet.spawn(**wsgi_kwargs)
+    def _load_config(self):
+        """Pick up the settings that may change on reload."""
+        self.keepalive = CONF.wsgi_keep_alive
+        self.client_socket_timeout = CONF.client_socket_timeout or None
+        self.admission.max_requests = CONF.wsgi_max_concurrent_requests
+        self.admission.max_queue_latency = CONF.wsgi_max_queue_latency
+        self.admission.retry_after = CONF.wsgi_shed_retry_after
+        self.admission.health_check_path = CONF.wsgi_health_check_path
+        if (self.admission.max_requests and
+                self.admission.max_requests >= self.pool_size):
+            LOG.warning(_LW("wsgi_max_concurrent_requests should be lower "
+                            "than the pool size %d, requests will queue "
+                            "before being rejected"), self.pool_size)
+
+    def _autotune(self):
+        """Move the pool size towards the target queue latency.
+
+        Requests waiting longer than the target for a pool slot while no
+        slot is free mean the pool is too small for the load, so it
+        grows.  A pool with enough slots unused to serve the current load
+        from a smaller one shrinks.  High latency with free slots comes
+        from elsewhere, a larger pool would not help, so it is left be.
+        """
+        latency = self.admission.queue_latency
+        size = self.pool_size
+        if latency > CONF.wsgi_target_queue_latency:
+            if not self._engine.free():
+                size = int(size * _AUTOTUNE_GROW)
+        else:
+            shrunk = int(size * _AUTOTUNE_SHRINK)
+            if self._engine.running() < shrunk:
+                size = shrunk
+        size = max(CONF.wsgi_pool_min_size,
+                   min(CONF.wsgi_pool_max_size, size))
+        if size != self.pool_size:
+            LOG.info(_LI("Resizing %(name)s pool from %(old)d to %(new)d, "
+                         "queue latency %(latency).3fs"),
+                     {'name': self.name, 'old': self.pool_size,
+                      'new': size, 'latency': latency})
+            self.pool_size = size
+            self._engine.resize(size)
 
     def reset(self):
-        """Reset server greenpool size to default.
+        """Apply reloaded configuration.
+
+        The pool is resized in place so connections being served carry
+        on.  Keepalive and the client socket timeout apply from the next
+        start(), which the service restart on SIGHUP always does.
 
         :returns: None
 
         """
-        self._pool.resize(self.pool_size)
+        if not self._requested_pool_size and not CONF.wsgi_pool_autotune:
+            self.pool_size = getattr(CONF, self._engine.pool_size_opt)
+        self._load_config()
+        self._engine.resize(self.pool_size)
 
     def stop(self):
         """Stop this server.
 
-        This is not a very nice action, as currently the method by which a
-        server is stopped is by killing its eventlet.
+        The engine stops accepting connections, requests in progress are
+        left to finish until wait() gives up on them.
 
         :returns: None
 
         """
         LOG.info(_LI("Stopping WSGI server."))
 
-        if self._server is not None:
-            # Resize pool to stop new requests from being processed
-            self._pool.resize(0)
-            self._server.kill()
+        if self._autotuner is not None:
+            self._autotuner.stop()
+            self._autotuner = None
+
+        if self._started:
+            LOG.info(_LI("%(name)s worker %(pid)d accepted %(accepted)d "
+                         "connections and served %(requests)d requests"),
+                     {'name': self.name, 'pid': os.getpid(),
+                      'accepted': self._engine.accepted,
+                      'requests': self.admission.admitted})
+            self._engine.stop()
 
     def wait(self):
         """Block, until the server has stopped.
 
-        Waits on the server's eventlet to finish, then returns.
+        Waits on the engine to finish, then returns.  Requests still in
+        progress after wsgi_drain_timeout are abandoned.
 
         :returns: None
 
         """
         try:
-            if self._server is not None:
-                self._pool.waitall()
-                self._server.wait()
+            if self._started:
+                self._engine.wait(CONF.wsgi_drain_timeout or None)
+                if self._engine.running():
+                    LOG.warning(_LW("Abandoning %d requests still in "
+                                    "progress"), self._engine.running())
         except greenlet.GreenletExit:
             LOG.info(_LI("WSGI server has stopped."))
 
+    def handoff(self):
+        """Return the host:port key and fd of the listening socket.
+
+        The fd is made inheritable so it survives an exec of a new master.
+        """
+        fd = self._socket.fileno()
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+        return self._listen_key, fd
+
 
 class Request(webob.Request):
     pass
 
 
+class wsgify(webob.dec.wsgify):
+    """webob.dec.wsgify reusing the request of a collapsed pipeline.
+
+    Called as a WSGI app below a SharedRequest, the wrapped function gets
+    the request SharedRequest built instead of a new one, so the layers of
+    the pipeline share one request, its response and everything they cache
+    on it.  The shared request is only used when it is an instance of
+    RequestClass and still wraps the environ being called, a copied or
+    rebuilt environ gets a request of its own like with webob.
+    """
+
+    def __call__(self, req, *args, **kw):
+        if self.func is not None and isinstance(req, dict):
+            ref = req.get(SHARED_REQUEST_ENV)
+            shared = ref() if ref is not None else None
+            if (shared is not None and shared.environ is req and
+                    isinstance(shared, self.RequestClass) and
+                    len(args) == 1 and not kw):
+                return self._call_shared(shared, args[0])
+        return super(wsgify, self).__call__(req, *args, **kw)
+
+    def _call_shared(self, req, start_response):
+        # Same handling of the result as webob.dec.wsgify
+        try:
+            args, kw = self._prepare_args(None, None)
+            resp = self.call_func(req, *args, **kw)
+        except webob.exc.HTTPException as exc:
+            resp = exc
+        if resp is None:
+            resp = req.response
+        if isinstance(resp, six.text_type):
+            resp = resp.encode(req.charset)
+        if isinstance(resp, six.binary_type):
+            body = resp
+            resp = req.response
+            resp.write(body)
+        if resp is not req.response:
+            resp = req.response.merge_cookies(resp)
+        return resp(req.environ, start_response)
+
+
+class SharedRequest(object):
+    """Head of a collapsed pipeline.
+
+    Builds one request per call and leaves a weak reference to it in the
+    environ for the wsgify layers below, which would otherwise each build
+    their own request and response.  ``request_class`` must be a subclass
+    of the RequestClass of every layer that should share it.
+    """
+
+    def __init__(self, application, request_class=Request):
+        self.application = application
+        self.request_class = request_class
+
+    def __call__(self, environ, start_response):
+        req = self.request_class(environ)
+        req.response = req.ResponseClass()
+        environ[SHARED_REQUEST_ENV] = weakref.ref(req)
+        return self.application(environ, start_response)
+
+
 class Application(object):
     """Base WSGI application wrapper. Subclasses need to implement __call__."""
 
@@ -397,7 +1033,7 @@ class Middleware(Application):
         """Do whatever you'd like to the response."""
         return response
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgify(RequestClass=Request)
     def __call__(self, req):
         response = self.process_request(req)
         if response:
@@ -414,7 +1050,7 @@ class Debug(Middleware):
 
     """
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgify(RequestClass=Request)
     def __call__(self, req):
         print(('*' * 40) + ' REQUEST ENVIRON')
         for key, value in req.environ.items():
@@ -473,17 +1109,19 @@ class Router(object):
         self._router = routes.middleware.RoutesMiddleware(self._dispatch,
                                                           self.map)
 
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgify(RequestClass=Request)
     def __call__(self, req):
         """Route the incoming request to a controller based on self.map.
 
         If no match, return a 404.
 
         """
+        if timing.TIMER_ENV in req.environ:
+            req.environ[_ROUTE_STARTED_ENV] = timing.now()
         return self._router
 
     @staticmethod
-    @webob.dec.wsgify(RequestClass=Request)
+    @wsgify(RequestClass=Request)
     def _dispatch(req):
         """Dispatch the request to the appropriate controller.
 
@@ -492,13 +1130,53 @@ class Router(object):
         or the routed WSGI app's response.
 
         """
+        started = req.environ.pop(_ROUTE_STARTED_ENV, None)
+        if started is not None:
+            req.environ[timing.TIMER_ENV].add('route', timing.now() - started)
         match = req.environ['wsgiorg.routing_args'][1]
         if not match:
             return webob.exc.HTTPNotFound()
+        route = req.environ.get('routes.route')
+        if route is not None:
+            req.environ[timing.ROUTE_ENV] = '%s %s%s' % (
+                req.method, req.script_name, route.routepath)
         app = match['controller']
         return app
 
 
+def warm_app(app):
+    """Build what a loaded paste app would otherwise build lazily.
+
+    Walks the url maps, middleware and routers below ``app``, compiling
+    the route table of every Router on the way, and builds the JSON
+    codec.  Run before forking so the workers share the result instead of
+    each building its own copy on its first requests.
+    """
+    seen = set()
+    pending = [app]
+    routers = 0
+    while pending:
+        obj = pending.pop()
+        if obj is None or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+
+        if isinstance(obj, Router):
+            obj.map.create_regs()
+            routers += 1
+            for route in obj.map.matchlist:
+                pending.append(route.defaults.get('controller'))
+        # paste URLMap entries are ((domain, path), app)
+        for _key, sub_app in getattr(obj, 'applications', None) or ():
+            pending.append(sub_app)
+        for attr in ('application', 'app', 'controller'):
+            pending.append(getattr(obj, attr, None))
+
+    jsoncodec.get_codec()
+    LOG.debug("Warmed %(objects)d WSGI objects and %(routers)d routers",
+              {'objects': len(seen), 'routers': routers})
+
+
 class Loader(object):
     """Used to load WSGI applications from paste configurations."""
 
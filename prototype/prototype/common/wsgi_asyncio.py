@@ -0,0 +1,805 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""asyncio server engine.
+
+An event loop on its own thread accepts connections, parses HTTP/1.1 and
+writes responses, while the WSGI application runs on a bounded pool of
+native threads.  Requests arriving while every thread is busy wait in a
+queue on the loop; the time spent there is the queue latency admission
+control and pool auto-tuning work from.
+
+The application must not share the process with eventlet monkey
+patching, see the wsgi_server_engine option.
+"""
+
+import collections
+import email.utils
+import functools
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+
+from concurrent import futures
+import eventlet
+from eventlet import patcher
+from oslo_config import cfg
+from oslo_utils import importutils
+import six
+from six.moves.urllib import parse as urlparse
+
+from prototype.common.i18n import _, _LE
+from oslo_log import log as logging
+from prototype.common import timing
+from prototype.common import wsgi
+
+asyncio = (importutils.try_import('asyncio') or
+           importutils.try_import('trollius'))
+
+CONF = cfg.CONF
+
+LOG = logging.getLogger(__name__)
+
+# Request bytes buffered per connection before it stops being read
+_READ_BUFFER_SIZE = 65536
+
+# Limits matching eventlet.wsgi
+_MAX_HEAD_SIZE = 65536
+_MAX_REQUEST_LINE = 8192
+_MAX_CHUNK_LINE = 1024
+
+# Chunk sizes and Content-Length are plain digits.  int() would also
+# take signs, whitespace and 0x prefixes, letting a client frame the
+# body differently from a proxy in front of us.
+_CHUNK_SIZE_RE = re.compile(br'[0-9A-Fa-f]{1,16}\Z')
+_CONTENT_LENGTH_RE = re.compile(r'[0-9]{1,20}\Z')
+
+# Seconds between checks for idle connections
+_SWEEP_INTERVAL = 1
+
+_REASONS = {
+    400: 'Bad Request',
+    414: 'Request-URI Too Long',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+    505: 'HTTP Version Not Supported',
+}
+
+
+class _HttpError(Exception):
+
+    def __init__(self, code):
+        super(_HttpError, self).__init__(code)
+        self.code = code
+
+
+def _error_response(code):
+    response = ('HTTP/1.1 %d %s\r\nContent-Length: 0\r\n'
+                'Connection: close\r\n\r\n' % (code, _REASONS[code]))
+    return response.encode('latin-1')
+
+
+def _unquote(path):
+    # PEP 3333 native strings carry the raw bytes
+    if six.PY2:
+        return urlparse.unquote(path)
+    return urlparse.unquote_to_bytes(path).decode('latin-1')
+
+
+class _RequestBody(object):
+    """wsgi.input of a request, fed by the event loop.
+
+    Application threads block in read() until the loop has received the
+    data.  The connection stops being read while more than
+    _READ_BUFFER_SIZE bytes wait to be consumed.
+    """
+
+    def __init__(self, protocol, length=0, chunked=False,
+                 expect_continue=False):
+        self._protocol = protocol
+        self._remaining = length
+        self._chunked = chunked
+        self._chunk_state = 'size'
+        self._line = b''
+        self._expect_continue = expect_continue
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._paused = False
+        self._cond = threading.Condition(threading.Lock())
+        self.complete = not chunked and not length
+        self.failed = False
+
+    # Called on the event loop
+
+    def _feed_chunked(self, data, parts):
+        while data and not self.complete:
+            if self._chunk_state == 'data':
+                part = data[:self._remaining]
+                parts.append(part)
+                data = data[len(part):]
+                self._remaining -= len(part)
+                if not self._remaining:
+                    self._chunk_state = 'crlf'
+                continue
+            end = data.find(b'\n') + 1
+            if not end:
+                self._line += data
+                if len(self._line) > _MAX_CHUNK_LINE:
+                    raise ValueError('chunk line too long')
+                break
+            line = (self._line + data[:end]).rstrip(b'\r\n')
+            self._line = b''
+            data = data[end:]
+            if self._chunk_state == 'size':
+                size, ext, _rest = line.partition(b';')
+                if ext:
+                    # Whitespace is allowed before chunk extensions
+                    size = size.rstrip(b' \t')
+                if not _CHUNK_SIZE_RE.match(size):
+                    raise ValueError('invalid chunk size')
+                self._remaining = int(size, 16)
+                self._chunk_state = 'data' if self._remaining else 'trailer'
+            elif self._chunk_state == 'crlf':
+                if line:
+                    raise ValueError('chunk not terminated by CRLF')
+                self._chunk_state = 'size'
+            elif not line:
+                self.complete = True
+        return data
+
+    def feed(self, data):
+        """Take bytes received and return those following the body.
+
+        :raises: ValueError if the chunked encoding is invalid
+        """
+        parts = []
+        if self._chunked:
+            data = self._feed_chunked(data, parts)
+        else:
+            part = data[:self._remaining]
+            parts.append(part)
+            data = data[len(part):]
+            self._remaining -= len(part)
+            self.complete = not self._remaining
+        with self._cond:
+            for part in parts:
+                if part:
+                    self._chunks.append(part)
+                    self._buffered += len(part)
+            if self._buffered > _READ_BUFFER_SIZE and not self._paused:
+                self._paused = True
+                self._protocol.pause_reading()
+            self._cond.notify_all()
+        return data
+
+    def fail(self):
+        with self._cond:
+            self.failed = True
+            self._cond.notify_all()
+
+    # Called by the application
+
+    def _send_continue(self):
+        if self._expect_continue:
+            self._expect_continue = False
+            self._protocol.write_threadsafe(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+    def _next_chunk(self):
+        while not self._chunks and not self.complete and not self.failed:
+            self._cond.wait()
+        if self.failed:
+            raise IOError(_('Client disconnected while sending the body'))
+        if not self._chunks:
+            return None
+        return self._chunks.popleft()
+
+    def _consumed(self, size):
+        self._buffered -= size
+        if self._paused and self._buffered <= _READ_BUFFER_SIZE // 2:
+            self._paused = False
+            self._protocol.resume_reading_threadsafe()
+
+    def read(self, size=-1):
+        self._send_continue()
+        parts = []
+        with self._cond:
+            while size:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                if 0 < size < len(chunk):
+                    self._chunks.appendleft(chunk[size:])
+                    chunk = chunk[:size]
+                self._consumed(len(chunk))
+                parts.append(chunk)
+                if size > 0:
+                    size -= len(chunk)
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        self._send_continue()
+        parts = []
+        with self._cond:
+            while size:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                end = chunk.find(b'\n') + 1 or len(chunk)
+                if size > 0:
+                    end = min(end, size)
+                if end < len(chunk):
+                    self._chunks.appendleft(chunk[end:])
+                    chunk = chunk[:end]
+                self._consumed(len(chunk))
+                parts.append(chunk)
+                if size > 0:
+                    size -= len(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+        return b''.join(parts)
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+class _Request(object):
+    """State of the request a connection is serving."""
+
+    def __init__(self, environ, keep_alive):
+        self.environ = environ
+        self.keep_alive = keep_alive
+        self.started = time.time()
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.no_body = environ['REQUEST_METHOD'] == 'HEAD'
+        self.chunked = False
+        self.status_code = 0
+        self.body_length = 0
+
+
+class _HttpProtocol(asyncio.Protocol if asyncio else object):
+    """An HTTP/1.1 connection, serving one request at a time."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = engine.loop
+        self.transport = None
+        self.client_addr = ('', 0)
+        self.buffer = b''
+        self.body = None
+        self.request = None
+        self.served = 0
+        self.closed = False
+        self.last_active = 0
+        self._reading_paused = False
+        self._can_write = threading.Event()
+        self._can_write.set()
+
+    # Called on the event loop
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client_addr = transport.get_extra_info('peername') or ('', 0)
+        self.last_active = self.loop.time()
+        self.engine.connection_made(self)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.engine.connection_lost(self)
+        if self.body is not None:
+            self.body.fail()
+        # Release an application blocked on a full write buffer
+        self._can_write.set()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    def pause_reading(self):
+        if not self._reading_paused and not self.closed:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self._reading_paused and not self.closed:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def idle(self):
+        """Whether closing this connection loses no request.
+
+        A new connection counts as busy until its first response is sent,
+        its request may be on its way.
+        """
+        return self.request is None and not self.buffer and self.served
+
+    def data_received(self, data):
+        self.last_active = self.loop.time()
+        if self.body is not None:
+            try:
+                data = self.body.feed(data)
+            except ValueError:
+                self.body.fail()
+                request = self.request
+                if request is not None and not request.headers_sent:
+                    # The application gets an IOError reading the body,
+                    # the client this 400 instead of its response
+                    request.headers_sent = True
+                    request.status_code = 400
+                    request.keep_alive = False
+                    self._reject(400)
+                else:
+                    self.transport.close()
+                return
+            if self.body.complete:
+                self.body = None
+            if not data:
+                return
+        self.buffer += data
+        if self.request is None:
+            self._parse()
+        elif len(self.buffer) > _READ_BUFFER_SIZE:
+            # Pipelined requests pile up behind the current one
+            self.pause_reading()
+
+    def _reject(self, code):
+        self.transport.write(_error_response(code))
+        self.transport.close()
+        # Nothing more may be written, application threads included
+        self.closed = True
+        self.buffer = b''
+
+    def _parse(self):
+        # Clients may send empty lines between requests
+        self.buffer = self.buffer.lstrip(b'\r\n')
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > _MAX_HEAD_SIZE:
+                self._reject(400)
+            return
+        head = self.buffer[:end]
+        rest = self.buffer[end + 4:]
+        self.buffer = b''
+        try:
+            environ, keep_alive = self._parse_head(head)
+            body = environ['wsgi.input']
+            if not body.complete:
+                rest = body.feed(rest)
+                if not body.complete:
+                    self.body = body
+        except _HttpError as e:
+            self._reject(e.code)
+            return
+        except ValueError:
+            self._reject(400)
+            return
+        self.buffer = rest
+        self.request = _Request(environ, keep_alive)
+        self.engine.submit(self, environ)
+
+    def _parse_head(self, head):
+        if six.PY3:
+            head = head.decode('latin-1')
+        lines = head.split('\r\n')
+        request_line = lines[0]
+        max_url_len = self.engine.server._max_url_len or _MAX_REQUEST_LINE
+        if len(request_line) >= max_url_len:
+            raise _HttpError(414)
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            raise _HttpError(400)
+        method, target, version = parts
+        if version not in ('HTTP/1.1', 'HTTP/1.0'):
+            raise _HttpError(505)
+
+        environ = self.engine.base_environ.copy()
+        if '://' in target:
+            target = target.split('://', 1)[1].partition('/')[2]
+            target = '/' + target
+        path, _sep, query = target.partition('?')
+        environ['REQUEST_METHOD'] = method
+        environ['RAW_PATH_INFO'] = path
+        environ['PATH_INFO'] = _unquote(path)
+        environ['QUERY_STRING'] = query
+        environ['SERVER_PROTOCOL'] = version
+        environ['REMOTE_ADDR'] = self.client_addr[0]
+        environ['REMOTE_PORT'] = str(self.client_addr[1])
+
+        max_header_line = CONF.max_header_line
+        for line in lines[1:]:
+            if len(line) > max_header_line:
+                raise _HttpError(400)
+            name, sep, value = line.partition(':')
+            if not sep or name != name.strip():
+                raise _HttpError(400)
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            value = value.strip()
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        keep_alive = (keep_alive and self.engine.server.keepalive and
+                      not self.engine.stopping)
+
+        expect_continue = (version == 'HTTP/1.1' and
+                           environ.get('HTTP_EXPECT', '').lower() ==
+                           '100-continue')
+        encoding = environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+        if encoding:
+            if encoding != 'chunked':
+                raise _HttpError(501)
+            if 'CONTENT_LENGTH' in environ:
+                raise _HttpError(400)
+            body = _RequestBody(self, chunked=True,
+                                expect_continue=expect_continue)
+        else:
+            length = environ.get('CONTENT_LENGTH') or '0'
+            if not _CONTENT_LENGTH_RE.match(length):
+                raise _HttpError(400)
+            length = int(length)
+            body = _RequestBody(self, length=length,
+                                expect_continue=expect_continue)
+        environ['wsgi.input'] = body
+        return environ, keep_alive
+
+    def request_done(self):
+        request = self.request
+        self.request = None
+        self.served += 1
+        self.engine.log_request(self, request)
+        if self.body is not None:
+            # The application left part of the body unread
+            self.body.fail()
+            self.body = None
+            request.keep_alive = False
+        if not request.keep_alive or self.engine.stopping:
+            self.transport.close()
+            return
+        self.last_active = self.loop.time()
+        self.resume_reading()
+        if self.buffer:
+            self._parse()
+
+    def _write(self, data):
+        if not self.closed:
+            self.transport.write(data)
+
+    # Called by the application
+
+    def write_threadsafe(self, data):
+        self._can_write.wait()
+        if self.closed:
+            raise IOError(_('Client disconnected'))
+        self.loop.call_soon_threadsafe(self._write, data)
+
+    def resume_reading_threadsafe(self):
+        self.loop.call_soon_threadsafe(self.resume_reading)
+
+    def _response_head(self, request):
+        if request.status is None:
+            raise AssertionError('write() before start_response()')
+        request.headers_sent = True
+        request.status_code = code = int(request.status[:3])
+        names = set(name.lower() for name, _value in request.headers)
+        lines = ['HTTP/1.1 %s' % request.status]
+        lines.extend('%s: %s' % header for header in request.headers)
+        if 'date' not in names:
+            lines.append('Date: %s' % self.engine.http_date())
+        if code in (204, 304) or code < 200:
+            request.no_body = True
+        elif 'content-length' not in names:
+            if (request.keep_alive and
+                    request.environ['SERVER_PROTOCOL'] == 'HTTP/1.1'):
+                request.chunked = not request.no_body
+                lines.append('Transfer-Encoding: chunked')
+            else:
+                # The end of the body is the end of the connection
+                request.keep_alive = False
+        if not request.keep_alive:
+            lines.append('Connection: close')
+        elif request.environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            lines.append('Connection: keep-alive')
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+        if six.PY3:
+            head = head.encode('latin-1')
+        return head
+
+    def _send(self, request, data):
+        head = b''
+        if not request.headers_sent:
+            head = self._response_head(request)
+        if request.no_body:
+            data = b''
+        elif request.chunked and data:
+            data = b''.join((('%x\r\n' % len(data)).encode('ascii'), data,
+                             b'\r\n'))
+        request.body_length += len(data)
+        if head or data:
+            self.write_threadsafe(head + data)
+
+    @staticmethod
+    def _single_chunk(request, app_iter):
+        if request.headers is None or request.headers_sent:
+            return False
+        try:
+            if len(app_iter) != 1:
+                return False
+        except TypeError:
+            return False
+        return not any(name.lower() == 'content-length'
+                       for name, _value in request.headers)
+
+    def run_app(self, environ):
+        """Run the application on a worker thread."""
+        request = self.request
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if request.headers_sent:
+                        six.reraise(*exc_info)
+                finally:
+                    exc_info = None
+            elif request.status is not None:
+                raise AssertionError('start_response() called twice')
+            request.status = status
+            request.headers = list(headers)
+            return functools.partial(self._send, request)
+
+        try:
+            app_iter = self.engine.app(environ, start_response)
+            try:
+                if self._single_chunk(request, app_iter):
+                    # Spare the chunked encoding of a body sent at once
+                    data = b''.join(app_iter)
+                    request.headers.append(('Content-Length', str(len(data))))
+                    self._send(request, data)
+                else:
+                    for data in app_iter:
+                        if data:
+                            self._send(request, data)
+                if not request.headers_sent:
+                    self._send(request, b'')
+                if request.chunked:
+                    self.write_threadsafe(b'0\r\n\r\n')
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        except Exception:
+            if self.closed:
+                request.keep_alive = False
+                return
+            LOG.exception(_LE("Error serving %(method)s %(path)s"),
+                          {'method': environ['REQUEST_METHOD'],
+                           'path': environ['RAW_PATH_INFO']})
+            request.keep_alive = False
+            if not request.headers_sent:
+                request.headers_sent = True
+                request.status_code = 500
+                self.write_threadsafe(_error_response(500))
+
+
+class AsyncioEngine(wsgi.ServerEngine):
+    """Serve HTTP/1.1 from an asyncio loop, applications on threads."""
+
+    pool_size_opt = 'wsgi_thread_pool_size'
+
+    def __init__(self, server, pool_size):
+        if asyncio is None:
+            raise RuntimeError(_("The asyncio server engine needs trollius "
+                                 "on Python 2"))
+        if patcher.is_monkey_patched('thread'):
+            raise RuntimeError(_("The asyncio server engine needs eventlet "
+                                 "monkey patching disabled, start the API "
+                                 "with PROTOTYPE_EVENTLET_MONKEY_PATCH=0"))
+        super(AsyncioEngine, self).__init__(server, pool_size)
+        self.app = None
+        self.loop = None
+        self.base_environ = None
+        self.connections = set()
+        self.stopping = False
+        self._accepted = 0
+        self._active = 0
+        self._queue = collections.deque()
+        self._executor = None
+        self._executor_size = 0
+        self._listener = None
+        self._thread = None
+        self._stop_requested = None
+        self._date = (0, None)
+
+    @property
+    def accepted(self):
+        return self._accepted
+
+    def _ssl_context(self, ssl_kwargs):
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(ssl_kwargs['certfile'],
+                                ssl_kwargs['keyfile'])
+        if ssl_kwargs.get('ca_certs'):
+            context.load_verify_locations(ssl_kwargs['ca_certs'])
+        context.verify_mode = ssl_kwargs['cert_reqs']
+        return context
+
+    def start(self, sock, ssl_kwargs=None):
+        # The loop needs a plain socket rather than eventlet's
+        native_socket = patcher.original('socket')
+        listen_sock = native_socket.fromfd(sock.fileno(), self.server._family,
+                                           socket.SOCK_STREAM)
+        sock.close()
+
+        self.app = self.server.admission
+        self.base_environ = {
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.server.host,
+            'SERVER_PORT': str(self.server.port),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'https' if ssl_kwargs else 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.input_terminated': True,
+        }
+        self.loop = asyncio.new_event_loop()
+        self._resize_executor()
+        context = self._ssl_context(ssl_kwargs) if ssl_kwargs else None
+        self._listener = self.loop.run_until_complete(
+            self.loop.create_server(lambda: _HttpProtocol(self),
+                                    sock=listen_sock, ssl=context,
+                                    backlog=self.server._backlog))
+        self.loop.call_later(_SWEEP_INTERVAL, self._sweep)
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name='%s-loop' % self.server.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _resize_executor(self):
+        # Executors can't grow, a larger one takes over and the old one's
+        # threads exit once done with their requests.
+        if self.pool_size > self._executor_size:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = futures.ThreadPoolExecutor(self.pool_size)
+            self._executor_size = self.pool_size
+
+    # Called on the event loop
+
+    def connection_made(self, protocol):
+        self._accepted += 1
+        self.connections.add(protocol)
+
+    def connection_lost(self, protocol):
+        self.connections.discard(protocol)
+
+    def submit(self, protocol, environ):
+        environ[wsgi.QUEUED_AT_ENV] = time.time()
+        if self._active < self.pool_size:
+            self._run(protocol, environ)
+        else:
+            self._queue.append((protocol, environ))
+
+    def _run(self, protocol, environ):
+        self._active += 1
+        future = self.loop.run_in_executor(self._executor, protocol.run_app,
+                                           environ)
+        future.add_done_callback(functools.partial(self._finished, protocol))
+
+    def _finished(self, protocol, future):
+        self._active -= 1
+        if not protocol.closed:
+            protocol.request_done()
+        self._dispatch()
+
+    def _dispatch(self):
+        self._resize_executor()
+        while self._queue and self._active < self.pool_size:
+            protocol, environ = self._queue.popleft()
+            if not protocol.closed:
+                self._run(protocol, environ)
+
+    def _sweep(self):
+        """Close connections idle for longer than the socket timeout."""
+        now = self.loop.time()
+        timeout = self.server.client_socket_timeout
+        if self.stopping:
+            timeout = _SWEEP_INTERVAL
+        if timeout:
+            for protocol in list(self.connections):
+                if (protocol.request is None and
+                        now - protocol.last_active > timeout):
+                    protocol.transport.close()
+        self.loop.call_later(_SWEEP_INTERVAL, self._sweep)
+
+    def _stop_serving(self):
+        self.stopping = True
+        self._listener.close()
+        for protocol in list(self.connections):
+            if protocol.idle():
+                protocol.transport.close()
+
+    def log_request(self, protocol, request):
+        environ = request.environ
+        request_line = '%s %s %s' % (environ['REQUEST_METHOD'],
+                                     environ['RAW_PATH_INFO'] +
+                                     ('?' + environ['QUERY_STRING']
+                                      if environ['QUERY_STRING'] else ''),
+                                     environ['SERVER_PROTOCOL'])
+        self.server._logger.info(CONF.wsgi_log_format % {
+            'client_ip': environ['REMOTE_ADDR'],
+            'date_time': time.strftime('%d/%b/%Y %H:%M:%S'),
+            'request_line': request_line,
+            'status_code': request.status_code,
+            'body_length': request.body_length,
+            'wall_seconds': time.time() - request.started,
+            'timings': environ.get(timing.TIMER_ENV) or '-',
+        })
+
+    # Called from any thread
+
+    def http_date(self):
+        now = int(time.time())
+        cached_at, date = self._date
+        if cached_at != now:
+            date = email.utils.formatdate(now, usegmt=True)
+            self._date = (now, date)
+        return date
+
+    def resize(self, pool_size):
+        super(AsyncioEngine, self).resize(pool_size)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._dispatch)
+
+    def free(self):
+        return max(0, self.pool_size - self._active)
+
+    def running(self):
+        return self._active + len(self._queue)
+
+    def stop(self):
+        if self.loop is not None and self._stop_requested is None:
+            self._stop_requested = time.time()
+            self.loop.call_soon_threadsafe(self._stop_serving)
+
+    def wait(self, timeout=None):
+        if self.loop is None:
+            return
+        # Poll so the calling greenthread keeps eventlet's hub running
+        while self._stop_requested is None:
+            eventlet.sleep(_SWEEP_INTERVAL)
+        while self.connections or self.running():
+            if timeout and time.time() - self._stop_requested > timeout:
+                break
+            eventlet.sleep(0.1)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
@@ -58,5 +58,8 @@ def service_delete(context, id):
 def service_destroy(context, id):
     return IMPL.service_destroy(context, id)
 
-def service_list(context, **kwargs):
-    return IMPL.service_list(context, **kwargs)
\ No newline at end of file
+def service_list(context, limit=None, marker=None, sort_keys=None,
+                 sort_dirs=None, columns=None, **kwargs):
+    return IMPL.service_list(context, limit=limit, marker=marker,
+                             sort_keys=sort_keys, sort_dirs=sort_dirs,
+                             columns=columns, **kwargs)
\ No newline at end of file
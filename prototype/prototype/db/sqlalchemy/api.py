@@ -36,6 +36,8 @@ import retrying
 import six
 from sqlalchemy import and_
 from sqlalchemy import Boolean
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
@@ -44,6 +46,7 @@ from sqlalchemy.orm import aliased
 from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import noload
 from sqlalchemy.orm import undefer
 from sqlalchemy.schema import Table
@@ -59,6 +62,9 @@ from sqlalchemy import String
 from prototype.db.sqlalchemy import models
 from prototype.common import exception
 from prototype.common.i18n import _, _LI, _LE, _LW
+from prototype.common import metrics
+from prototype.common import timing
+from prototype.common import tracing
 from oslo_log import log as logging
 
 CONF = cfg.CONF
@@ -84,12 +90,65 @@ def _retry_on_deadlock(f):
     functools.update_wrapper(wrapped, f)
     return wrapped
 
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    span = tracing.start_span('db', statement=statement[:200])
+    conn.info.setdefault('prototype_query_started', []).append(
+        (timing.now(), span))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info.get('prototype_query_started')
+    if started:
+        begin, span = started.pop()
+        timer = timing.current()
+        if timer is not None:
+            timer.add('db', timing.now() - begin)
+        if span is not None:
+            tracing.finish_span(span)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    started = conn.info.get('prototype_query_started') if conn else None
+    if started:
+        _begin, span = started.pop()
+        if span is not None:
+            error = exception_context.original_exception
+            tracing.finish_span(span, error=error.__class__.__name__)
+
+
+def _pool_stats():
+    if _ENGINE_FACADE is None:
+        return {}
+    pool = _ENGINE_FACADE.get_engine().pool
+    stats = {}
+    # Only the queue pools keep these counts
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            stats[(name,)] = getattr(pool, name)()
+    return stats
+
+
+metrics.REGISTRY.register(metrics.Gauge(
+    'prototype_db_pool_connections',
+    'Connections of the database pool: pool size, idle (checkedin), in '
+    'use (checkedout) and overflow.', ('state',), callback=_pool_stats))
+
+
 def _create_facade_lazily():
     global _LOCK, _ENGINE_FACADE
     if _ENGINE_FACADE is None:
         with _LOCK:
             if _ENGINE_FACADE is None:
                 _ENGINE_FACADE = db_session.EngineFacade.from_config(CONF)
+                # Queries add to the timings of the API request they serve
+                event.listen(Engine, 'before_cursor_execute',
+                             _before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute',
+                             _after_cursor_execute)
+                event.listen(Engine, 'handle_error', _handle_error)
     return _ENGINE_FACADE
 
 
@@ -145,15 +204,44 @@ def service_destroy(context, id):
                     soft_delete(synchronize_session=False)
     return count
 
-def service_list(context, **kwargs):
+def service_list(context, limit=None, marker=None, sort_keys=None,
+                 sort_dirs=None, columns=None, **kwargs):
+    """Return services matching the topic, type, host and disabled filters.
+
+    Pages are keyset paginated: ``marker`` is the id of the last service
+    of the previous page, and the next page starts after its sort key
+    values.  With ``columns``, only those columns are loaded along with
+    the id and the sort keys.
+    """
     session = get_session()
     query = db_utils.model_query(models.Service, session=session)
-    
-    if 'topic' in kwargs:
-        query = query.filter_by(topic=kwargs['topic'])
-    if 'type' in kwargs:
-        query = query.filter_by(type=kwargs['type'])
-    if 'host' in kwargs:
-        query = query.filter_by(host=kwargs['host'])
-        
+
+    for key in ('topic', 'type', 'host', 'disabled'):
+        if key in kwargs:
+            query = query.filter_by(**{key: kwargs[key]})
+
+    sort_keys = list(sort_keys or [])
+    sort_dirs = list(sort_dirs or [])
+    if 'id' not in sort_keys:
+        # The id makes the sort order total, which keysets need
+        sort_keys.append('id')
+    # Keys without a direction of their own take the last one given
+    sort_dirs = sort_dirs[:len(sort_keys)]
+    sort_dirs.extend([sort_dirs[-1] if sort_dirs else 'asc'] *
+                     (len(sort_keys) - len(sort_dirs)))
+
+    if columns is not None:
+        loaded = set(columns) | set(sort_keys)
+        query = query.options(load_only(*sorted(loaded)))
+
+    marker_row = None
+    if marker is not None:
+        marker_row = db_utils.model_query(
+            models.Service, session=session).options(
+                load_only(*sort_keys)).filter_by(id=marker).first()
+        if marker_row is None:
+            raise exception.MarkerNotFound(marker=marker)
+
+    query = db_utils.paginate_query(query, models.Service, limit, sort_keys,
+                                    marker=marker_row, sort_dirs=sort_dirs)
     return query.all()
\ No newline at end of file
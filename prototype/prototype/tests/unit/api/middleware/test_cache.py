@@ -0,0 +1,77 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import webob
+import webob.dec
+
+from prototype.api.middleware import cache
+from prototype.common import memorycache
+from prototype.common import metrics
+from prototype import test
+
+
+class ResponseCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ResponseCacheTestCase, self).setUp()
+        self.flags(api_response_cache=True,
+                   api_response_cache_routes={'/': '300'})
+        client_patch = mock.patch.object(
+            cache, '_get_client', return_value=memorycache.LRUClient())
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.calls = []
+
+        @webob.dec.wsgify
+        def app(req):
+            self.calls.append(req.host_url)
+            return webob.Response(body=req.application_url,
+                                  content_type='text/plain')
+
+        self.middleware = cache.ResponseCache(app)
+
+    def _get(self, url):
+        return webob.Request.blank(url).get_response(self.middleware)
+
+    def _count(self, event):
+        for _name, labels, _extra, value in metrics.REGISTRY.get(
+                'prototype_api_response_cache_total').samples():
+            if labels == (event,):
+                return value
+        return 0
+
+    def test_cached_per_host(self):
+        first = self._get('http://internal:8787/')
+        again = self._get('http://internal:8787/')
+        public = self._get('https://public.example.com/')
+
+        self.assertEqual('MISS', first.headers['X-Cache'])
+        self.assertEqual('HIT', again.headers['X-Cache'])
+        self.assertEqual('MISS', public.headers['X-Cache'])
+        self.assertEqual(b'https://public.example.com', public.body)
+        self.assertEqual(2, len(self.calls))
+
+    def test_scheme_in_key(self):
+        self._get('http://api.example.com/')
+        response = self._get('https://api.example.com/')
+        self.assertEqual('MISS', response.headers['X-Cache'])
+
+    def test_events_counted(self):
+        hits, misses = self._count('hit'), self._count('miss')
+        self._get('http://localhost/')
+        self._get('http://localhost/')
+        self.assertEqual(hits + 1, self._count('hit'))
+        self.assertEqual(misses + 1, self._count('miss'))
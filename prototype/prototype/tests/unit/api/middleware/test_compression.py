@@ -0,0 +1,76 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import zlib
+
+import webob
+import webob.dec
+
+from prototype.api.middleware import compression
+from prototype import test
+
+
+def gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class RequestDecompressionTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RequestDecompressionTestCase, self).setUp()
+        self.flags(api_max_decompressed_body_size=4096)
+        self.bodies = []
+
+        @webob.dec.wsgify
+        def app(req):
+            self.bodies.append(req.body)
+            return webob.Response(body=b'ok', content_type='text/plain')
+
+        self.middleware = compression.CompressionMiddleware(app)
+
+    def _post(self, body):
+        req = webob.Request.blank('/', method='POST', body=body,
+                                  headers={'Content-Encoding': 'gzip'})
+        return req.get_response(self.middleware)
+
+    def test_decompressed(self):
+        resp = self._post(gzip(b'{"a": 1}'))
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual([b'{"a": 1}'], self.bodies)
+
+    def test_incompressible_body_at_the_limit(self):
+        data = os.urandom(4096)
+        self.assertEqual(200, self._post(gzip(data)).status_int)
+        self.assertEqual([data], self.bodies)
+
+    def test_too_large_once_decompressed(self):
+        self.assertEqual(413, self._post(gzip(b'a' * 4097)).status_int)
+        self.assertEqual([], self.bodies)
+
+    def test_compressed_bytes_capped(self):
+        # Bytes past the gzip member are never buffered past the cap
+        resp = self._post(gzip(b'a') + b'\0' * 65536)
+        self.assertEqual(413, resp.status_int)
+        self.assertEqual([], self.bodies)
+
+    def test_trailing_data(self):
+        resp = self._post(gzip(b'a') + b'trailing')
+        self.assertEqual(400, resp.status_int)
+        self.assertEqual([], self.bodies)
+
+    def test_invalid_gzip(self):
+        self.assertEqual(400, self._post(b'not gzip').status_int)
@@ -0,0 +1,112 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import webob
+import webob.dec
+
+from prototype.api.middleware import faultwrap
+from prototype.common import timing
+from prototype.common import tracing
+from prototype import test
+
+
+class FaultWrapperTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FaultWrapperTestCase, self).setUp()
+        self.addCleanup(timing.pop_finished)
+        self.timers = []
+
+        @webob.dec.wsgify
+        def app(req):
+            self.timers.append(timing.current())
+            if req.path == '/fail':
+                raise ValueError('boom')
+            return webob.Response(body=b'ok')
+
+        self.middleware = faultwrap.FaultWrapper(app)
+
+    def test_timer_cleared_after_request(self):
+        req = webob.Request.blank('/')
+        self.assertEqual(200, req.get_response(self.middleware).status_int)
+        self.assertIs(req.environ[timing.TIMER_ENV], self.timers[0])
+        self.assertIsNone(timing.current())
+        self.assertIs(self.timers[0], timing.pop_finished())
+
+    def test_timer_cleared_after_error(self):
+        resp = webob.Request.blank('/fail').get_response(self.middleware)
+        self.assertEqual(500, resp.status_int)
+        self.assertIsNotNone(self.timers[0])
+        self.assertIsNone(timing.current())
+
+    def test_timer_not_shared_between_requests(self):
+        webob.Request.blank('/').get_response(self.middleware)
+        webob.Request.blank('/').get_response(self.middleware)
+        self.assertIsNot(self.timers[0], self.timers[1])
+
+
+class FaultWrapperTracingTestCase(test.TestCase):
+
+    def setUp(self):
+        super(FaultWrapperTracingTestCase, self).setUp()
+        self.addCleanup(timing.pop_finished)
+        self.exporter = tracing.RingBufferExporter()
+        exporter_patch = mock.patch.object(tracing, '_exporter',
+                                           self.exporter)
+        exporter_patch.start()
+        self.addCleanup(exporter_patch.stop)
+
+        @webob.dec.wsgify
+        def app(req):
+            if req.path == '/stream':
+                return webob.Response(app_iter=self._stream())
+            return webob.Response(body=b'ok')
+
+        self.middleware = faultwrap.FaultWrapper(app)
+
+    def _stream(self):
+        yield b'a'
+        # Serialized after the middleware returned
+        self.assertEqual([], self.exporter.spans())
+        yield b'b'
+
+    def test_span_finished(self):
+        resp = webob.Request.blank('/').get_response(self.middleware)
+        spans = self.exporter.spans()
+        self.assertEqual(1, len(spans))
+        self.assertEqual(resp.headers[tracing.TRACE_HEADER],
+                         spans[0]['trace_id'])
+        self.assertIsNone(tracing.current())
+
+    def test_span_finished_on_error(self):
+        with mock.patch.object(faultwrap._REQUESTS, 'inc',
+                               side_effect=RuntimeError('boom')):
+            self.assertRaises(RuntimeError, webob.Request.blank(
+                '/').get_response, self.middleware)
+        self.assertIsNone(tracing.current())
+        self.assertEqual('RuntimeError',
+                         self.exporter.spans()[0]['tags']['error'])
+        self.assertIsNone(timing.current())
+
+    def test_span_covers_streamed_body(self):
+        resp = webob.Request.blank('/stream').get_response(self.middleware)
+        self.assertIsNone(tracing.current())
+        self.assertEqual([], self.exporter.spans())
+        self.assertEqual([b'a', b'b'], list(resp.app_iter))
+        resp.app_iter.close()
+        spans = self.exporter.spans()
+        self.assertEqual(1, len(spans))
+        self.assertEqual(200, spans[0]['tags']['status'])
@@ -0,0 +1,148 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import webob
+import webob.dec
+
+from prototype.api.middleware import ratelimit
+from prototype import test
+
+
+class FakeMemcache(object):
+    """memcached client checking the store lock isn't held."""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.values = {}
+        self.down = False
+
+    def _check_lock(self):
+        if self.store is not None:
+            assert not self.store._lock.locked()
+
+    def incr(self, key, delta=1):
+        self._check_lock()
+        if self.down or key not in self.values:
+            return None
+        self.values[key] += delta
+        return self.values[key]
+
+    def add(self, key, value, time=0):
+        self._check_lock()
+        if not self.down:
+            self.values.setdefault(key, int(value))
+
+
+class FakeContext(object):
+    tenant = 'tenant'
+    user = 'user'
+
+
+class SharedStoreTestCase(test.TestCase):
+
+    def setUp(self):
+        super(SharedStoreTestCase, self).setUp()
+        self.client = FakeMemcache()
+        self.store = ratelimit.SharedStore(self.client, lease_size=2)
+        self.client.store = self.store
+        self.limit = ratelimit.Limit('5/minute')
+
+    def test_limit_holds(self):
+        delays = [self.store.consume('k', self.limit, 10.0)
+                  for _i in range(6)]
+        self.assertEqual([0] * 5, delays[:5])
+        self.assertEqual(50.0, delays[5])
+
+    def test_new_window_resets(self):
+        for _i in range(5):
+            self.store.consume('k', self.limit, 10.0)
+        self.assertEqual(0, self.store.consume('k', self.limit, 61.0))
+
+    def test_leases_shared_between_stores(self):
+        other = ratelimit.SharedStore(self.client, lease_size=2)
+        self.assertEqual(0, self.store.consume('k', self.limit, 1.0))
+        for _i in range(3):
+            self.assertEqual(0, other.consume('k', self.limit, 1.0))
+        self.assertEqual(0, self.store.consume('k', self.limit, 1.0))
+        self.assertNotEqual(0, self.store.consume('k', self.limit, 1.0))
+        self.assertNotEqual(0, other.consume('k', self.limit, 1.0))
+
+    def test_expired_leases_pruned(self):
+        self.store.consume('a', self.limit, 1.0)
+        self.store.consume('b', self.limit, 1.0)
+        self.assertEqual(2, len(self.store._leases))
+        self.store.consume('c', self.limit, 61.0 + self.store.prune_interval)
+        self.assertEqual(['c'], list(self.store._leases))
+
+    def test_refund(self):
+        for _i in range(5):
+            self.store.consume('k', self.limit, 10.0)
+        self.store.refund('k', self.limit, 10.0)
+        self.assertEqual(0, self.store.consume('k', self.limit, 10.0))
+        self.assertNotEqual(0, self.store.consume('k', self.limit, 10.0))
+
+    @mock.patch.object(ratelimit.LOG, 'warning')
+    def test_unavailable_warns_once(self, warning):
+        self.client.down = True
+        for _i in range(10):
+            self.assertEqual(0, self.store.consume('k', self.limit, 1.0))
+        self.assertEqual(1, warning.call_count)
+
+
+class RateLimitingMiddlewareTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RateLimitingMiddlewareTestCase, self).setUp()
+
+        @webob.dec.wsgify
+        def app(req):
+            return 'ok'
+
+        self.app = app
+
+    def _get(self, middleware, user='user'):
+        req = webob.Request.blank('/')
+        ctx = FakeContext()
+        ctx.user = user
+        req.environ['prototype.context'] = ctx
+        return req.get_response(middleware)
+
+    def test_disabled_by_default(self):
+        self.flags(api_rate_limit_tenant='1/minute')
+        middleware = ratelimit.RateLimitingMiddleware(self.app)
+        for _i in range(3):
+            self.assertEqual(200, self._get(middleware).status_int)
+
+    def test_tenant_limit(self):
+        self.flags(api_rate_limit=True, api_rate_limit_tenant='2/minute',
+                   api_rate_limit_user='')
+        middleware = ratelimit.RateLimitingMiddleware(self.app)
+        self.assertEqual(200, self._get(middleware).status_int)
+        self.assertEqual(200, self._get(middleware).status_int)
+        response = self._get(middleware)
+        self.assertEqual(429, response.status_int)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_rejected_request_keeps_tenant_quota(self):
+        self.flags(api_rate_limit=True, api_rate_limit_tenant='3/minute',
+                   api_rate_limit_user='1/minute')
+        middleware = ratelimit.RateLimitingMiddleware(self.app)
+        self.assertEqual(200, self._get(middleware).status_int)
+        for _i in range(5):
+            self.assertEqual(429, self._get(middleware).status_int)
+        self.assertEqual(200, self._get(middleware, 'other').status_int)
+        self.assertEqual(200, self._get(middleware, 'third').status_int)
+        self.assertEqual(429, self._get(middleware, 'fourth').status_int)
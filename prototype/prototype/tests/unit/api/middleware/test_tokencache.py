@@ -0,0 +1,154 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import mock
+import webob
+import webob.dec
+
+from prototype.api.middleware import tokencache
+from prototype import test
+
+
+class RevocationEventsTestCase(test.TestCase):
+
+    def test_refresh_does_not_wait_for_the_fetch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            started.set()
+            release.wait(5)
+            return [{'audit_id': 'a'}]
+
+        events = tokencache.RevocationEvents(60, fetch=fetch)
+        events.refresh()
+        self.assertTrue(started.wait(5))
+        self.assertFalse(events.is_fresh())
+        release.set()
+        events._thread.join(5)
+        self.assertTrue(events.is_fresh())
+        self.assertTrue(events.is_revoked({'audit_ids': ['a']}))
+
+    def test_stale_after_failed_fetches(self):
+        events = tokencache.RevocationEvents(60, fetch=lambda: [])
+        with mock.patch('time.time', return_value=1000.0):
+            events.refresh()
+            events._thread.join(5)
+            self.assertTrue(events.is_fresh())
+        events.fetch = mock.Mock(side_effect=IOError('keystone is down'))
+        with mock.patch('time.time', return_value=1070.0):
+            events.refresh()
+            events._thread.join(5)
+            self.assertTrue(events.is_fresh())
+        with mock.patch('time.time', return_value=1130.0):
+            events.refresh()
+            events._thread.join(5)
+            self.assertFalse(events.is_fresh())
+        self.assertEqual(2, events.fetch.call_count)
+
+    @mock.patch.object(tokencache.LOG, 'warning')
+    def test_warns_once_while_stale(self, warning):
+        events = tokencache.RevocationEvents(
+            60, fetch=mock.Mock(side_effect=IOError('no credentials')))
+        for now in (1000.0, 1060.0, 1120.0):
+            with mock.patch('time.time', return_value=now):
+                events.refresh()
+                events._thread.join(5)
+        self.assertEqual(3, events.fetch.call_count)
+        self.assertEqual(1, warning.call_count)
+        events.fetch = lambda: []
+        with mock.patch('time.time', return_value=1180.0):
+            events.refresh()
+            events._thread.join(5)
+            self.assertTrue(events.is_fresh())
+        self.assertFalse(events._stale_warned)
+
+    def test_disabled_is_always_fresh(self):
+        events = tokencache.RevocationEvents(0, fetch=mock.Mock())
+        events.refresh()
+        self.assertIsNone(events._thread)
+        self.assertTrue(events.is_fresh())
+
+
+class TokenCacheMiddlewareTestCase(test.TestCase):
+
+    def setUp(self):
+        super(TokenCacheMiddlewareTestCase, self).setUp()
+        self.validations = []
+
+        def auth_filter(app):
+            def auth(environ, start_response):
+                self.validations.append(environ['HTTP_X_AUTH_TOKEN'])
+                environ['HTTP_X_IDENTITY_STATUS'] = 'Confirmed'
+                environ['HTTP_X_USER_ID'] = 'user'
+                return app(environ, start_response)
+            return auth
+
+        @webob.dec.wsgify
+        def app(req):
+            return webob.Response(body=req.environ['HTTP_X_USER_ID'])
+
+        self.middleware = tokencache.TokenCacheMiddleware(app, auth_filter)
+        self.middleware.revocations.fetch = lambda: []
+
+    def _get_now(self, token):
+        req = webob.Request.blank('/', headers={'X-Auth-Token': token})
+        return req.get_response(self.middleware)
+
+    def _get(self, token):
+        resp = self._get_now(token)
+        thread = self.middleware.revocations._thread
+        if thread is not None:
+            thread.join(5)
+        return resp
+
+    def _fetch_events(self):
+        self.middleware.revocations.refresh()
+        self.middleware.revocations._thread.join(5)
+
+    def test_not_cached_before_the_events_are_fetched(self):
+        release = threading.Event()
+
+        def fetch():
+            release.wait(5)
+            return []
+
+        self.middleware.revocations.fetch = fetch
+        self.assertEqual(b'user', self._get_now('token').body)
+        self.assertEqual(b'user', self._get_now('token').body)
+        release.set()
+        self.middleware.revocations._thread.join(5)
+        self.assertEqual(['token', 'token'], self.validations)
+
+    def test_cached_once_events_are_fresh(self):
+        self._fetch_events()
+        for _i in range(3):
+            self.assertEqual(b'user', self._get('token').body)
+        self.assertEqual(['token'], self.validations)
+
+    def test_stale_events_bypass_the_cache(self):
+        self.middleware.revocations.fetch = mock.Mock(
+            side_effect=IOError('keystone is down'))
+        for _i in range(3):
+            self.assertEqual(b'user', self._get('token').body)
+        self.assertEqual(['token'] * 3, self.validations)
+
+    def test_non_ascii_byte_token(self):
+        self._fetch_events()
+        for _i in range(3):
+            self.assertEqual(b'user', self._get(b't\xc3\xa9').body)
+        self.assertEqual(1, len(self.validations))
@@ -0,0 +1,41 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import webob
+
+from prototype.api import metrics
+from prototype import test
+
+
+class MetricsTestCase(test.TestCase):
+
+    def _get(self, method='GET'):
+        req = webob.Request.blank('/metrics', method=method)
+        return req.get_response(metrics.Metrics())
+
+    def test_disabled_by_default(self):
+        resp = self._get()
+        self.assertEqual(404, resp.status_int)
+        self.assertEqual(b'', resp.body)
+
+    def test_enabled(self):
+        self.flags(api_metrics=True)
+        resp = self._get()
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('text/plain', resp.content_type)
+
+    def test_only_get(self):
+        self.flags(api_metrics=True)
+        self.assertEqual(405, self._get('POST').status_int)
@@ -0,0 +1,70 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from prototype.api import root
+from prototype import test
+
+
+class Layer(object):
+
+    def __init__(self, name, app):
+        self.name = name
+        self.app = app
+
+
+class FakeLoader(object):
+
+    def __init__(self):
+        self.router = Layer('router', None)
+
+    def get_filter(self, name):
+        return lambda app: Layer(name, app)
+
+    def get_app(self, name):
+        return self.router
+
+
+def names(app):
+    result = []
+    while app is not None:
+        result.append(app.name)
+        app = app.app
+    return result
+
+
+class LoadPipelineTestCase(test.TestCase):
+
+    def setUp(self):
+        super(LoadPipelineTestCase, self).setUp()
+        self.flags(api_collapse_pipeline=False)
+        self.loader = FakeLoader()
+
+    def test_subrequests_enter_after_auth(self):
+        app = root._load_pipeline(self.loader, ['faultwrap', 'authtoken',
+                                                'keystonecontext',
+                                                'ratelimit', 'cache',
+                                                'apiv1app'])
+        self.assertEqual(['faultwrap', 'authtoken', 'keystonecontext',
+                          'ratelimit', 'cache', 'router'], names(app))
+        subrequest_app = self.loader.router.subrequest_app
+        self.assertEqual(['ratelimit', 'cache', 'router'],
+                         names(subrequest_app))
+        # The same filter instances serve both
+        self.assertIs(app.app.app.app, subrequest_app)
+
+    def test_no_auth_filter(self):
+        root._load_pipeline(self.loader, ['cache', 'apiv1app'])
+        self.assertEqual(['cache', 'router'],
+                         names(self.loader.router.subrequest_app))
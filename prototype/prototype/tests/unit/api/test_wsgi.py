@@ -0,0 +1,58 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import webob
+
+from prototype.api import wsgi
+from prototype import test
+
+
+class FakeController(wsgi.Controller):
+
+    @wsgi.action('reboot')
+    def _reboot(self, req, id, body):
+        return {'rebooted': id, 'type': body['reboot']['type']}
+
+
+class ActionTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ActionTestCase, self).setUp()
+        self.resource = wsgi.Resource(FakeController())
+
+    def _post(self, content_type, body):
+        req = webob.Request.blank('/servers/1/action', method='POST',
+                                  content_type=content_type, body=body)
+        req.environ['wsgiorg.routing_args'] = (
+            (), {'action': 'action', 'id': '1'})
+        return req.get_response(self.resource)
+
+    def test_json_action(self):
+        resp = self._post('application/json',
+                          b'{"reboot": {"type": "HARD"}}')
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual({'rebooted': '1', 'type': 'HARD'},
+                         json.loads(resp.body))
+
+    def test_unknown_action(self):
+        resp = self._post('application/json', b'{"resize": {}}')
+        self.assertEqual(400, resp.status_int)
+
+    def test_ndjson_action_unsupported(self):
+        resp = self._post('application/x-ndjson',
+                          b'{"reboot": {"type": "HARD"}}\n')
+        self.assertEqual(415, resp.status_int)
@@ -0,0 +1,130 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import webob
+import webob.dec
+import webob.exc
+
+from prototype.api.v1 import batch
+from prototype import test
+
+
+class FakeRouter(object):
+    """Records the order sub-requests run in."""
+
+    def __init__(self):
+        self.log = []
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        self.log.append('%s %s start' % (req.method, req.path))
+        if req.path == '/fail':
+            raise RuntimeError('boom')
+        if req.path == '/missing':
+            return webob.exc.HTTPNotFound()
+        # Let concurrent sub-requests interleave
+        eventlet.sleep(0)
+        self.log.append('%s %s end' % (req.method, req.path))
+        size = int(req.GET.get('size', 0))
+        return webob.Response(body=b'x' * size if size else req.path,
+                              content_type='text/plain')
+
+
+class BatchTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BatchTestCase, self).setUp()
+        self.router = FakeRouter()
+        self.controller = batch.Controller(self.router)
+
+    def _batch(self, *requests):
+        req = webob.Request.blank('/batch', method='POST')
+        body = {'requests': [dict(method=method, path=path)
+                             for method, path in requests]}
+        return self.controller.create(req, body)['responses']
+
+    def test_responses_in_order(self):
+        responses = self._batch(('GET', '/a'), ('GET', '/b'),
+                                ('POST', '/c'), ('GET', '/d'))
+        self.assertEqual([200] * 4, [r['status'] for r in responses])
+        self.assertEqual(['/a', '/b', '/c', '/d'],
+                         [r['body'] for r in responses])
+
+    def test_writes_wait_for_reads_before_them(self):
+        self._batch(('GET', '/a'), ('GET', '/b'), ('POST', '/c'),
+                    ('PUT', '/d'), ('GET', '/e'))
+        log = self.router.log
+        # The reads before the write run concurrently
+        self.assertLess(log.index('GET /b start'), log.index('GET /a end'))
+        # Writes run alone and in order
+        self.assertLess(log.index('GET /a end'), log.index('POST /c start'))
+        self.assertLess(log.index('GET /b end'), log.index('POST /c start'))
+        self.assertEqual(log.index('POST /c start') + 1,
+                         log.index('POST /c end'))
+        self.assertLess(log.index('POST /c end'), log.index('PUT /d start'))
+        self.assertLess(log.index('PUT /d end'), log.index('GET /e start'))
+
+    def test_failures_stay_in_their_response(self):
+        responses = self._batch(('GET', '/a'), ('GET', '/fail'),
+                                ('GET', '/missing'), ('POST', '/fail'),
+                                ('POST', '/b'))
+        self.assertEqual([200, 500, 404, 500, 200],
+                         [r['status'] for r in responses])
+        self.assertEqual('/b', responses[4]['body'])
+
+    def test_invalid_batches(self):
+        req = webob.Request.blank('/batch', method='POST')
+        for body in ({}, {'requests': []}, {'requests': [{'path': '/a'}]},
+                     {'requests': [{'method': 'GET', 'path': 'a'}]},
+                     {'requests': [{'method': 'GET', 'path': '/batch'}]}):
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.controller.create, req, body)
+
+    def test_too_many_requests(self):
+        self.flags(api_batch_max_requests=2)
+        self.assertRaises(webob.exc.HTTPRequestEntityTooLarge, self._batch,
+                          ('GET', '/a'), ('GET', '/b'), ('GET', '/c'))
+
+    def test_budget_holds_with_concurrent_requests(self):
+        self.flags(api_batch_max_response_size=250)
+        responses = self._batch(*[('GET', '/r%d?size=100' % i)
+                                  for i in range(5)])
+        sizes = [len(r.get('body', '')) for r in responses]
+        self.assertLessEqual(sum(sizes), 250)
+        self.assertEqual([200] * 5, [r['status'] for r in responses])
+        self.assertEqual(3, len([r for r in responses if r.get('truncated')]))
+
+    def test_budget_stops_later_requests(self):
+        self.flags(api_batch_max_response_size=150)
+        responses = self._batch(('POST', '/a?size=100'),
+                                ('POST', '/b?size=100'),
+                                ('POST', '/c?size=10'))
+        self.assertEqual([200, 200, 413], [r['status'] for r in responses])
+        self.assertTrue(responses[1]['truncated'])
+        self.assertNotIn('body', responses[1])
+        self.assertNotIn('POST /c start', self.router.log)
+
+    def test_subrequests_use_filtered_pipeline(self):
+        seen = []
+
+        @webob.dec.wsgify
+        def filtered(req):
+            seen.append(req.path)
+            return req.get_response(self.router)
+
+        self.router.subrequest_app = filtered
+        self._batch(('GET', '/a'), ('POST', '/b'))
+        self.assertEqual(['/a', '/b'], seen)
@@ -0,0 +1,125 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gc
+
+import mock
+from oslo_config import cfg
+from oslo_db import options
+import webob
+import webob.exc
+
+from prototype.api.v1 import services
+from prototype.db.sqlalchemy import api as db_api
+from prototype.db.sqlalchemy import models
+from prototype import test
+
+
+class FakeContext(object):
+    project_id = 'fake'
+
+
+class ServicesTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ServicesTestCase, self).setUp()
+        options.set_defaults(cfg.CONF)
+        self.flags(connection='sqlite://', group='database')
+        facade_patch = mock.patch.object(db_api, '_ENGINE_FACADE', None)
+        facade_patch.start()
+        self.addCleanup(facade_patch.stop)
+        models.BASE.metadata.create_all(db_api.get_engine())
+        # Every third service is a disabled scheduler
+        for i in range(1, 8):
+            db_api.service_create(None, {
+                'host': 'host-%d' % (8 - i),
+                'type': 'scheduler' if i % 3 == 0 else 'worker',
+                'topic': 'prototype',
+                'disabled': i % 3 == 0})
+        self.controller = services.Controller()
+
+    def _index(self, query=''):
+        req = webob.Request.blank('/fake/services?' + query,
+                                  base_url='http://localhost/v1')
+        req.environ['prototype.context'] = FakeContext()
+        collection = self.controller.index(req)
+        # Drop what the listing session left behind, as a server would
+        gc.collect()
+        return collection.to_dict()
+
+    def _ids(self, result):
+        return [service['id'] for service in result['services']]
+
+    def _next_marker(self, result):
+        links = result.get('services_links')
+        if not links:
+            return None
+        return webob.Request.blank(links[0]['href']).GET['marker']
+
+    def test_keyset_paging(self):
+        ids = []
+        query = 'limit=3'
+        while True:
+            result = self._index(query)
+            ids.extend(self._ids(result))
+            marker = self._next_marker(result)
+            if marker is None:
+                break
+            query = 'limit=3&marker=%s' % marker
+        self.assertEqual(list(range(1, 8)), ids)
+
+    def test_keyset_paging_sorted(self):
+        result = self._index('sort_key=host&limit=4')
+        self.assertEqual([7, 6, 5, 4], self._ids(result))
+        result = self._index('sort_key=host&limit=4&marker=%s' %
+                             self._next_marker(result))
+        self.assertEqual([3, 2, 1], self._ids(result))
+        self.assertNotIn('services_links', result)
+
+    def test_unknown_marker(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._index,
+                          'marker=42')
+
+    def test_zero_limit_is_a_full_page(self):
+        self.flags(osapi_max_limit=3)
+        result = self._index('limit=0')
+        self.assertEqual([1, 2, 3], self._ids(result))
+        self.assertEqual('3', self._next_marker(result))
+
+    def test_filters(self):
+        result = self._index('type=scheduler')
+        self.assertEqual([3, 6], self._ids(result))
+        result = self._index('disabled=false&host=host-1')
+        self.assertEqual([7], self._ids(result))
+
+    def test_invalid_filter(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._index,
+                          'disabled=maybe')
+
+    def test_fields(self):
+        result = self._index('fields=host,disabled&type=scheduler')
+        self.assertEqual(set(['id', 'links', 'host', 'disabled']),
+                         set(result['services'][0]))
+        self.assertEqual('host-5', result['services'][0]['host'])
+
+    def test_empty_fields_returns_every_column(self):
+        for query in ('fields=', 'fields=,'):
+            service = self._index(query)['services'][0]
+            self.assertEqual(set(services._COLUMNS) | set(['links']),
+                             set(service))
+
+    def test_invalid_fields(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._index,
+                          'fields=host,password')
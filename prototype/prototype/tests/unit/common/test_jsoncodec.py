@@ -0,0 +1,88 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import uuid
+
+import netaddr
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+
+from prototype.common import exception
+from prototype.common import jsoncodec
+from prototype import test
+
+
+DOCUMENT = {
+    'services': [
+        {'id': 1, 'host': u'h\xf6st', 'disabled': False, 'ratio': 0.1,
+         'created_at': datetime.datetime(2015, 3, 4, 5, 6, 7, 8),
+         'updated_at': None, 'tags': ('a', 'b'),
+         'uuid': uuid.UUID(int=1), 'address': netaddr.IPAddress('10.0.0.1'),
+         'links': [{'rel': 'self', 'href': 'http://x/v1/services/1'}]},
+    ],
+    'count': 1,
+}
+
+
+class JSONCodecTestCase(test.TestCase):
+
+    def setUp(self):
+        super(JSONCodecTestCase, self).setUp()
+        jsoncodec.reset()
+        self.addCleanup(jsoncodec.reset)
+
+    def _backends(self):
+        return [backend for backend in jsoncodec._COMPATIBLE_BACKENDS
+                if importutils.try_import(backend) is not None]
+
+    def test_dumps_matches_jsonutils(self):
+        expected = jsonutils.dumps(DOCUMENT)
+        for backend in self._backends():
+            codec = jsoncodec.JSONCodec(backend)
+            self.assertEqual(expected, codec.dumps(DOCUMENT), backend)
+
+    def test_loads_matches_jsonutils(self):
+        data = jsonutils.dumps(DOCUMENT)
+        for backend in self._backends():
+            codec = jsoncodec.JSONCodec(backend)
+            self.assertEqual(jsonutils.loads(data), codec.loads(data),
+                             backend)
+
+    def test_loads_utf8(self):
+        codec = jsoncodec.JSONCodec('json')
+        data = u'{"host": "h\xf6st"}'.encode('utf-8')
+        self.assertEqual({'host': u'h\xf6st'}, codec.loads(data))
+
+    def test_compact(self):
+        codec = jsoncodec.JSONCodec('json', compact=True)
+        self.assertEqual('{"a":[1,2]}', codec.dumps({'a': [1, 2]}))
+
+    def test_ujson_requires_compact(self):
+        self.assertRaises(exception.InvalidInput,
+                          jsoncodec.JSONCodec, 'ujson')
+
+    def test_unknown_backend(self):
+        self.assertRaises(exception.InvalidInput,
+                          jsoncodec.JSONCodec, 'yaml', compact=True)
+
+    def test_auto_never_picks_ujson(self):
+        self.flags(json_codec='auto', json_compact=True)
+        self.assertIn(jsoncodec.get_codec().name,
+                      jsoncodec._COMPATIBLE_BACKENDS)
+
+    def test_explicit_backend(self):
+        self.flags(json_codec='json')
+        self.assertEqual('json', jsoncodec.get_codec().name)
@@ -0,0 +1,54 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import mock
+
+from prototype.common import rpc
+from prototype import test
+
+
+class RPCSerializerTestCase(test.TestCase):
+
+    def test_payload_serializer_converts(self):
+        entity = {'when': datetime.datetime(2015, 1, 2, 3, 4, 5),
+                  'pair': (1, 2)}
+        result = rpc.JsonPayloadSerializer.serialize_entity(None, entity)
+        self.assertEqual('2015-01-02T03:04:05.000000', result['when'])
+        self.assertEqual([1, 2], list(result['pair']))
+
+    @mock.patch.object(rpc, 'TRANSPORT', mock.sentinel.transport)
+    @mock.patch('oslo_messaging.RPCClient')
+    def test_client_uses_payload_serializer(self, client):
+        rpc.get_client(mock.sentinel.target)
+        serializer = client.call_args[1]['serializer']
+        self.assertIsInstance(serializer, rpc.RequestContextSerializer)
+        self.assertIsInstance(serializer._base, rpc.JsonPayloadSerializer)
+
+    @mock.patch.object(rpc, 'TRANSPORT', mock.sentinel.transport)
+    @mock.patch('oslo_messaging.get_rpc_server')
+    def test_server_uses_payload_serializer(self, get_rpc_server):
+        rpc.get_server(mock.sentinel.target, [])
+        serializer = get_rpc_server.call_args[1]['serializer']
+        self.assertIsInstance(serializer._base, rpc.JsonPayloadSerializer)
+
+    @mock.patch.object(rpc, 'TRANSPORT', mock.sentinel.transport)
+    @mock.patch('oslo_messaging.RPCClient')
+    def test_client_keeps_given_serializer(self, client):
+        rpc.get_client(mock.sentinel.target,
+                       serializer=mock.sentinel.serializer)
+        serializer = client.call_args[1]['serializer']
+        self.assertEqual(mock.sentinel.serializer, serializer._base)
@@ -0,0 +1,192 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet.green import httplib
+import mock
+import webob
+
+from prototype.common import wsgi
+from prototype import test
+
+
+def ok_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'ok']
+
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    if environ['PATH_INFO'] == '/list':
+        return [b'hello ', b'world']
+    return (part for part in (b'hello ', b'world'))
+
+
+class ServerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ServerTestCase, self).setUp()
+        self.server = wsgi.Server('test', streaming_app, host='127.0.0.1',
+                                  port=0)
+        self.server.start()
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.stop)
+
+    def _get(self, path):
+        conn = httplib.HTTPConnection(self.server.host, self.server.port,
+                                      timeout=5)
+        try:
+            conn.request('GET', path)
+            resp = conn.getresponse()
+            return resp.getheader('content-length'), resp.read()
+        finally:
+            conn.close()
+
+    def test_streamed_body(self):
+        length, body = self._get('/stream')
+        self.assertIsNone(length)
+        self.assertEqual(b'hello world', body)
+
+    def test_sized_body(self):
+        self.assertEqual(('11', b'hello world'), self._get('/list'))
+
+
+class AdmissionControllerTestCase(test.TestCase):
+
+    def setUp(self):
+        super(AdmissionControllerTestCase, self).setUp()
+        self.now = 1000.0
+        time_patch = mock.patch('time.time', lambda: self.now)
+        time_patch.start()
+        self.addCleanup(time_patch.stop)
+        self.admission = wsgi.AdmissionController(ok_app,
+                                                  max_queue_latency=1.0)
+
+    def _request(self, queued_for=None):
+        req = webob.Request.blank('/')
+        if queued_for is not None:
+            req.environ[wsgi.QUEUED_AT_ENV] = self.now - queued_for
+        return req.get_response(self.admission)
+
+    def test_sheds_while_queue_latency_high(self):
+        for _i in range(30):
+            self._request(queued_for=5.0)
+        self.assertGreater(self.admission.queue_latency, 1.0)
+        self.assertEqual(503, self._request().status_int)
+
+    def test_latency_decays_without_new_connections(self):
+        for _i in range(30):
+            self._request(queued_for=5.0)
+        self.assertEqual(503, self._request().status_int)
+
+        # Only keepalive requests from here, none of them sampled
+        self.now += 10 * wsgi._LATENCY_HALF_LIFE
+        self.assertLess(self.admission.queue_latency, 1.0)
+        self.assertEqual(200, self._request().status_int)
+
+    def test_half_life(self):
+        self._request(queued_for=10.0)
+        latency = self.admission.queue_latency
+        self.now += wsgi._LATENCY_HALF_LIFE
+        self.assertAlmostEqual(latency / 2, self.admission.queue_latency)
+
+    def test_max_requests(self):
+        self.admission.max_requests = 1
+        self.admission.in_flight = 1
+        response = self._request()
+        self.assertEqual(503, response.status_int)
+        self.assertEqual('1', response.headers['Retry-After'])
+
+    def test_health_check_never_shed(self):
+        self.admission.health_check_path = '/healthcheck'
+        self.admission.max_requests = 1
+        self.admission.in_flight = 1
+        req = webob.Request.blank('/healthcheck')
+        self.assertEqual(200, req.get_response(self.admission).status_int)
+
+
+class FakeEngine(object):
+    """Engine serving ``load`` concurrent requests with a fixed pool."""
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self.load = 0
+
+    def resize(self, pool_size):
+        self.pool_size = pool_size
+
+    def running(self):
+        return min(self.load, self.pool_size)
+
+    def free(self):
+        return max(0, self.pool_size - self.load)
+
+
+class FakeAdmission(object):
+
+    def __init__(self, engine, target):
+        self.engine = engine
+        self.target = target
+
+    @property
+    def queue_latency(self):
+        # Requests beyond the pool size wait for a slot
+        if self.engine.load > self.engine.pool_size:
+            return self.target * 10
+        return 0.0
+
+
+class AutotuneTestCase(test.TestCase):
+
+    def setUp(self):
+        super(AutotuneTestCase, self).setUp()
+        self.flags(wsgi_target_queue_latency=0.05, wsgi_pool_min_size=100,
+                   wsgi_pool_max_size=4000)
+        self.server = wsgi.Server.__new__(wsgi.Server)
+        self.server.name = 'test'
+        self.server.pool_size = 1000
+        self.engine = FakeEngine(1000)
+        self.server._engine = self.engine
+        self.server.admission = FakeAdmission(self.engine, 0.05)
+
+    def _run(self, load, ticks=60):
+        self.engine.load = load
+        for _i in range(ticks):
+            self.server._autotune()
+        self.assertEqual(self.server.pool_size, self.engine.pool_size)
+        return self.server.pool_size
+
+    def test_grows_under_load(self):
+        size = self._run(2500)
+        self.assertGreaterEqual(size, 2500)
+        self.assertLess(size, 2500 * 1.5)
+
+    def test_stays_when_load_fits(self):
+        self.assertEqual(1000, self._run(950))
+
+    def test_shrinks_when_idle(self):
+        self._run(2500)
+        size = self._run(300)
+        self.assertGreaterEqual(size, 300)
+        self.assertLess(size, 400)
+        self.assertEqual(100, self._run(0))
+
+    def test_bounded(self):
+        self.assertEqual(4000, self._run(10000))
+
+    def test_latency_with_free_slots(self):
+        self.server.admission = mock.Mock(queue_latency=1.0)
+        self.engine.load = 10
+        self.server._autotune()
+        self.assertEqual(1000, self.server.pool_size)
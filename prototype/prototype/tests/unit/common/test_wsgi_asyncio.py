@@ -0,0 +1,275 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import mock
+import testtools
+
+from prototype.common import wsgi_asyncio
+from prototype import test
+
+
+def echo_app(environ, start_response):
+    """Answer with the request line and the body read."""
+    body = environ['wsgi.input'].read()
+    data = ('%s %s?%s\n' % (environ['REQUEST_METHOD'], environ['PATH_INFO'],
+                            environ['QUERY_STRING'])).encode('latin-1')
+    data += body
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(data)))])
+    return [data]
+
+
+def streaming_app(environ, start_response):
+    """Answer without Content-Length, one piece at a time."""
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return iter([b'one', b'two', b'three'])
+
+
+class FakeServer(object):
+
+    def __init__(self, app, sock):
+        self.name = 'test'
+        self.host, self.port = sock.getsockname()[:2]
+        self._family = socket.AF_INET
+        self._backlog = 16
+        self._max_url_len = None
+        self._logger = mock.Mock()
+        self.admission = app
+        self.keepalive = True
+        self.client_socket_timeout = None
+
+
+class Client(object):
+    """HTTP client reading responses from a kept buffer."""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.settimeout(5)
+        self.buffer = b''
+
+    def close(self):
+        self.sock.close()
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def _fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise EOFError()
+        self.buffer += data
+
+    def _read_until(self, separator):
+        while separator not in self.buffer:
+            self._fill()
+        data, _sep, self.buffer = self.buffer.partition(separator)
+        return data
+
+    def _read(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def response(self):
+        lines = self._read_until(b'\r\n\r\n').decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _sep, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            body = self._read(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self._read_until(b'\r\n'), 16)
+                chunk = self._read(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+        else:
+            try:
+                while True:
+                    self._fill()
+            except EOFError:
+                pass
+            body, self.buffer = self.buffer, b''
+        return status, headers, body
+
+    def closed(self):
+        try:
+            while True:
+                self._fill()
+        except EOFError:
+            return True
+        except socket.timeout:
+            return False
+
+
+@testtools.skipIf(wsgi_asyncio.asyncio is None, 'asyncio is not available')
+class AsyncioEngineTestCase(test.TestCase):
+
+    def _start(self, app=echo_app):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(16)
+        server = FakeServer(app, listener)
+        engine = wsgi_asyncio.AsyncioEngine(server, 4)
+        engine.start(listener)
+        self.addCleanup(self._stop, engine)
+        self.port = server.port
+        return engine
+
+    @staticmethod
+    def _stop(engine):
+        engine.stop()
+        engine.wait(timeout=5)
+
+    def _client(self):
+        client = Client(self.port)
+        self.addCleanup(client.close)
+        return client
+
+    def test_get(self):
+        self._start()
+        client = self._client()
+        client.send(b'GET /a%20b?x=1 HTTP/1.1\r\nHost: h\r\n\r\n')
+        status, headers, body = client.response()
+        self.assertEqual(200, status)
+        self.assertEqual(b'GET /a b?x=1\n', body)
+        self.assertNotIn('connection', headers)
+
+    def test_content_length_body(self):
+        self._start()
+        client = self._client()
+        client.send(b'POST / HTTP/1.1\r\nHost: h\r\nContent-Length: 5\r\n'
+                    b'\r\nhello')
+        self.assertEqual(b'POST /?\nhello', client.response()[2])
+
+    def test_keepalive(self):
+        self._start()
+        client = self._client()
+        for path in (b'/one', b'/two', b'/three'):
+            client.send(b'GET ' + path + b' HTTP/1.1\r\nHost: h\r\n\r\n')
+            status, _headers, body = client.response()
+            self.assertEqual(200, status)
+            self.assertEqual(b'GET ' + path + b'?\n', body)
+
+    def test_connection_close(self):
+        self._start()
+        client = self._client()
+        client.send(b'GET / HTTP/1.1\r\nHost: h\r\nConnection: close\r\n\r\n')
+        status, headers, _body = client.response()
+        self.assertEqual(200, status)
+        self.assertEqual('close', headers['connection'])
+        self.assertTrue(client.closed())
+
+    def test_http10_closes(self):
+        self._start()
+        client = self._client()
+        client.send(b'GET / HTTP/1.0\r\n\r\n')
+        self.assertEqual(200, client.response()[0])
+        self.assertTrue(client.closed())
+
+    def test_pipelining(self):
+        self._start()
+        client = self._client()
+        client.send(b'POST /one HTTP/1.1\r\nHost: h\r\nContent-Length: 3\r\n'
+                    b'\r\nabc'
+                    b'GET /two HTTP/1.1\r\nHost: h\r\n\r\n'
+                    b'POST /three HTTP/1.1\r\nHost: h\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\n2\r\nde\r\n0\r\n\r\n')
+        self.assertEqual(b'POST /one?\nabc', client.response()[2])
+        self.assertEqual(b'GET /two?\n', client.response()[2])
+        self.assertEqual(b'POST /three?\nde', client.response()[2])
+
+    def test_chunked_body(self):
+        self._start()
+        client = self._client()
+        client.send(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\n'
+                    b'5\r\nhello\r\n')
+        client.send(b'6;name=value\r\n world\r\n')
+        client.send(b'0\r\n\r\n')
+        status, _headers, body = client.response()
+        self.assertEqual(200, status)
+        self.assertEqual(b'POST /?\nhello world', body)
+
+    def test_chunked_response(self):
+        self._start(streaming_app)
+        client = self._client()
+        client.send(b'GET / HTTP/1.1\r\nHost: h\r\n\r\n')
+        status, headers, body = client.response()
+        self.assertEqual('chunked', headers['transfer-encoding'])
+        self.assertEqual(b'onetwothree', body)
+        # The connection is still usable
+        client.send(b'GET / HTTP/1.1\r\nHost: h\r\n\r\n')
+        self.assertEqual(b'onetwothree', client.response()[2])
+
+    def _assert_rejected(self, request):
+        client = self._client()
+        client.send(request)
+        status, _headers, _body = client.response()
+        self.assertEqual(400, status)
+        self.assertTrue(client.closed())
+
+    def test_invalid_chunk_sizes(self):
+        self._start()
+        for size in (b'-1', b'+a', b'0x10', b' 5', b'5 ', b'', b'g'):
+            self._assert_rejected(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                                  b'Transfer-Encoding: chunked\r\n\r\n' +
+                                  size + b'\r\nhello\r\n0\r\n\r\n')
+
+    def test_invalid_chunk_size_after_start(self):
+        self._start()
+        client = self._client()
+        client.send(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\n')
+        client.send(b'-1\r\n')
+        self.assertEqual(400, client.response()[0])
+        self.assertTrue(client.closed())
+
+    def test_invalid_content_length(self):
+        self._start()
+        for length in (b'-1', b'+5', b'5, 5', b'0x5', b'five'):
+            self._assert_rejected(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                                  b'Content-Length: ' + length +
+                                  b'\r\n\r\nhello')
+
+    def test_duplicate_content_length(self):
+        self._start()
+        self._assert_rejected(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                              b'Content-Length: 5\r\nContent-Length: 6\r\n'
+                              b'\r\nhello!')
+
+    def test_length_and_chunked(self):
+        self._start()
+        self._assert_rejected(b'POST / HTTP/1.1\r\nHost: h\r\n'
+                              b'Content-Length: 5\r\n'
+                              b'Transfer-Encoding: chunked\r\n\r\n'
+                              b'0\r\n\r\n')
+
+    def test_malformed_request_line(self):
+        self._start()
+        self._assert_rejected(b'GET /\r\nHost: h\r\n\r\n')
+
+    def test_unsupported_version(self):
+        self._start()
+        client = self._client()
+        client.send(b'GET / HTTP/2.0\r\nHost: h\r\n\r\n')
+        self.assertEqual(505, client.response()[0])
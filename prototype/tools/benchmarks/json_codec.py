@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare jsonutils against the JSON codecs in prototype.common.jsoncodec.
+
+Payloads mimic a services collection response with 1 to 10000 items.
+
+    python tools/benchmarks/json_codec.py [repeat]
+"""
+
+from __future__ import print_function
+
+import datetime
+import sys
+import timeit
+
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+
+from prototype.common import jsoncodec
+
+
+SIZES = (1, 100, 1000, 10000)
+
+
+def make_payload(size):
+    now = datetime.datetime(2015, 1, 1, 12, 0, 0).isoformat()
+    services = []
+    for i in range(size):
+        services.append({
+            'id': i,
+            'host': u'compute-%05d.example.org' % i,
+            'type': u'rpc',
+            'topic': u'worker',
+            'disabled': bool(i % 7 == 0),
+            'created_at': now,
+            'updated_at': now,
+            'deleted_at': None,
+            'deleted': 0,
+            'links': [
+                {'rel': 'self',
+                 'href': u'http://api.example.org:8787/v1/services/%d' % i},
+                {'rel': 'bookmark',
+                 'href': u'http://api.example.org:8787/services/%d' % i},
+            ],
+        })
+    return {'services': services}
+
+
+def available_codecs():
+    codecs = [('jsonutils', jsonutils.dumps, jsonutils.loads)]
+    for compact in (False, True):
+        for backend in jsoncodec._BACKENDS:
+            if importutils.try_import(backend) is None:
+                continue
+            if not compact and backend not in jsoncodec._COMPATIBLE_BACKENDS:
+                continue
+            codec = jsoncodec.JSONCodec(backend, compact=compact)
+            name = backend + (' (compact)' if compact else '')
+            codecs.append((name, codec.dumps, codec.loads))
+    return codecs
+
+
+def bench(func, arg, size, repeat):
+    number = max(1, 2000 // size)
+    best = min(timeit.repeat(lambda: func(arg), number=number,
+                             repeat=repeat))
+    return best / number
+
+
+def main(argv):
+    repeat = int(argv[1]) if len(argv) > 1 else 5
+    codecs = available_codecs()
+    expected = {}
+    print('%-22s %7s %12s %12s %10s' % ('codec', 'items', 'dumps (us)',
+                                        'loads (us)', 'bytes'))
+    for size in SIZES:
+        payload = make_payload(size)
+        expected[size] = jsonutils.dumps(payload)
+        for name, dumps, loads in codecs:
+            body = dumps(payload)
+            if 'compact' not in name:
+                assert body == expected[size], '%s output differs' % name
+            encode = bench(dumps, payload, size, repeat) * 1e6
+            decode = bench(loads, body, size, repeat) * 1e6
+            print('%-22s %7d %12.1f %12.1f %10d' % (name, size, encode,
+                                                    decode, len(body)))
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
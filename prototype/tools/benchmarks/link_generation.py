@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure link generation for a list of services.
+
+Builds the views of a page of services with the services ViewBuilder and
+prints the time per page, once with the collection URLs cached for the
+request and once with them worked out again for every item, which is
+what link generation cost before.  Each is run with and without
+osapi_compute_link_prefix set.
+
+    python tools/benchmarks/link_generation.py [items] [rounds]
+
+The default is a 1000 item page.
+"""
+
+from __future__ import print_function
+
+import datetime
+import sys
+import time
+
+PREFIXES = (None, 'https://api.example.com/compute')
+
+
+class FakeContext(object):
+    project_id = 'b8e4e2f9e0b24f3e8a1c6d3a5f2e7c90'
+
+
+def page(items):
+    now = datetime.datetime(2015, 1, 1)
+    return [{'id': i, 'host': 'host-%d' % i, 'type': 'worker',
+             'topic': 'worker', 'disabled': False,
+             'created_at': now, 'updated_at': None}
+            for i in range(1, items + 1)]
+
+
+def timed(builder, environ, services, rounds, cached):
+    import webob
+
+    best = None
+    for _round in range(rounds):
+        request = webob.Request(dict(environ))
+        start = time.time()
+        for service in services:
+            if not cached:
+                request.environ.pop('prototype.link_bases', None)
+            builder.basic(request, service)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    from oslo_config import cfg
+    import webob
+
+    from prototype.api.v1 import services as services_api
+
+    items = int(argv[1]) if len(argv) > 1 else 1000
+    rounds = int(argv[2]) if len(argv) > 2 else 20
+    cfg.CONF([], project='prototype')
+
+    context = FakeContext()
+    environ = webob.Request.blank(
+        '/%s/services' % context.project_id,
+        base_url='http://localhost:8080/v1').environ
+    environ['prototype.context'] = context
+    builder = services_api.ViewBuilder()
+    services = page(items)
+
+    print('%-34s %12s %12s' % ('link prefix', 'cached (ms)', 'per item (ms)'))
+    for prefix in PREFIXES:
+        cfg.CONF.set_override('osapi_compute_link_prefix', prefix)
+        print('%-34s %12.2f %12.2f' % (
+            prefix or '-',
+            timed(builder, environ, services, rounds, True) * 1e3,
+            timed(builder, environ, services, rounds, False) * 1e3))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the per-layer cost of the middleware chain, collapsed or not.
+
+Stacks growing numbers of pass-through wsgi.Middleware layers over an
+empty wsgify app, with and without a SharedRequest head, and prints the
+time per request and the cost of each extra layer.  Given a paste config
+it then times the API pipelines themselves with api_collapse_pipeline
+off and on.
+
+    python tools/benchmarks/middleware_chain.py [api-paste.ini] [requests]
+
+Everything runs in-process, so the figures leave out the server.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+LAYERS = (0, 2, 4, 8)
+PATHS = ('/', '/v1/', '/v1/debug')
+
+
+def timed(app, path, requests):
+    import webob
+
+    environ = webob.Request.blank(path, headers={
+        'Accept': 'application/json', 'X-Auth-Token': 'u:p'}).environ
+    best = None
+    for _round in range(3):
+        start = time.time()
+        for _i in range(requests):
+            webob.Request(dict(environ)).get_response(app)
+        elapsed = (time.time() - start) / requests
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def synthetic(requests):
+    from prototype.common import wsgi
+
+    @wsgi.wsgify(RequestClass=wsgi.Request)
+    def endpoint(req):
+        return 'ok'
+
+    print('%-9s %11s %11s' % ('layers', 'plain (us)', 'shared (us)'))
+    results = {}
+    for layers in LAYERS:
+        app = endpoint
+        for _i in range(layers):
+            app = wsgi.Middleware(app)
+        results[layers] = (timed(app, '/', requests),
+                           timed(wsgi.SharedRequest(app), '/', requests))
+        print('%-9d %11.1f %11.1f' % (layers, results[layers][0] * 1e6,
+                                      results[layers][1] * 1e6))
+    last = LAYERS[-1]
+    print('%-9s %11.1f %11.1f' % (
+        'per layer',
+        (results[last][0] - results[0][0]) / last * 1e6,
+        (results[last][1] - results[0][1]) / last * 1e6))
+
+
+def pipelines(paste_config, requests):
+    from oslo_config import cfg
+
+    from prototype.api import root  # noqa, registers the pipeline opts
+    from prototype.common import wsgi
+
+    cfg.CONF([], project='prototype')
+    cfg.CONF.set_override('auth_strategy', 'noauth')
+
+    apps = {}
+    for collapse in (False, True):
+        cfg.CONF.set_override('api_collapse_pipeline', collapse)
+        apps[collapse] = wsgi.Loader(paste_config).load_app('api')
+    # Registered by the rate limiting filter
+    cfg.CONF.set_override('api_rate_limit', False)
+
+    print()
+    print('%-12s %11s %11s' % ('path', 'plain (us)', 'shared (us)'))
+    for path in PATHS:
+        print('%-12s %11.1f %11.1f' % (
+            path, timed(apps[False], path, requests) * 1e6,
+            timed(apps[True], path, requests) * 1e6))
+
+
+def main(argv):
+    requests = int(argv[2]) if len(argv) > 2 else 5000
+    synthetic(requests)
+    if len(argv) > 1:
+        pipelines(argv[1], requests)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare API worker start-up cost and memory with and without api_preload.
+
+Each mode runs in a fresh interpreter that loads the paste app, optionally
+warms and freezes it like prototype-api does with api_preload, then forks
+the workers.  Every worker serves some requests in-process and reports the
+latency of its first request and how much memory it no longer shares with
+the parent.
+
+    python tools/benchmarks/preload.py api-paste.ini [workers] [requests]
+
+Memory figures need /proc/self/smaps_rollup (Linux 4.14).
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+PATHS = ('/', '/v1/')
+
+
+def run_mode(paste_config, preload, workers, requests):
+    from oslo_config import cfg
+    import webob
+
+    from prototype.api import root  # noqa, registers auth_strategy
+    from prototype.common import service
+    from prototype.common import utils
+    from prototype.common import wsgi
+
+    cfg.CONF([], project='prototype')
+    cfg.CONF.set_override('auth_strategy', 'noauth')
+
+    start = time.time()
+    if preload:
+        service.preload()
+    app = wsgi.Loader(paste_config).load_app('api')
+    if preload:
+        wsgi.warm_app(app)
+        service.freeze()
+    load_time = time.time() - start
+
+    pipes = []
+    for _i in range(workers):
+        rfd, wfd = os.pipe()
+        if os.fork() == 0:
+            os.close(rfd)
+            first = None
+            for n in range(requests):
+                req = webob.Request.blank(PATHS[n % len(PATHS)])
+                begin = time.time()
+                req.get_response(app)
+                if first is None:
+                    first = time.time() - begin
+            result = {'first': first, 'memory': utils.memory_usage()}
+            os.write(wfd, json.dumps(result).encode('utf-8'))
+            os._exit(0)
+        os.close(wfd)
+        pipes.append(rfd)
+
+    results = []
+    for rfd in pipes:
+        data = b''
+        while True:
+            chunk = os.read(rfd, 65536)
+            if not chunk:
+                break
+            data += chunk
+        results.append(json.loads(data.decode('utf-8')))
+    for _i in range(workers):
+        os.wait()
+
+    def mean(values):
+        values = list(values)
+        return sum(values) / float(len(values)) if values else 0
+
+    print(json.dumps({
+        'load': load_time,
+        'first': mean(r['first'] for r in results),
+        'private': mean(r['memory'].get('private', 0) for r in results),
+        'pss': mean(r['memory'].get('pss', 0) for r in results),
+    }))
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == '--mode':
+        run_mode(argv[2], argv[3] == 'preload', int(argv[4]), int(argv[5]))
+        return
+
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    paste_config = os.path.abspath(argv[1])
+    workers = argv[2] if len(argv) > 2 else '4'
+    requests = argv[3] if len(argv) > 3 else '100'
+
+    print('%-8s %8s %10s %14s %14s' % ('mode', 'load (s)', 'first (ms)',
+                                       'private (KiB)', 'pss (KiB)'))
+    for mode in ('lazy', 'preload'):
+        out = subprocess.check_output([sys.executable, argv[0], '--mode',
+                                       paste_config, mode, workers,
+                                       requests])
+        stats = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        print('%-8s %8.3f %10.2f %14d %14d' % (mode, stats['load'],
+                                               stats['first'] * 1000,
+                                               stats['private'],
+                                               stats['pss']))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the eventlet and asyncio server engines under keep-alive load.
+
+Each engine serves the paste app from a single process, the asyncio one
+without monkey patching like prototype-api would run it.  Load generator
+processes then hold the given number of keep-alive connections open,
+each sending requests back to back, and the throughput and latency
+percentiles of every engine are printed.
+
+    python tools/benchmarks/server_engines.py api-paste.ini \\
+        [clients] [seconds] [path] [load processes]
+
+Defaults to 1000 clients for 30 seconds on /.  The asyncio engine needs
+trollius on Python 2.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ENGINES = ('eventlet', 'asyncio')
+
+
+def serve(engine, paste_config):
+    import prototype.cmd  # noqa, monkey patches for the eventlet engine
+
+    from oslo_config import cfg
+    import eventlet
+
+    from prototype.api import root  # noqa, registers auth_strategy
+    from prototype.common import wsgi
+
+    cfg.CONF([], project='prototype')
+    cfg.CONF.set_override('auth_strategy', 'noauth')
+    cfg.CONF.set_override('wsgi_server_engine', engine)
+    # Measure the engines, not the load shedding in front of them
+    cfg.CONF.set_override('wsgi_max_concurrent_requests', 0)
+    cfg.CONF.set_override('wsgi_max_queue_latency', 0)
+
+    app = wsgi.Loader(paste_config).load_app('api')
+    # Registered by the rate limiting filter
+    cfg.CONF.set_override('api_rate_limit', False)
+    server = wsgi.Server('api', app, host='127.0.0.1', port=0, backlog=4096)
+    server.start()
+    print(server.port)
+    sys.stdout.flush()
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    while not stopping:
+        eventlet.sleep(0.2)
+    server.stop()
+    server.wait()
+
+
+def _read_response(sock, buf):
+    """Read one response, return what was received past its end."""
+    while b'\r\n\r\n' not in buf:
+        data = sock.recv(65536)
+        if not data:
+            raise IOError('connection closed')
+        buf += data
+    head, buf = buf.split(b'\r\n\r\n', 1)
+    status = int(head.split(b' ', 2)[1])
+    length = None
+    chunked = False
+    for line in head.split(b'\r\n')[1:]:
+        name, _sep, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = b'chunked' in value.lower()
+    if chunked:
+        while b'0\r\n\r\n' not in buf:
+            data = sock.recv(65536)
+            if not data:
+                raise IOError('connection closed')
+            buf += data
+        return status, buf.split(b'0\r\n\r\n', 1)[1]
+    length = length or 0
+    while len(buf) < length:
+        data = sock.recv(65536)
+        if not data:
+            raise IOError('connection closed')
+        buf += data
+    return status, buf[length:]
+
+
+def load(port, clients, seconds, path):
+    import eventlet
+    from eventlet.green import socket
+
+    request = ('GET %s HTTP/1.1\r\nHost: 127.0.0.1:%d\r\n'
+               'Accept: application/json\r\n\r\n' % (path, port))
+    request = request.encode('latin-1')
+    latencies = []
+    errors = []
+
+    def client(deadline):
+        try:
+            sock = socket.create_connection(('127.0.0.1', port))
+        except IOError as e:
+            errors.append(str(e))
+            return
+        buf = b''
+        while time.time() < deadline:
+            begin = time.time()
+            try:
+                sock.sendall(request)
+                status, buf = _read_response(sock, buf)
+            except IOError as e:
+                errors.append(str(e))
+                break
+            if status >= 500:
+                errors.append(str(status))
+            latencies.append(time.time() - begin)
+        sock.close()
+
+    pool = eventlet.GreenPool(clients)
+    deadline = time.time() + seconds
+    for _i in range(clients):
+        pool.spawn(client, deadline)
+    pool.waitall()
+    print(json.dumps({'latencies': latencies, 'errors': len(errors)}))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_engine(engine, paste_config, clients, seconds, path, procs):
+    env = dict(os.environ)
+    env['PROTOTYPE_EVENTLET_MONKEY_PATCH'] = (
+        '0' if engine == 'asyncio' else '1')
+    server = subprocess.Popen([sys.executable, sys.argv[0], '--serve',
+                               engine, paste_config],
+                              stdout=subprocess.PIPE, env=env)
+    try:
+        port = int(server.stdout.readline())
+        per_proc = [clients // procs + (1 if i < clients % procs else 0)
+                    for i in range(procs)]
+        start = time.time()
+        loaders = [subprocess.Popen([sys.executable, sys.argv[0], '--load',
+                                     str(port), str(count), str(seconds),
+                                     path], stdout=subprocess.PIPE)
+                   for count in per_proc if count]
+        latencies = []
+        errors = 0
+        for loader in loaders:
+            out, _err = loader.communicate()
+            result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+            latencies.extend(result['latencies'])
+            errors += result['errors']
+        elapsed = time.time() - start
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    latencies.sort()
+    return {'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'p999': percentile(latencies, 0.999),
+            'max': latencies[-1] if latencies else 0}
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == '--serve':
+        serve(argv[2], argv[3])
+        return
+    if len(argv) > 1 and argv[1] == '--load':
+        load(int(argv[2]), int(argv[3]), float(argv[4]), argv[5])
+        return
+
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    paste_config = os.path.abspath(argv[1])
+    clients = int(argv[2]) if len(argv) > 2 else 1000
+    seconds = float(argv[3]) if len(argv) > 3 else 30
+    path = argv[4] if len(argv) > 4 else '/'
+    procs = int(argv[5]) if len(argv) > 5 else 4
+
+    print('%d keep-alive clients on %s for %ds' % (clients, path, seconds))
+    print('%-9s %9s %7s %9s %9s %9s %10s %9s' % (
+        'engine', 'requests', 'errors', 'req/s', 'p50 (ms)', 'p99 (ms)',
+        'p99.9 (ms)', 'max (ms)'))
+    for engine in ENGINES:
+        stats = run_engine(engine, paste_config, clients, seconds, path,
+                           procs)
+        print('%-9s %9d %7d %9.1f %9.2f %9.2f %10.2f %9.2f' % (
+            engine, stats['requests'], stats['errors'], stats['rps'],
+            stats['p50'] * 1000, stats['p99'] * 1000, stats['p999'] * 1000,
+            stats['max'] * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
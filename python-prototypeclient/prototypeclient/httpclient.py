@@ -0,0 +1,40 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The HTTP client of prototypeclient.
+
+openstack.common.apiclient is synced from oslo-incubator, so what this
+client adds to its HTTPClient lives here.
+"""
+
+from prototypeclient.openstack.common.apiclient import client
+
+from prototypeclient import jsoncodec
+
+
+class HTTPClient(client.HTTPClient):
+    """HTTPClient encoding request bodies with a pluggable JSON codec.
+
+    :param json_codec: anything with a dumps() method, by default
+                       jsoncodec.get_codec()
+    """
+
+    def __init__(self, auth_plugin, *args, **kwargs):
+        self.json_codec = (kwargs.pop('json_codec', None) or
+                           jsoncodec.get_codec())
+        super(HTTPClient, self).__init__(auth_plugin, *args, **kwargs)
+
+    def serialize(self, kwargs):
+        if kwargs.get('json') is not None:
+            kwargs['headers']['Content-Type'] = 'application/json'
+            kwargs['data'] = self.json_codec.dumps(kwargs.pop('json'))
+        super(HTTPClient, self).serialize(kwargs)
@@ -0,0 +1,97 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Pluggable JSON encoding for request bodies.
+
+By default request bodies are encoded exactly as before (simplejson when
+it is installed, the stdlib json module otherwise).  Passing
+``compact=True`` drops the whitespace after separators.
+
+ujson is only used when asked for by name, never by "auto": it encodes
+datetimes as epoch integers and objects with a __dict__ as that dict,
+where the other backends fail, and rounds floats differently.  The
+server's codec makes the same choice.
+"""
+
+from oslo_utils import importutils
+
+_BACKENDS = ('ujson', 'simplejson', 'json')
+# Backends encoding alike, in order of preference
+_COMPATIBLE_BACKENDS = ('simplejson', 'json')
+
+_STANDARD_SEPARATORS = (', ', ': ')
+_COMPACT_SEPARATORS = (',', ':')
+
+_CODECS = {}
+
+
+class JSONCodec(object):
+    """Encode and decode JSON with a single backend implementation."""
+
+    def __init__(self, backend='json', compact=False):
+        if backend not in _BACKENDS:
+            raise ValueError("Unknown JSON codec: %s" % backend)
+        if not compact and backend not in _COMPATIBLE_BACKENDS:
+            raise ValueError("JSON codec %s requires compact output"
+                             % backend)
+
+        self.name = backend
+        self.compact = compact
+        self._module = importutils.import_module(backend)
+
+        if backend == 'ujson':
+            self._encode = self._ujson_encode
+            self._decode = self._module.loads
+        else:
+            separators = (_COMPACT_SEPARATORS if compact
+                          else _STANDARD_SEPARATORS)
+            self._encode = self._module.JSONEncoder(
+                separators=separators).encode
+            self._decode = self._module.JSONDecoder().decode
+
+    def _ujson_encode(self, obj):
+        return self._module.dumps(obj, ensure_ascii=True,
+                                  escape_forward_slashes=False)
+
+    def dumps(self, obj):
+        """Serialize ``obj`` to a JSON formatted ``str``."""
+        return self._encode(obj)
+
+    def loads(self, datastring):
+        """Deserialize a JSON document.
+
+        :raises: ValueError if ``datastring`` isn't valid JSON
+        """
+        return self._decode(datastring)
+
+
+def get_codec(backend='auto', compact=False):
+    """Return a shared codec for ``backend``.
+
+    :param backend: one of auto, json, simplejson or ujson. "auto" picks
+                    simplejson when it is installed, json otherwise.
+    :param compact: omit whitespace after separators
+    """
+    key = (backend, compact)
+    try:
+        return _CODECS[key]
+    except KeyError:
+        pass
+
+    name = backend
+    if name == 'auto':
+        for name in _COMPATIBLE_BACKENDS:
+            if importutils.try_import(name) is not None:
+                break
+
+    codec = _CODECS[key] = JSONCodec(name, compact=compact)
+    return codec
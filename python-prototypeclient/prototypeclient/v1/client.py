@@ -1,9 +1,14 @@
+import six
+
 from prototypeclient.openstack.common.apiclient import client
 from prototypeclient.openstack.common.apiclient import auth
 from prototypeclient.openstack.common.apiclient import exceptions
 
 from keystoneclient.v2_0 import client as keystoneclient
 
+from prototypeclient import httpclient
+from prototypeclient import jsoncodec
+
 from prototypeclient.v1.sample import SampleManager
 
 
@@ -70,12 +75,18 @@ class Client(object):
         tenant_name = kwargs.pop('tenant_name', None)
         auth_url = kwargs.pop('auth_url', None)
         auth_system = kwargs.pop('auth_system', None)
+        json_codec = kwargs.pop('json_codec', 'auto')
+        json_compact = kwargs.pop('json_compact', False)
+        if isinstance(json_codec, six.string_types):
+            json_codec = jsoncodec.get_codec(json_codec, compact=json_compact)
+        kwargs['json_codec'] = json_codec
         
         auth_plugin = KeystoneAuthPlugin(token=token,
             username=username,password=password,tenant_name=tenant_name,
             auth_url=auth_url,auth_system=auth_system,endpoint=endpoint)
        
-        self.http_client = client.HTTPClient(auth_plugin, *args, **kwargs)
+        self.http_client = httpclient.HTTPClient(auth_plugin, *args,
+                                                 **kwargs)
         self.client = client.BaseClient(self.http_client)
         
         